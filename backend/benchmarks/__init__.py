@@ -0,0 +1,5 @@
+"""
+Load and regression benchmarks for the API.
+
+Run from the backend directory with ``python -m benchmarks.run``; see run.py.
+"""
@@ -0,0 +1,219 @@
+"""
+Deterministic stand-in for the OpenAI chat completions API.
+
+Serves ``POST /v1/chat/completions`` (and its counters on ``GET /stats``)
+over plain HTTP/1.1 on localhost, in a background thread, so the app's pooled
+AsyncOpenAI client talks to it exactly as it would to the real API. Replies are JSON-mode content derived from a hash
+of the dish name and style, latency and injected errors come from a seeded
+RNG, and token usage is estimated at about four characters per token.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+WORDS = (
+    "crispy", "golden", "tender", "smoky", "zesty", "buttery", "charred", "silky",
+    "herb-crusted", "slow-roasted", "tangy", "velvety", "hand-pulled", "fire-grilled",
+)
+PAIRINGS = ("truffle fries", "a citrus spritz", "garlic knots", "a chocolate torte", "a house salad", "iced tea")
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, close enough to compare prompt layouts"""
+    return max(1, round(len(text) / 4))
+
+def prompt_tokens(messages: List[dict]) -> int:
+    # Each chat message also carries a few tokens of role/framing overhead
+    return sum(estimate_tokens(message.get("content") or "") + 4 for message in messages)
+
+def _pick(seed: str, options: Tuple[str, ...], count: int) -> List[str]:
+    digest = hashlib.blake2b(seed.encode("utf-8"), digest_size=16).digest()
+    return [options[digest[i] % len(options)] for i in range(count)]
+
+def fake_item(name: str, style: str) -> Dict[str, str]:
+    """The same description and upsell every time for a name and style"""
+    words = _pick(f"{name}|{style}", WORDS, 4)
+    pairing = _pick(f"{style}|{name}", PAIRINGS, 1)[0]
+    return {
+        "description": f"{words[0].capitalize()}, {words[1]} {name} with {words[2]} notes and a {words[3]} finish.",
+        "upsell": f"Pair your {name} with {pairing}!",
+    }
+
+def fake_reply(messages: List[dict]) -> str:
+    """JSON-mode reply for the prompt layouts in utils.prompts"""
+    system = messages[0].get("content", "") if messages else ""
+    user = messages[-1].get("content", "") if messages else ""
+    styles = re.findall(r'^- "([^"]+)": (.+)$', system, re.MULTILINE)
+    if styles:
+        name = user.split(":", 1)[1].strip()
+        return json.dumps({"styles": {key: fake_item(name, style) for key, style in styles}})
+    style_match = re.search(r"Style: ([^.\n]+)", system)
+    style = style_match.group(1) if style_match else "default"
+    if user.startswith("Items:"):
+        names = [line[2:].strip() for line in user.splitlines()[1:] if line.startswith("- ")]
+        return json.dumps({"items": [{"name": name, **fake_item(name, style)} for name in names]})
+    name = user.split(":", 1)[1].strip() if ":" in user else user.strip()
+    return json.dumps(fake_item(name, style))
+
+class FakeOpenAIServer:
+    """
+    Fake chat completions endpoint with configurable latency and error rate.
+
+    ``latency`` is the mean upstream time in seconds, spread by ``jitter``
+    (a fraction of it); ``error_rate`` of requests get a 500 (or a 429, one in
+    four). Streamed replies send their first chunk after ``first_token_fraction``
+    of that time and spread the rest over the remaining chunks, as a model
+    generating tokens would. Counters cover every request received, so callers
+    can diff them around a run.
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.2, error_rate: float = 0.0, seed: int = 0,
+                 first_token_fraction: float = 0.2):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.first_token_fraction = first_token_fraction
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.port: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def counters(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+            }
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._serve, name="fake-openai", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def _serve(self):
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", 0))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            self._loop.close()
+
+    def _draw(self) -> Tuple[float, Optional[int]]:
+        """Latency and injected error status for the next request"""
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency * (1 + self._random.uniform(-self.jitter, self.jitter)))
+            status = None
+            if self._random.random() < self.error_rate:
+                self.errors += 1
+                status = 429 if self._random.random() < 0.25 else 500
+        return delay, status
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        key, value = line.split(":", 1)
+                        headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                if lines[0].startswith("GET /stats"):
+                    payload = json.dumps(self.counters()).encode()
+                    writer.write(
+                        f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode()
+                        + payload
+                    )
+                    await writer.drain()
+                else:
+                    await self._respond(json.loads(body or b"{}"), writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, request: dict, writer: asyncio.StreamWriter):
+        delay, status = self._draw()
+        streamed = bool(request.get("stream")) and status is None
+        await asyncio.sleep(delay * self.first_token_fraction if streamed else delay)
+        if status is not None:
+            payload = json.dumps({"error": {"message": "injected failure", "type": "server_error"}}).encode()
+            reason = "Too Many Requests" if status == 429 else "Internal Server Error"
+            writer.write(
+                f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+            return
+
+        messages = request.get("messages", [])
+        content = fake_reply(messages)
+        usage = {"prompt_tokens": prompt_tokens(messages), "completion_tokens": estimate_tokens(content)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        with self._lock:
+            self.prompt_tokens += usage["prompt_tokens"]
+            self.completion_tokens += usage["completion_tokens"]
+        base = {"id": f"chatcmpl-{self.requests}", "created": int(time.time()), "model": request.get("model", "")}
+
+        if not request.get("stream"):
+            payload = json.dumps({
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            }).encode()
+            writer.write(
+                f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode()
+                + payload
+            )
+            await writer.drain()
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        chunks = [
+            {**base, "object": "chat.completion.chunk",
+             "choices": [{"index": 0, "delta": {"content": content[i:i + 16]}, "finish_reason": None}]}
+            for i in range(0, len(content), 16)
+        ]
+        if (request.get("stream_options") or {}).get("include_usage"):
+            chunks.append({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        gap = delay * (1 - self.first_token_fraction) / max(1, len(chunks) - 1)
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(gap)
+            event = f"data: {json.dumps(chunk)}\n\n".encode()
+            writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+            await writer.drain()
+        done = b"data: [DONE]\n\n"
+        writer.write(f"{len(done):x}\r\n".encode() + done + b"\r\n0\r\n\r\n")
+        await writer.drain()
@@ -0,0 +1,419 @@
+"""
+End-to-end load scenarios against the fake OpenAI server.
+
+Each run starts the FastAPI app in-process, in a freshly spawned worker
+process with its own data directory (the app reads its configuration and
+opens its stores at import time), and drives it through httpx's ASGI
+transport. A scenario has an untimed priming phase and a timed phase; only
+the timed phase is reported.
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import sqlite3
+import sys
+import time
+from collections import Counter
+from contextlib import closing
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS = ("gpt-3.5-turbo", "gpt-4.1-mini")
+
+# (path, JSON body, streamed); a list of requests is sent in order and timed as one
+Request = Tuple[str, dict, bool]
+Job = Union[Request, List[Request]]
+
+SCENARIOS = (
+    "cold", "warm", "zipf", "regenerate_storm", "batch", "stream", "style_toggle", "style_toggle_multi", "hits_under_misses"
+)
+
+# Dishes kept cached for hits_under_misses
+HOT_DISHES = 50
+
+# Cached dishes (each with one history record) for the startup benchmark, before --scale
+STARTUP_SIZES = (10_000, 100_000, 1_000_000)
+
+def dish_name(rank: int) -> str:
+    # Hashed rather than numbered, so the fuzzy name matcher never merges two dishes
+    return f"Dish {hashlib.blake2b(str(rank).encode(), digest_size=4).hexdigest()}"
+
+def zipf_names(catalogue: int, count: int, s: float, rng: random.Random) -> List[str]:
+    """``count`` dish names drawn from a catalogue with Zipf(s) popularity"""
+    cumulative, total = [], 0.0
+    for rank in range(1, catalogue + 1):
+        total += 1 / rank ** s
+        cumulative.append(total)
+    return [dish_name(rank) for rank in rng.choices(range(catalogue), cum_weights=cumulative, k=count)]
+
+def generate(name: str, model: str) -> Request:
+    return "/api/v1/generate-description", {"name": name, "model": model}, False
+
+def plan(scenario: str, options: dict) -> Tuple[List[Job], List[Job]]:
+    """(priming requests, timed requests) for a scenario"""
+    rng = random.Random(options["seed"])
+    count = options["requests"]
+    if scenario in ("cold", "warm"):
+        timed = [generate(dish_name(i), MODELS[i % 2]) for i in range(count)]
+        if scenario == "cold":
+            return [], timed
+        prime = list(timed)
+        rng.shuffle(timed)
+        return prime, timed
+    names = zipf_names(options["catalogue"], count, options["zipf_s"], rng)
+    models = [rng.choice(MODELS) for _ in names]
+    if scenario == "zipf":
+        return [], [generate(name, model) for name, model in zip(names, models)]
+    if scenario == "stream":
+        return [], [
+            ("/api/v1/generate-description/stream", {"name": name, "model": model}, True)
+            for name, model in zip(names, models)
+        ]
+    if scenario == "batch":
+        size = options["batch_size"]
+        return [], [
+            ("/api/v1/generate-descriptions/batch", {"items": [
+                {"name": name, "model": model} for name, model in zip(names[i:i + size], models[i:i + size])
+            ]}, False)
+            for i in range(0, count, size)
+        ]
+    if scenario in ("style_toggle", "style_toggle_multi"):
+        # A diner opens a dish and flips to the other style; timed per dish. The
+        # _multi variant runs with OPENAI_MULTI_STYLE so the flip should be a cache hit
+        return [], [
+            [generate(dish_name(i), model), generate(dish_name(i), next(other for other in MODELS if other != model))]
+            for i, model in enumerate(rng.choice(MODELS) for _ in range(count))
+        ]
+    if scenario == "hits_under_misses":
+        # Cache hits on primed dishes, timed alone and then with miss_load running
+        hot = [generate(dish_name(i), model) for i in range(HOT_DISHES) for model in MODELS]
+        return hot, [rng.choice(hot) for _ in range(count)]
+    if scenario == "regenerate_storm":
+        # Many clients hammering "regenerate" on a handful of popular dishes
+        hot = [dish_name(i) for i in range(10)]
+        prime = [generate(name, model) for name in hot for model in MODELS]
+        timed = [
+            ("/api/v1/regenerate-description", {"name": rng.choice(hot), "model": rng.choice(MODELS)}, False)
+            for _ in range(count)
+        ]
+        return prime, timed
+    raise ValueError(f"Unknown scenario: {scenario}. Allowed values: {list(SCENARIOS)}")
+
+def app_env(data_dir: str, base_url: str, backend: str, multi_style: bool = False,
+            rate_limit: Optional[Tuple[float, float]] = None) -> Dict[str, str]:
+    """
+    Settings for the app under test: fake upstream, isolated stores, and no
+    rate limiting unless ``rate_limit`` gives (burst, tokens per minute)
+    """
+    burst, per_minute = rate_limit or (1e12, 1e12)
+    return {
+        "OPENAI_MULTI_STYLE": "true" if multi_style else "false",
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": base_url,
+        "FOOD_ITEMS_BACKEND": backend,
+        "FOOD_ITEMS_DB": os.path.join(data_dir, "food_items.db"),
+        "USAGE_FILE": os.path.join(data_dir, "usage_stats.json"),
+        "RATE_LIMIT_BURST": str(burst),
+        "RATE_LIMIT_TOKENS_PER_MINUTE": str(per_minute),
+    }
+
+def dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def summarize(latencies: List[float], errors: int, duration: float) -> Dict[str, float]:
+    """Throughput and latency metrics for a timed phase"""
+    requests = len(latencies)
+    return {
+        "throughput_rps": round(requests / duration, 2) if duration else 0.0,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "error_rate": round(errors / requests, 4) if requests else 0.0,
+    }
+
+async def post_streamed(app, path: str, body: dict) -> Tuple[int, Optional[float]]:
+    """
+    POST to the ASGI app and read the response as it is sent; returns (status,
+    seconds until the first body chunk). httpx's ASGITransport only returns
+    once the whole body has been sent, so it cannot show time to first byte.
+    """
+    payload = json.dumps(body).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"benchmark"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode())],
+        "client": ("127.0.0.1", 0), "server": ("benchmark", 80),
+    }
+    received = False
+    status = 500
+    first_byte = None
+    start = time.perf_counter()
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        # The client never disconnects; the app cancels this wait once the response is done
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status, first_byte
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body") and first_byte is None:
+            first_byte = time.perf_counter() - start
+
+    await app(scope, receive, send)
+    return status, first_byte
+
+async def run_load(client, requests: Iterable[Job], concurrency: int,
+                   app=None) -> Tuple[List[float], int, List[float], List[Job]]:
+    """
+    Send requests from ``concurrency`` concurrent clients; returns (latencies,
+    failed requests, time to first byte of each job's first streamed response,
+    jobs rejected by the rate limiter). Rejected jobs are neither timed nor
+    counted as failures. Streamed requests go straight to ``app``.
+    """
+    latencies: List[float] = []
+    first_bytes: List[float] = []
+    rejected: List[Job] = []
+    errors = 0
+    pending = iter(requests)
+
+    async def client_loop():
+        nonlocal errors
+        for job in pending:
+            start = time.perf_counter()
+            failed = limited = False
+            first_byte = None
+            for path, body, streamed in (job if isinstance(job, list) else [job]):
+                try:
+                    if streamed:
+                        sent_at = time.perf_counter()
+                        status, streamed_first_byte = await post_streamed(app, path, body)
+                        if first_byte is None and streamed_first_byte is not None:
+                            first_byte = sent_at - start + streamed_first_byte
+                    else:
+                        status = (await client.post(path, json=body)).status_code
+                    limited = limited or status == 429
+                    failed = failed or (status >= 400 and status != 429)
+                except Exception:
+                    failed = True
+            if limited:
+                rejected.append(job)
+                continue
+            latencies.append(time.perf_counter() - start)
+            if first_byte is not None:
+                first_bytes.append(first_byte)
+            errors += failed
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return latencies, errors, first_bytes, rejected
+
+def miss_load(stop: asyncio.Event) -> Iterator[Request]:
+    """Requests for dishes nobody has asked for yet, until ``stop`` is set"""
+    for i in itertools.count(HOT_DISHES):
+        if stop.is_set():
+            return
+        yield generate(dish_name(i), MODELS[i % 2])
+
+def served_keys(requests: List[Job], rejected: List[Job]) -> List[Tuple[str, str]]:
+    """Distinct (name, model) pairs of the single-dish requests the rate limiter let through"""
+    def keys(jobs: List[Job]) -> Counter:
+        return Counter(
+            (body["name"], body["model"])
+            for job in jobs for _, body, _ in (job if isinstance(job, list) else [job]) if "name" in body
+        )
+    return list(keys(requests) - keys(rejected))
+
+def run_scenario(config: dict) -> dict:
+    """Worker process entry point: run one scenario against a fresh app and report raw results"""
+    os.chdir(config["data_dir"])
+    os.environ.update(app_env(
+        config["data_dir"], config["base_url"], config["backend"],
+        multi_style=config["scenario"] == "style_toggle_multi", rate_limit=config.get("rate_limit")
+    ))
+    sys.path.insert(0, BACKEND_DIR)
+    import httpx
+    from main import app
+    from routes.generate import food_manager
+    # Per-request logging from the app and httpx would dominate the measurement; injected
+    # upstream errors are logged per request too, and failures show up in error_rate
+    logging.disable(logging.ERROR)
+
+    prime, timed = plan(config["scenario"], config)
+
+    async def upstream_counters(client) -> Dict[str, int]:
+        return (await client.get(config["base_url"].rsplit("/v1", 1)[0] + "/stats")).json()
+
+    async def drive() -> dict:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120) as client, \
+                    httpx.AsyncClient(timeout=10) as stats_client:
+                await run_load(client, prime, config["concurrency"], app)
+                await asyncio.to_thread(food_manager.flush)
+                concurrent = {}
+                if config["scenario"] == "hits_under_misses":
+                    # The same hits with nothing else going on, for comparison
+                    concurrent["idle_latencies"] = (await run_load(client, timed, config["concurrency"], app))[0]
+                    stop = asyncio.Event()
+                    misses = asyncio.create_task(run_load(client, miss_load(stop), config["concurrency"], app))
+                disk_before = dir_bytes(config["data_dir"])
+                upstream_before = await upstream_counters(stats_client)
+                started = time.time()
+                start = time.perf_counter()
+                latencies, errors, first_bytes, rejected = await run_load(client, timed, config["concurrency"], app)
+                duration = time.perf_counter() - start
+                finished = time.time()
+                upstream_after = await upstream_counters(stats_client)
+                if config["scenario"] == "hits_under_misses":
+                    stop.set()
+                    concurrent["miss_latencies"] = (await misses)[0]
+        # Leaving the lifespan flushes and closes the stores
+        return {
+            **concurrent,
+            "latencies": latencies,
+            "first_bytes": first_bytes,
+            "errors": errors,
+            "rate_limited": len(rejected),
+            "served_keys": served_keys(timed, rejected),
+            "duration": duration,
+            # Wall-clock bounds, to line up the timed phases of several workers
+            "started": started,
+            "finished": finished,
+            "disk_bytes": dir_bytes(config["data_dir"]) - disk_before,
+            "upstream": {key: upstream_after[key] - upstream_before[key] for key in upstream_after},
+            "rss_mb": peak_rss_mb(),
+        }
+
+    return asyncio.run(drive())
+
+def scenario_result(runs: List[dict], duration: Optional[float] = None, disk_bytes: Optional[int] = None,
+                    upstream: Optional[Dict[str, int]] = None) -> dict:
+    """
+    Merge worker runs into one result. Multi-worker runs pass the wall-clock
+    duration, disk growth and upstream counters measured around all workers,
+    since each worker only sees its own share.
+    """
+    latencies = [latency for run in runs for latency in run["latencies"]]
+    errors = sum(run["errors"] for run in runs)
+    duration = duration if duration is not None else max(run["duration"] for run in runs)
+    disk_bytes = disk_bytes if disk_bytes is not None else sum(run["disk_bytes"] for run in runs)
+    upstream = upstream if upstream is not None else runs[0]["upstream"]
+    requests = len(latencies)
+    metrics = summarize(latencies, errors, duration)
+    first_bytes = [first_byte for run in runs for first_byte in run["first_bytes"]]
+    if first_bytes:
+        metrics["ttfb_p50_ms"] = round(percentile(first_bytes, 0.5) * 1000, 3)
+        metrics["ttfb_p99_ms"] = round(percentile(first_bytes, 0.99) * 1000, 3)
+    # hits_under_misses: the timed hits ran alongside these misses, and also alone
+    for prefix in ("idle", "miss"):
+        values = [latency for run in runs for latency in run.get(f"{prefix}_latencies", [])]
+        if values:
+            metrics[f"{prefix}_p50_ms"] = round(percentile(values, 0.5) * 1000, 3)
+            metrics[f"{prefix}_p99_ms"] = round(percentile(values, 0.99) * 1000, 3)
+    metrics.update({
+        "rss_mb": round(max(run["rss_mb"] for run in runs), 1),
+        "disk_bytes_per_request": round(disk_bytes / requests, 1) if requests else 0.0,
+        "upstream_calls_per_request": round(upstream["requests"] / requests, 4) if requests else 0.0,
+        "upstream_prompt_tokens_per_request": round(upstream["prompt_tokens"] / requests, 1) if requests else 0.0,
+    })
+    return {
+        "metrics": metrics,
+        "info": {
+            "requests": requests,
+            "errors": errors,
+            "rate_limited": sum(run["rate_limited"] for run in runs),
+            "duration_seconds": round(duration, 3),
+            "workers": len(runs),
+        },
+    }
+
+def cross_worker_hit_ratio(runs: List[dict], db_path: str) -> float:
+    """
+    Share of cross-worker repeats that workers sharing ``db_path`` served from
+    cache. A repeat is a request for a dish that another worker also served;
+    separate caches would miss on every one (misses = the sum of each worker's
+    distinct dishes), a perfectly shared one on none (misses = distinct dishes
+    overall). The misses are the cache's shared counters.
+    """
+    own = sum(len(run["served_keys"]) for run in runs)
+    overall = len({tuple(key) for run in runs for key in run["served_keys"]})
+    if own == overall:
+        return 1.0
+    with closing(sqlite3.connect(db_path)) as conn:
+        misses = dict(conn.execute("SELECT name, value FROM counters").fetchall()).get("misses", 0)
+    return round(min(1.0, max(0.0, (own - misses) / (own - overall))), 4)
+
+def prepare_startup(config: dict) -> dict:
+    """Worker process entry point: store ``config["items"]`` generations, as the app would, and close the stores"""
+    os.chdir(config["data_dir"])
+    os.environ.update(app_env(config["data_dir"], config["base_url"], "json"))
+    sys.path.insert(0, BACKEND_DIR)
+    from models.food_item_manager import FoodItemManager
+    from schemas.food_item import FoodItemRequest
+    count = config["items"]
+    manager = FoodItemManager()
+    for offset in range(0, count, 5000):
+        manager.store_generated_descriptions([
+            (FoodItemRequest(name=dish_name(i), model=MODELS[i % 2]),
+             f"Crispy, golden dish {i} with smoky notes and a buttery finish.", "Pair it with truffle fries!")
+            for i in range(offset, min(count, offset + 5000))
+        ])
+    manager.flush()
+    manager.close()
+    return {"disk_bytes": dir_bytes(config["data_dir"])}
+
+def run_startup(config: dict) -> dict:
+    """
+    Worker process entry point: open the app on the stores prepare_startup
+    left and serve one cached dish. Library imports are done first and not
+    timed, since they do not depend on the data size.
+    """
+    os.chdir(config["data_dir"])
+    os.environ.update(app_env(config["data_dir"], config["base_url"], "json"))
+    sys.path.insert(0, BACKEND_DIR)
+    import fastapi, httpx, openai, pydantic  # noqa: E401,F401
+    logging.disable(logging.ERROR)
+
+    start = time.perf_counter()
+    from main import app
+    loaded = time.perf_counter() - start
+
+    async def first_request() -> Tuple[int, float]:
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+                # The last dish stored, so a lazily loaded snapshot cannot have it decoded already
+                last = config["items"] - 1
+                response = await client.post("/api/v1/generate-description", json={
+                    "name": dish_name(last), "model": MODELS[last % 2]
+                })
+                return response.status_code, time.perf_counter() - start
+
+    status, served = asyncio.run(first_request())
+    return {"load_seconds": loaded, "first_request_seconds": served, "status": status, "rss_mb": peak_rss_mb()}
@@ -0,0 +1,443 @@
+"""
+Component benchmarks for the storage, cache, rate-limit and prompt layers.
+
+These run the modules directly, without the app or upstream, each in its own
+spawned process and data directory like the load scenarios. Sizes scale with
+``--scale`` (1.0 is the full 1M-record history and 200k-entry cache).
+"""
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# System prompt and user prompt as sent before prompts were built once per model,
+# kept to compare prompt sizes against the current templates
+LEGACY_SYSTEM_PROMPT = """You are a professional AI food menu assistant and restaurant marketing expert.
+            Generate compelling descriptions and upsell messages for food items.
+            Your Tasks:
+            1. Generate a SHORT, catchy description (max 30 words).
+                - Use engaging, food-friendly language.
+                - Use sensory language (taste, smell, texture)
+                - Style should be similar to professional menus (crispy, juicy, tender, spicy, etc.).
+                - Do NOT exceed 30 words.
+                - Include premium ingredients and preparation methods
+            2. Suggest ONE upsell item (a side, drink, or dessert that pairs well).
+                - suggest pairings or enhancements
+                - Keep it short, fun, and appealing.
+            """
+LEGACY_USER_PROMPT = """Please create a description and upsell suggestions for: {name}
+
+            Format your response as:
+            DESCRIPTION: [your description here]
+            UPSELL: [your upsell message here]"""
+LEGACY_MAX_TOKENS = {"gpt-3.5-turbo": 500, "gpt-4.1-mini": 800}
+
+MICRO_BENCHMARKS = (
+    "history_index", "history_memory", "cache_snapshot", "cache_memory", "cache_hit", "eviction_policies",
+    "fuzzy_lookup", "token_bucket", "writer_loop_lag", "prompt_tokens",
+)
+
+# Word lists for a menu-name corpus: "<style> <main> <dish>", e.g. "Tandoori Paneer Tikka"
+MENU_STYLES = (
+    "Classic", "Spicy", "Smoky", "Crispy", "Garlic", "Tandoori", "Honey Glazed", "Lemon Pepper", "Szechuan",
+    "Cajun", "Teriyaki", "Peri Peri", "Truffle", "Butter", "Chipotle", "Korean", "Thai Basil", "Mediterranean",
+    "Herb Roasted", "Sweet Chili", "Black Pepper", "Kashmiri", "Hakka", "Malabar", "Sicilian", "Jamaican Jerk",
+    "Buffalo", "Pesto", "Miso", "Sriracha", "Coconut", "Achari", "Lemongrass", "Harissa", "Tuscan", "Mango",
+    "Sesame", "Balsamic", "Wood Fired", "Masala",
+)
+MENU_MAINS = (
+    "Chicken", "Paneer", "Lamb", "Prawn", "Tofu", "Mushroom", "Beef", "Pork", "Salmon", "Cod", "Duck",
+    "Chickpea", "Cauliflower", "Egg", "Aubergine", "Halloumi", "Squid", "Turkey", "Jackfruit", "Crab", "Potato",
+    "Spinach", "Corn", "Lentil", "Goat",
+)
+MENU_DISHES = (
+    "Tikka", "Curry", "Burger", "Wrap", "Salad", "Pizza", "Biryani", "Tacos", "Ramen", "Noodles", "Fried Rice",
+    "Skewers", "Sandwich", "Bowl", "Soup", "Pasta", "Risotto", "Quesadilla", "Dumplings", "Bao", "Kebab",
+    "Stir Fry", "Pie", "Sliders", "Flatbread", "Korma", "Vindaloo", "Masala Dosa", "Frankie", "Momos",
+    "Spring Rolls", "Satay", "Gyoza", "Shawarma", "Burrito", "Nachos", "Tagine", "Pho", "Laksa", "Katsu",
+    "Platter", "Roast", "Stew", "Chowder", "Fajitas", "Lasagne", "Gnocchi", "Calzone", "Panini", "Pulao",
+    "Paratha", "Thali", "Kathi Roll", "Bhuna", "Jalfrezi", "Madras", "Rogan Josh", "Saag", "Do Pyaza", "Balti",
+    "Handi", "Kadai", "Makhani", "Pasanda", "Dhansak", "Chettinad", "Manchurian", "Chilli", "Lollipop", "Pakora",
+    "Samosa", "Bhaji", "Cutlet", "Croquettes", "Fritters", "Tempura", "Karaage", "Bulgogi", "Bibimbap", "Poke",
+    "Teriyaki Bowl", "Donburi", "Udon", "Soba", "Yakitori", "Tostada", "Enchiladas", "Empanadas", "Arepa", "Gumbo",
+    "Jambalaya", "Po Boy", "Cobb Salad", "Caesar Salad", "Club Sandwich", "Melt", "Hash", "Omelette", "Frittata",
+    "Souvlaki",
+)
+
+def _timed(fn: Callable, repeat: int) -> float:
+    """Mean seconds per call"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+def _records(count: int):
+    from models.records import CacheRecord
+    now = int(time.time())
+    for i in range(count):
+        model = "gpt-3.5-turbo" if i % 2 else "gpt-4.1-mini"
+        yield f"dish {i}_{model}", CacheRecord(
+            f"{i:032x}", f"Dish {i}", model,
+            f"Crispy, golden dish {i} with smoky notes and a buttery finish.",
+            f"Pair your Dish {i} with truffle fries!",
+            created_at=now - i, last_accessed=now - i
+        )
+
+def history_index(scale: float) -> dict:
+    """Appends, pages and top-K on the history log's secondary indexes"""
+    from models.history_log import HistoryLog
+    from models.records import HistoryRecord
+    count = int(1_000_000 * scale)
+    base = int(time.time()) - count
+    log = HistoryLog("history.jsonl")
+    start = time.perf_counter()
+    for offset in range(0, count, 5000):
+        log.append_many([
+            HistoryRecord(str(i), f"Dish {i % 20000}", "gpt-3.5-turbo" if i % 3 else "gpt-4.1-mini", "d", "u", base + i)
+            for i in range(offset, min(count, offset + 5000))
+        ])
+    append_seconds = time.perf_counter() - start
+    # Pages then search the memory-mapped time files, as after any restart
+    log.checkpoint()
+    _, cursor = log.page(limit=50)
+    middle = base + count // 2
+    metrics = {
+        "page_ms": _timed(lambda: log.page(limit=50), 1000) * 1000,
+        "next_page_ms": _timed(lambda: log.page(cursor=cursor, limit=50), 1000) * 1000,
+        "model_range_page_ms": _timed(
+            lambda: log.page("gpt-4.1-mini", since=middle, until=middle + count // 10, limit=50), 1000
+        ) * 1000,
+        "top_names_ms": _timed(lambda: log.top_names(10), 1000) * 1000,
+    }
+    log.close()
+    start = time.perf_counter()
+    HistoryLog("history.jsonl").close()
+    metrics["reload_seconds"] = time.perf_counter() - start
+    return {"metrics": metrics, "info": {"records": count, "append_seconds": round(append_seconds, 3)}}
+
+def history_memory(scale: float) -> dict:
+    """Heap per history record: Pydantic FoodItemHistory lists per name versus the history log's index"""
+    from models.history_log import HistoryLog
+    from models.name_index import normalize_name
+    from models.records import HistoryRecord
+    from schemas.food_item import FoodItemHistory
+    count = int(1_000_000 * scale)
+    base = int(time.time()) - count
+
+    def records(offset: int, stop: int) -> List[HistoryRecord]:
+        return [
+            HistoryRecord(f"{i:032x}", f"Dish {i % 20000}", "gpt-3.5-turbo" if i % 3 else "gpt-4.1-mini",
+                           f"Crispy, golden dish {i} with smoky notes and a buttery finish.",
+                           f"Pair your Dish {i} with truffle fries!", base + i)
+            for i in range(offset, stop)
+        ]
+
+    # Before: every record kept as a Pydantic model, listed per name
+    tracemalloc.start()
+    by_name: Dict[str, list] = {}
+    for offset in range(0, count, 5000):
+        for record in records(offset, min(count, offset + 5000)):
+            by_name.setdefault(record.name, []).append(FoodItemHistory(**record.to_json()))
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    before_lookup = _timed(lambda: [item.model_dump() for item in by_name["Dish 7"]], 100)
+    del by_name
+
+    log = HistoryLog("history.jsonl")
+    for offset in range(0, count, 5000):
+        log.append_many(records(offset, min(count, offset + 5000)))
+    log.checkpoint()
+    log.close()
+    # After: the history log as loaded at startup, with records left on disk
+    tracemalloc.start()
+    log = HistoryLog("history.jsonl")
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    after_lookup = _timed(lambda: log.history(normalize_name("Dish 7")), 100)
+    log.close()
+    return {
+        "metrics": {
+            "heap_bytes_per_record": after / count,
+            "history_lookup_ms": after_lookup * 1000,
+        },
+        "info": {
+            "records": count,
+            "pydantic_heap_bytes_per_record": round(before / count, 1),
+            "pydantic_history_lookup_ms": round(before_lookup * 1000, 4),
+        },
+    }
+
+def cache_snapshot(scale: float) -> dict:
+    """Snapshot write, startup load and first lookup of the description cache"""
+    from models.cache_policy import BoundedCache
+    from models.snapshot import CacheSnapshot, write_snapshot
+    count = int(200_000 * scale)
+    cache = BoundedCache()
+    for key, record in _records(count):
+        cache[key] = record
+    start = time.perf_counter()
+    write_snapshot("cache.snap", cache.raw_items())
+    write_seconds = time.perf_counter() - start
+    del cache
+    start = time.perf_counter()
+    loaded = BoundedCache()
+    loaded.load_snapshot(CacheSnapshot("cache.snap"))
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    loaded.lookup("dish 1_gpt-3.5-turbo")
+    first_lookup = time.perf_counter() - start
+    return {
+        "metrics": {
+            "write_seconds": write_seconds,
+            "load_seconds": load_seconds,
+            "first_lookup_us": first_lookup * 1e6,
+            "snapshot_bytes_per_entry": os.path.getsize("cache.snap") / count,
+        },
+        "info": {"entries": count},
+    }
+
+def cache_memory(scale: float) -> dict:
+    """Python heap per cached entry"""
+    from models.cache_policy import BoundedCache
+    count = int(200_000 * scale)
+    tracemalloc.start()
+    cache = BoundedCache()
+    for key, record in _records(count):
+        cache[key] = record
+    heap, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"metrics": {"heap_bytes_per_entry": heap / count}, "info": {"entries": len(cache)}}
+
+def cache_hit(scale: float) -> dict:
+    """Per-hit cost, including the flush that persists it, in a small cache and at 100k entries"""
+    os.environ["FOOD_ITEMS_CACHE_MAX_ENTRIES"] = "0"
+    # Only the explicit flushes below write
+    os.environ["FOOD_ITEMS_FLUSH_INTERVAL"] = "3600"
+    os.environ["FOOD_ITEMS_FLUSH_MAX_DIRTY"] = "1000000"
+    from models.food_item_manager import FoodItemManager
+    from schemas.food_item import FoodItemRequest
+    metrics: Dict[str, float] = {}
+    info: Dict[str, float] = {}
+    hit_costs: List[float] = []
+    for count in (1000, max(2000, int(100_000 * scale))):
+        label = f"{count // 1000}k"
+        os.makedirs(label)
+        manager = FoodItemManager(
+            storage_file=f"{label}/data.json", cache_file=f"{label}/cache.json",
+            snapshot_file=f"{label}/cache.snap", history_file=f"{label}/history.jsonl"
+        )
+        for offset in range(0, count, 1000):
+            manager.store_generated_descriptions([
+                (FoodItemRequest(name=f"Dish {i}", model="gpt-3.5-turbo"), "Crispy and golden.", "Add fries!")
+                for i in range(offset, min(count, offset + 1000))
+            ])
+        manager.flush()
+        rng = random.Random(count)
+        names = [f"Dish {rng.randrange(count)}" for _ in range(10000)]
+        hits = iter(names)
+        hit_costs.append(_timed(lambda: manager.get_cached_entry(next(hits), "gpt-3.5-turbo"), len(names)) * 1e6)
+        metrics[f"hit_us_{label}"] = hit_costs[-1]
+        manager.flush()
+        manager.get_cached_entry(names[0], "gpt-3.5-turbo")
+        start = time.perf_counter()
+        manager.flush()
+        # One dirty entry: the write is a delta record, not the whole cache
+        metrics[f"flush_one_hit_ms_{label}"] = (time.perf_counter() - start) * 1000
+        manager.close()
+    # Per-hit cost at the large size relative to 1k entries; 1.0 is constant
+    metrics["hit_cost_growth"] = hit_costs[1] / hit_costs[0]
+    return {"metrics": metrics, "info": info}
+
+def eviction_policies(scale: float) -> dict:
+    """Miss rate per eviction policy on a Zipf replay of menu names, with the cache at a tenth of the catalogue"""
+    from benchmarks.load import zipf_names
+    from models.cache_policy import POLICIES, BoundedCache
+    from models.records import CacheRecord
+    catalogue = max(1000, int(100_000 * scale))
+    replay = zipf_names(catalogue, catalogue * 10, 1.1, random.Random(1))
+    metrics: Dict[str, float] = {}
+    # Misses a cache holding everything would still take: first sight of each dish
+    info: Dict[str, float] = {"compulsory_miss_rate": round(len(set(replay)) / len(replay), 4)}
+    for policy in POLICIES:
+        cache = BoundedCache(policy=policy, max_entries=catalogue // 10)
+        start = time.perf_counter()
+        for name in replay:
+            if cache.lookup(name) is None:
+                cache[name] = CacheRecord(None, name, "gpt-3.5-turbo", "Crispy and golden.", "Add fries!")
+        metrics[f"{policy}_miss_rate"] = cache.misses / len(replay)
+        metrics[f"{policy}_op_us"] = (time.perf_counter() - start) / len(replay) * 1e6
+        info[f"{policy}_evictions"] = cache.evictions
+    info["catalogue"] = catalogue
+    info["requests"] = len(replay)
+    return {"metrics": metrics, "info": info}
+
+def _misspell(name: str, rng: random.Random) -> str:
+    """Drop, double or swap one letter of a word longer than four letters"""
+    words = name.split()
+    long_words = [i for i, word in enumerate(words) if len(word) > 4]
+    if not long_words:
+        return name
+    i = rng.choice(long_words)
+    word = words[i]
+    at = rng.randrange(1, len(word) - 1)
+    edit = rng.randrange(3)
+    if edit == 0:
+        word = word[:at] + word[at + 1:]
+    elif edit == 1:
+        word = word[:at] + word[at] + word[at:]
+    else:
+        word = word[:at - 1] + word[at] + word[at - 1] + word[at + 1:]
+    words[i] = word
+    return " ".join(words)
+
+def fuzzy_lookup(scale: float) -> dict:
+    """
+    Near-duplicate lookup latency over 100k cached menu names, and the share
+    of spelling-variant requests that still need an upstream call
+    """
+    from models.name_index import NameIndex, normalize_name
+    threshold = float(os.getenv("FOOD_ITEMS_FUZZY_THRESHOLD", "0.8"))
+    rng = random.Random(1)
+    corpus = [f"{style} {main} {dish}" for style in MENU_STYLES for main in MENU_MAINS for dish in MENU_DISHES]
+    rng.shuffle(corpus)
+    count = min(len(corpus) // 2, max(1000, int(100_000 * scale)))
+    cached, unseen = corpus[:count], corpus[count:]
+    index = NameIndex()
+    keys = set()
+    for name in cached:
+        normalized = normalize_name(name)
+        keys.add(normalized)
+        index.add(normalized, normalized)
+
+    # Requests a diner might type for a dish already on the menu
+    samples = rng.sample(cached, 2000)
+    variants = {
+        "case": [name.upper() for name in samples],
+        "word_order": [" ".join(reversed(name.split())) for name in samples],
+        "plural": [name + "s" for name in samples],
+        "misspelling": [_misspell(name, rng) for name in samples],
+    }
+    latencies: List[float] = []
+
+    def resolve(name: str) -> bool:
+        """Whether the request is served from cache, as FoodItemManager resolves keys"""
+        normalized = normalize_name(name)
+        if normalized in keys:
+            return True
+        start = time.perf_counter()
+        match = index.best_match(normalized, threshold)
+        latencies.append(time.perf_counter() - start)
+        return match is not None
+
+    metrics: Dict[str, float] = {}
+    info: Dict[str, float] = {"cached_names": count, "threshold": threshold}
+    requests = served = raw_served = 0
+    for kind, names in variants.items():
+        hits = sum(resolve(name) for name in names)
+        info[f"{kind}_served_rate"] = round(hits / len(names), 4)
+        requests += len(names)
+        served += hits
+        # Keyed on the raw string, only exact repeats were served
+        raw_served += sum(name in cached for name in names)
+    # Dishes not on the menu that matched one that is: a wrong description served
+    wrong = sum(resolve(name) for name in rng.sample(unseen, 2000))
+    latencies.sort()
+    metrics["lookup_us_p50"] = latencies[len(latencies) // 2] * 1e6
+    metrics["lookup_us_p99"] = latencies[int(len(latencies) * 0.99)] * 1e6
+    metrics["upstream_calls_per_variant"] = 1 - served / requests
+    metrics["false_match_rate"] = wrong / 2000
+    info["raw_key_upstream_calls_per_variant"] = round(1 - raw_served / requests, 4)
+    return {"metrics": metrics, "info": info}
+
+def token_bucket(scale: float) -> dict:
+    """Cost of one rate-limit check, in memory and in the shared SQLite store"""
+    from utils.rate_limit import SQLiteTokenBuckets, TokenBucketLimiter
+    checks = max(1000, int(100_000 * scale))
+    costs = {"gpt-3.5-turbo": 1.0, "gpt-4.1-mini": 2.0}
+    memory = TokenBucketLimiter(1e12, 1e9, costs)
+    keys = [f"key:{i}" for i in range(1000)]
+    start = time.perf_counter()
+    for i in range(checks):
+        memory.try_acquire(keys[i % 1000], 1.0)
+    memory_us = (time.perf_counter() - start) / checks * 1e6
+    shared = TokenBucketLimiter(1e12, 1e9, costs, store=SQLiteTokenBuckets("buckets.db"))
+    sqlite_checks = checks // 10
+    start = time.perf_counter()
+    for i in range(sqlite_checks):
+        shared.try_acquire(keys[i % 1000], 1.0)
+    sqlite_us = (time.perf_counter() - start) / sqlite_checks * 1e6
+    return {"metrics": {"memory_check_us": memory_us, "sqlite_check_us": sqlite_us}, "info": {"checks": checks}}
+
+def writer_loop_lag(scale: float) -> dict:
+    """Event-loop lag while a large flush runs on the writer thread, serving hits meanwhile"""
+    os.environ["FOOD_ITEMS_CACHE_MAX_ENTRIES"] = "0"
+    from models.food_item_manager import FoodItemManager
+    from schemas.food_item import FoodItemRequest
+    count = int(100_000 * scale)
+    manager = FoodItemManager()
+    for offset in range(0, count, 1000):
+        manager.store_generated_descriptions([
+            (FoodItemRequest(name=f"Dish {i}", model="gpt-3.5-turbo"), "Crispy and golden.", "Add fries!")
+            for i in range(offset, min(count, offset + 1000))
+        ])
+
+    async def measure() -> dict:
+        lags: List[float] = []
+        flush = asyncio.create_task(asyncio.to_thread(manager.flush))
+        start = time.perf_counter()
+        hits = 0
+        while not flush.done():
+            tick = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - tick - 0.001)
+            manager.get_cached_entry(f"Dish {hits % count}", "gpt-3.5-turbo")
+            hits += 1
+        flush_seconds = time.perf_counter() - start
+        await flush
+        lags.sort()
+        return {
+            "flush_seconds": flush_seconds,
+            "loop_lag_p50_ms": lags[len(lags) // 2] * 1000 if lags else 0.0,
+            "loop_lag_p99_ms": lags[int(len(lags) * 0.99)] * 1000 if lags else 0.0,
+        }
+
+    metrics = asyncio.run(measure())
+    manager.close()
+    return {"metrics": metrics, "info": {"entries": count}}
+
+def prompt_tokens(scale: float) -> dict:
+    """Estimated prompt tokens and completion caps per request, before and after the prompt templates"""
+    from benchmarks.fake_openai import prompt_tokens as count_tokens
+    from utils.openai_client import openai_client
+    metrics: Dict[str, float] = {}
+    info: Dict[str, float] = {}
+    for model, prompt in openai_client.prompts.items():
+        legacy = count_tokens([
+            {"role": "system", "content": LEGACY_SYSTEM_PROMPT},
+            {"role": "user", "content": LEGACY_USER_PROMPT.format(name="Margherita Pizza")},
+        ])
+        current = count_tokens(prompt.single("Margherita Pizza"))
+        batch = count_tokens(prompt.batch([f"Dish {i}" for i in range(5)])) / 5
+        metrics[f"{model}_prompt_tokens"] = current
+        metrics[f"{model}_batch_prompt_tokens_per_item"] = batch
+        info[f"{model}_legacy_prompt_tokens"] = legacy
+        info[f"{model}_max_tokens"] = prompt.max_tokens
+        info[f"{model}_legacy_max_tokens"] = LEGACY_MAX_TOKENS[model]
+    return {"metrics": metrics, "info": info}
+
+def run_micro(config: dict) -> dict:
+    """Worker process entry point: run one component benchmark in a fresh data directory"""
+    os.chdir(config["data_dir"])
+    sys.path.insert(0, BACKEND_DIR)
+    # Nothing here talks to upstream, so the missing API key warning is noise
+    logging.disable(logging.WARNING)
+    benchmark = globals()[config["scenario"]]
+    result = benchmark(config["scale"])
+    result["metrics"] = {name: round(value, 4) for name, value in result["metrics"].items()}
+    return result
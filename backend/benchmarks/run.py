@@ -0,0 +1,212 @@
+"""
+Run the API benchmarks and compare them with a saved baseline.
+
+Usage:
+    python -m benchmarks.run [--scenarios cold warm zipf ...] [--requests 2000] [--concurrency 32]
+                             [--latency-ms 50] [--error-rate 0.01] [--workers 4] [--scale 0.1]
+                             [--rate-limit-burst 100] [--rate-limit-per-minute 6000] [--slow-latency-ms 1000]
+                             [--baseline benchmarks/baseline.json] [--save-baseline] [--threshold 0.2]
+
+Scenarios are the load scenarios in load.py (``hits_under_misses`` times
+cache hits while misses wait on an upstream taking ``--slow-latency-ms``), ``multi_worker`` (the Zipf
+scenario split across ``--workers`` processes sharing the SQLite backend and
+one rate limit bucket, reporting the requests it rejected and the share of
+cross-worker repeats served from the shared cache),
+``startup`` (time to first served request with 10k, 100k and 1M cached dishes,
+times ``--scale``) and the component benchmarks in micro.py. With ``--baseline``, the run exits with
+status 1 when any metric is more than ``--threshold`` worse than the baseline.
+Metrics ending in ``_rps`` or ``_ratio`` are better higher; every other metric is better lower.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.load import (
+    SCENARIOS, STARTUP_SIZES, cross_worker_hit_ratio, dir_bytes, prepare_startup, run_scenario, run_startup,
+    scenario_result
+)
+from benchmarks.micro import MICRO_BENCHMARKS, run_micro
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger("benchmarks")
+
+ALL_SCENARIOS = (*SCENARIOS, "multi_worker", "startup", *MICRO_BENCHMARKS)
+
+def run_processes(target: Callable[[dict], dict], configs: List[dict]) -> List[dict]:
+    """Run each config in its own freshly spawned process, all at once"""
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(len(configs), maxtasksperchild=1) as pool:
+        return pool.map(target, configs, chunksize=1)
+
+def run_startup_sizes(config: dict, server: FakeOpenAIServer) -> dict:
+    """Startup at each STARTUP_SIZES size: stores written by one process, opened by a fresh one"""
+    metrics: Dict[str, float] = {}
+    info: Dict[str, float] = {}
+    for size in STARTUP_SIZES:
+        items = max(1000, int(size * config["scale"]))
+        label = f"{items // 1000}k"
+        sized = {**config, "data_dir": os.path.join(config["data_dir"], label), "items": items}
+        os.makedirs(sized["data_dir"])
+        info[f"disk_bytes_{label}"] = run_processes(prepare_startup, [sized])[0]["disk_bytes"]
+        upstream_before = server.counters()["requests"]
+        run = run_processes(run_startup, [sized])[0]
+        if run["status"] != 200 or server.counters()["requests"] != upstream_before:
+            raise RuntimeError(f"startup with {label} items did not serve the first request from cache")
+        metrics[f"load_seconds_{label}"] = round(run["load_seconds"], 4)
+        metrics[f"first_request_seconds_{label}"] = round(run["first_request_seconds"], 4)
+        metrics[f"rss_mb_{label}"] = round(run["rss_mb"], 1)
+    return {"metrics": metrics, "info": info}
+
+def run_one(name: str, args: argparse.Namespace, server: FakeOpenAIServer) -> dict:
+    data_dir = tempfile.mkdtemp(prefix=f"bench-{name}-")
+    config = {
+        "scenario": name,
+        "data_dir": data_dir,
+        "base_url": server.base_url,
+        "backend": args.backend,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "catalogue": args.catalogue,
+        "zipf_s": args.zipf_s,
+        "batch_size": args.batch_size,
+        "seed": args.seed,
+        "scale": args.scale,
+    }
+    try:
+        if name in MICRO_BENCHMARKS:
+            return run_processes(run_micro, [config])[0]
+        if name == "startup":
+            return run_startup_sizes(config, server)
+        if name == "hits_under_misses":
+            slow = FakeOpenAIServer(args.slow_latency_ms / 1000, args.jitter, 0.0, args.seed).start()
+            try:
+                result = scenario_result(run_processes(run_scenario, [{**config, "base_url": slow.base_url}]))
+            finally:
+                slow.stop()
+            if "miss_p50_ms" not in result["metrics"]:
+                raise RuntimeError("hits_under_misses finished before any miss came back; raise --requests")
+            return result
+        if name != "multi_worker":
+            return scenario_result(run_processes(run_scenario, [config]))
+
+        # Every worker shares one SQLite database, and so one client bucket, as under `uvicorn --workers N`
+        configs = [
+            {**config, "scenario": "zipf", "backend": "sqlite", "requests": args.requests // args.workers,
+             "seed": args.seed + i, "rate_limit": (args.rate_limit_burst, args.rate_limit_per_minute)}
+            for i in range(args.workers)
+        ]
+        disk_before = dir_bytes(data_dir)
+        upstream_before = server.counters()
+        runs = run_processes(run_scenario, configs)
+        upstream_after = server.counters()
+        result = scenario_result(
+            runs,
+            duration=max(run["finished"] for run in runs) - min(run["started"] for run in runs),
+            disk_bytes=dir_bytes(data_dir) - disk_before,
+            upstream={key: upstream_after[key] - upstream_before[key] for key in upstream_after}
+        )
+        if not result["info"]["rate_limited"]:
+            raise RuntimeError("multi_worker never reached the shared rate limit; lower --rate-limit-burst")
+        result["metrics"]["cross_worker_hit_ratio"] = cross_worker_hit_ratio(runs, os.path.join(data_dir, "food_items.db"))
+        return result
+    finally:
+        if not args.keep_data:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """Metrics that are more than ``threshold`` worse than the baseline"""
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name, {}).get("metrics", {})
+        for metric, value in result["metrics"].items():
+            reference = expected.get(metric)
+            if not reference:
+                continue
+            change = (value - reference) / abs(reference)
+            if metric.endswith(("_rps", "_ratio")):
+                change = -change
+            if change > threshold:
+                regressions.append(f"{name}.{metric}: {value:g} vs baseline {reference:g} ({change:+.0%} worse)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API benchmarks against a fake OpenAI server")
+    parser.add_argument("--scenarios", nargs="+", default=list(ALL_SCENARIOS), choices=ALL_SCENARIOS, metavar="SCENARIO",
+                        help=f"Scenarios to run (default: all of {', '.join(ALL_SCENARIOS)})")
+    parser.add_argument("--requests", type=int, default=2000, help="Timed requests per load scenario")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients per worker")
+    parser.add_argument("--catalogue", type=int, default=2000, help="Distinct dishes in the Zipf scenarios")
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="Zipf exponent for dish popularity")
+    parser.add_argument("--batch-size", type=int, default=10, help="Items per batch request")
+    parser.add_argument("--workers", type=int, default=4, help="Worker processes for multi_worker")
+    parser.add_argument("--rate-limit-burst", type=float, default=100, help="Shared bucket capacity for multi_worker")
+    parser.add_argument("--rate-limit-per-minute", type=float, default=6000, help="Shared bucket refill for multi_worker")
+    parser.add_argument("--backend", default="json", choices=("json", "sqlite"), help="Storage backend for single-worker scenarios")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Mean fake upstream latency")
+    parser.add_argument("--slow-latency-ms", type=float, default=1000, help="Fake upstream latency for hits_under_misses")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Upstream latency spread, as a fraction of the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream calls that fail")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Size factor for component and startup benchmarks (1.0 = 1M history records)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for traffic and the fake upstream")
+    parser.add_argument("--baseline", help="Baseline JSON to compare with (or to write with --save-baseline)")
+    parser.add_argument("--save-baseline", action="store_true", help="Write this run's results to --baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression before failing")
+    parser.add_argument("--output", help="Also write this run's results to a JSON file")
+    parser.add_argument("--keep-data", action="store_true", help="Keep each scenario's data directory")
+    args = parser.parse_args()
+    if args.save_baseline and not args.baseline:
+        parser.error("--save-baseline needs --baseline")
+
+    server = FakeOpenAIServer(args.latency_ms / 1000, args.jitter, args.error_rate, args.seed).start()
+    results: Dict[str, dict] = {}
+    try:
+        for name in args.scenarios:
+            start = time.perf_counter()
+            results[name] = run_one(name, args, server)
+            metrics = ", ".join(f"{metric}={value:g}" for metric, value in results[name]["metrics"].items())
+            logger.info(f"{name} ({time.perf_counter() - start:.1f}s): {metrics}")
+    finally:
+        server.stop()
+
+    report = {
+        "settings": {key: value for key, value in vars(args).items() if key not in ("baseline", "save_baseline", "output", "keep_data")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline and args.save_baseline:
+        if os.path.exists(args.baseline):
+            # Keep baseline entries for scenarios this run skipped
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                report["results"] = {**json.load(f).get("results", {}), **results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Saved baseline to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        differing = [
+            key for key, value in report["settings"].items()
+            if key != "scenarios" and baseline.get("settings", {}).get(key) != value
+        ]
+        if differing:
+            logger.warning(f"Baseline was recorded with different {', '.join(differing)}; comparisons may not be meaningful")
+        regressions = compare(results, baseline.get("results", {}), args.threshold)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        logger.info(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
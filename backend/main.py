@@ -1,21 +1,32 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from routes.generate import router as generate_router
+from fastapi.responses import PlainTextResponse
+from routes.generate import router as generate_router, food_manager, refresh_scheduler
+from routes.history import router as history_router
+from utils.openai_client import openai_client
+from utils.rate_limit import token_limiter
+from utils.metrics import render_metrics
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Stop background refreshes, flush pending writes and release pooled upstream connections on shutdown"""
+    yield
+    await refresh_scheduler.stop()
+    # Queued writes and the final snapshot run on a worker thread, off the event loop
+    await asyncio.to_thread(food_manager.flush)
+    await asyncio.to_thread(food_manager.close)
+    await asyncio.to_thread(token_limiter.close)
+    await openai_client.aclose()
 
 app = FastAPI(
     title="AI-Powered Menu Intelligence Widget API",
     description="Backend API for generating food item descriptions with AI intelligence, caching, and data persistence",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
-# Configure rate limiting
-limiter = Limiter(key_func=get_remote_address)
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
 # Configure CORS to allow frontend requests
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +38,7 @@ app.add_middleware(
 
 # Include the generate router
 app.include_router(generate_router, prefix="/api/v1", tags=["generate"])
+app.include_router(history_router, prefix="/api/v1", tags=["history"])
 
 @app.get("/")
 async def root():
@@ -38,7 +50,8 @@ async def root():
             "Food item description generation",
             "Caching and data persistence",
             "Cache management",
-            "Rate limiting (5 requests/minute)"
+            "Generation history and top-dishes analytics",
+            "Cost-aware rate limiting per API key or tenant"
         ]
     }
 
@@ -46,15 +59,15 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: per-stage latency, cache hits/misses, fallbacks and upstream errors"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/v1/rate-limit/status")
-@limiter.limit("5/minute")
 async def rate_limit_status(request: Request):
-    """Get current rate limit status for the client"""
-    return {
-        "rate_limit": "5 requests per minute",
-        "client_ip": get_remote_address(request),
-        "remaining_requests": "Check response headers for details"
-    }
+    """Get current token-bucket balance and model costs for the client"""
+    return token_limiter.status(request)
 
 @app.get("/api-info")
 async def api_info():
@@ -66,6 +79,15 @@ async def api_info():
         "endpoints": {
             "generate": "/api/v1/generate-description",
             "regenerate": "/api/v1/regenerate-description",
+            "batch": "/api/v1/generate-descriptions/batch",
+            "generate_stream": "/api/v1/generate-description/stream",
+            "regenerate_stream": "/api/v1/regenerate-description/stream",
+            "cache_stats": "/api/v1/cache/stats",
+            "usage": "/api/v1/usage",
+            "usage_items": "/api/v1/usage/items",
+            "history": "/api/v1/history",
+            "item_history": "/api/v1/history/{name}",
+            "top_dishes": "/api/v1/analytics/top-dishes",
         },
         "models": {
             "gpt-3.5-turbo": "Light and fresh description style",
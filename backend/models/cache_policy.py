@@ -0,0 +1,277 @@
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+import time
+from models.snapshot import CacheSnapshot, SnapshotEntry
+from models.secondary_index import Ranking
+from models.name_index import split_key
+
+# Rough per-entry overhead of a CacheRecord (slots, id bytes, int timestamps and
+# string headers), on top of its text fields
+ENTRY_OVERHEAD_BYTES = 400
+
+
+class CachePolicy:
+    """Base eviction policy: tracks keys and picks the next victim in O(1)"""
+
+    def insert(self, key: Hashable, item: Any):
+        raise NotImplementedError
+
+    def access(self, key: Hashable):
+        raise NotImplementedError
+
+    def remove(self, key: Hashable):
+        raise NotImplementedError
+
+    def victim(self) -> Hashable:
+        raise NotImplementedError
+
+
+class LRUPolicy(CachePolicy):
+    """Evicts the least recently accessed key"""
+
+    def __init__(self):
+        self._order: "OrderedDict[Hashable, None]" = OrderedDict()
+
+    def insert(self, key, item):
+        self._order[key] = None
+        self._order.move_to_end(key)
+
+    def access(self, key):
+        self._order.move_to_end(key)
+
+    def remove(self, key):
+        self._order.pop(key, None)
+
+    def victim(self):
+        return next(iter(self._order))
+
+
+class LFUPolicy(CachePolicy):
+    """Evicts the least frequently accessed key, oldest first among ties"""
+
+    def __init__(self):
+        self._freq: Dict[Hashable, int] = {}
+        self._buckets: Dict[int, "OrderedDict[Hashable, None]"] = {}
+        self._min_freq = 0
+
+    def _add(self, key, freq):
+        self._freq[key] = freq
+        self._buckets.setdefault(freq, OrderedDict())[key] = None
+        if freq < self._min_freq or len(self._freq) == 1:
+            self._min_freq = freq
+
+    def _discard(self, key) -> int:
+        freq = self._freq.pop(key)
+        bucket = self._buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[freq]
+        return freq
+
+    def insert(self, key, item):
+        if key in self._freq:
+            # Regenerated entries keep the popularity they already earned
+            return
+        self._add(key, max(1, getattr(item, "access_count", 1)))
+
+    def access(self, key):
+        freq = self._discard(key)
+        if freq == self._min_freq and freq not in self._buckets:
+            self._min_freq = freq + 1
+        self._add(key, freq + 1)
+
+    def remove(self, key):
+        if key in self._freq:
+            self._discard(key)
+
+    def victim(self):
+        if self._min_freq not in self._buckets:
+            # Only reachable after an out-of-order removal (e.g. TTL expiry)
+            self._min_freq = min(self._buckets)
+        return next(iter(self._buckets[self._min_freq]))
+
+
+POLICIES = {
+    "lru": LRUPolicy,
+    "lfu": LFUPolicy,
+}
+
+
+def estimate_size(item: Any) -> int:
+    """Approximate in-memory footprint of a cached entry"""
+    if isinstance(item, SnapshotEntry):
+        # Packed size is close to the decoded text size
+        return ENTRY_OVERHEAD_BYTES + item.length
+    size = ENTRY_OVERHEAD_BYTES
+    for field in ("name", "description", "upsell"):
+        value = getattr(item, field, None)
+        if value:
+            size += len(value)
+    return size
+
+
+class BoundedCache(MutableMapping):
+    """
+    Dict-like cache with a pluggable eviction policy, entry/byte budgets and
+    an optional TTL on ``last_accessed`` (epoch seconds).
+
+    Plain mapping access (``cache[key]``, ``cache.get``) peeks without touching
+    the policy or counters; request lookups go through ``lookup``. Entries
+    loaded from a snapshot stay packed until first read. Not thread-safe on
+    its own - callers hold their own lock.
+    """
+
+    def __init__(
+        self,
+        policy: str = "lru",
+        max_entries: int = 0,
+        max_bytes: int = 0,
+        ttl_seconds: float = 0
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown cache policy: {policy}. Allowed values: {list(POLICIES)}")
+        self.policy_name = policy
+        self.policy = POLICIES[policy]()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds or None
+        self._data: Dict[Hashable, Any] = {}
+        self._sizes: Dict[Hashable, int] = {}
+        self.total_bytes = 0
+        # Keys by access_count, for most-requested queries
+        self.by_access = Ranking()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # Called with each key that leaves the cache (evicted, expired or deleted)
+        self.on_remove: Optional[Callable[[Hashable], None]] = None
+
+    def _expired(self, item: Any, now: float) -> bool:
+        return self.ttl is not None and now - item.last_accessed > self.ttl
+
+    def _unpack(self, key: Hashable, item: Any) -> Any:
+        """Decode an entry that is still packed in a snapshot"""
+        if isinstance(item, SnapshotEntry):
+            item = self._data[key] = item.load()
+        return item
+
+    def lookup(self, key: Hashable) -> Optional[Any]:
+        """Return the entry for a request, updating policy state and counters"""
+        item = self._data.get(key)
+        if item is not None and self._expired(item, time.time()):
+            self._remove(key)
+            self.expirations += 1
+            item = None
+        if item is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.policy.access(key)
+        return self._unpack(key, item)
+
+    def load_snapshot(self, snapshot: CacheSnapshot):
+        """Add every snapshot entry without decoding it"""
+        for key, entry in snapshot.entries():
+            self[key] = entry
+
+    def raw_items(self) -> List[Tuple[Hashable, Any, int, int]]:
+        """
+        ``(key, entry, last_accessed, access_count)`` for every entry, leaving
+        snapshot entries packed. The access fields are captured here, under the
+        caller's lock, so hits that land while a snapshot is written cannot tear it.
+        """
+        return [(key, item, item.last_accessed, item.access_count) for key, item in self._data.items()]
+
+    def raw_entries(self, keys: Iterable[Hashable]) -> List[Tuple[Hashable, Any, int, int]]:
+        """Like ``raw_items`` for only ``keys``; a key no longer cached comes back with ``None`` as its entry"""
+        entries = []
+        for key in keys:
+            item = self._data.get(key)
+            if item is None:
+                entries.append((key, None, 0, 0))
+            else:
+                entries.append((key, item, item.last_accessed, item.access_count))
+        return entries
+
+    def touch(self, key: Hashable, item: Any):
+        """Persist an access; in-process entries are already updated in place"""
+        self.by_access.set(key, item.access_count)
+
+    def top_accessed(self, limit: int, model: Optional[str] = None) -> List[Tuple[Hashable, int]]:
+        """``(key, access_count)`` of the most accessed entries, optionally for one model, highest first"""
+        if model is None:
+            return self.by_access.top(limit)
+        return self.by_access.top(limit, lambda key: split_key(key)[1] == model)
+
+    def _remove(self, key: Hashable):
+        del self._data[key]
+        self.by_access.remove(key)
+        self.total_bytes -= self._sizes.pop(key)
+        self.policy.remove(key)
+        if self.on_remove is not None:
+            self.on_remove(key)
+
+    def _over_budget(self, extra_entries: int = 0, extra_bytes: int = 0) -> bool:
+        if self.max_entries and len(self._data) + extra_entries > self.max_entries:
+            return True
+        return bool(self.max_bytes) and self.total_bytes + extra_bytes > self.max_bytes
+
+    def _evict(self, extra_entries: int = 0, extra_bytes: int = 0, keep: Optional[Hashable] = None):
+        """Evict until the budget has room for ``extra_entries``/``extra_bytes``, never evicting ``keep``"""
+        while self._data and self._over_budget(extra_entries, extra_bytes):
+            victim = self.policy.victim()
+            if victim == keep:
+                return
+            self._remove(victim)
+            self.evictions += 1
+
+    def __getitem__(self, key):
+        return self._unpack(key, self._data[key])
+
+    def __setitem__(self, key, item):
+        size = estimate_size(item)
+        if key in self._data:
+            self.total_bytes -= self._sizes[key]
+        else:
+            # Make room before inserting: a new key has the lowest frequency, so
+            # LFU would otherwise pick it as its own victim
+            self._evict(1, size)
+        self._data[key] = item
+        self._sizes[key] = size
+        self.total_bytes += size
+        self.by_access.set(key, item.access_count)
+        self.policy.insert(key, item)
+        # A replaced entry that grew may still be over the byte budget; an entry
+        # larger than the whole budget is kept on its own
+        self._evict(keep=key)
+
+    def __delitem__(self, key):
+        self._remove(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self._data
+
+    def __iter__(self) -> Iterator:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters and current budget usage"""
+        lookups = self.hits + self.misses
+        return {
+            "policy": self.policy_name,
+            "entries": len(self._data),
+            "bytes": self.total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
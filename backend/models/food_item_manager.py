@@ -1,73 +1,239 @@
-from typing import Dict, List, Optional, Tuple
-from datetime import datetime, timedelta
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+import base64
+import binascii
 import json
 import os
+import threading
+import time
 import uuid
-from schemas.food_item import FoodItemHistory, FoodItemCache, FoodItemRequest, FoodItemResponse
+from schemas.food_item import DishRanking, FoodItemHistory, FoodItemRequest, FoodItemResponse
+from models.storage_backend import StorageBackend, create_backend
+from models.records import CacheRecord, HistoryRecord, to_timestamp
+from models.name_index import NameIndex, cache_key, normalize_name, split_key
+from utils.metrics import CACHE_LOOKUPS, time_stage
 
 class FoodItemManager:
     """Manages food item data storage, caching, and retrieval"""
     
-    def __init__(self, storage_file: str = "food_items_data.json", cache_file: str = "food_items_cache.json"):
-        self.storage_file = storage_file
-        self.cache_file = cache_file
-        self.storage: Dict[str, FoodItemHistory] = {}
-        self.cache: Dict[str, FoodItemCache] = {}
-        self._load_data()
+    def __init__(self, backend: Optional[StorageBackend] = None, **backend_options):
+        self._lock = threading.RLock()
+        # Backend is chosen by FOOD_ITEMS_BACKEND unless one is passed in
+        self.backend = backend or create_backend(self._lock, **backend_options)
+        self.cache = self.backend.cache
+        self.storage = self.backend.storage
+        
+        # Near-duplicate names above this trigram similarity share a cache entry (0 disables)
+        self.fuzzy_threshold = float(os.getenv("FOOD_ITEMS_FUZZY_THRESHOLD", "0.8"))
+        self._name_indexes: Dict[str, NameIndex] = {}
+        # Built from the keys alone, so snapshot entries stay packed
+        for key in self.cache:
+            self._index_name(key, split_key(key)[1])
+        
+        # Stale-while-revalidate: entries older than the soft TTL are still served but
+        # reported to on_stale for a background refresh; entries older than the hard
+        # TTL count as misses (0 disables either)
+        self.soft_ttl = float(os.getenv("FOOD_ITEMS_SOFT_TTL_SECONDS", "0")) or None
+        self.hard_ttl = float(os.getenv("FOOD_ITEMS_HARD_TTL_SECONDS", "0")) or None
+        # Template fallbacks are only served this long before the next lookup retries upstream
+        self.fallback_ttl = float(os.getenv("FOOD_ITEMS_FALLBACK_TTL_SECONDS", "60"))
+        # Called as on_stale(key, name, model, access_count); must not block
+        self.on_stale: Optional[Callable[[str, str, str, int], None]] = None
+    
+    @staticmethod
+    def cache_key(name: str, model: str) -> str:
+        """Cache key for a food item; spelling variants of a name share one key"""
+        return cache_key(name, model)
+    
+    def _index_name(self, key: str, model: str):
+        """Add a cache key to the near-duplicate index for its model"""
+        if self.fuzzy_threshold > 0:
+            index = self._name_indexes.setdefault(model, NameIndex())
+            index.add(key, key[:-len(model) - 1])
+    
+    def _resolve_key(self, name: str, model: str) -> str:
+        """Exact cache key if cached, else the key of a cached near-duplicate, else the exact key"""
+        key = cache_key(name, model)
+        if key in self.cache or self.fuzzy_threshold <= 0:
+            return key
+        index = self._name_indexes.get(model)
+        if index is None:
+            return key
+        match = index.best_match(normalize_name(name), self.fuzzy_threshold)
+        if match is None:
+            return key
+        if match[0] not in self.cache:
+            # Entry was evicted since it was indexed
+            index.remove(match[0])
+            return key
+        return match[0]
+    
+    def is_cached(self, name: str, model: str) -> bool:
+        """Whether a request would be served from cache, without counting it as an access"""
+        with self._lock:
+            return self._resolve_key(name, model) in self.cache
+    
+    def _expired(self, cached_item: CacheRecord, now: int) -> bool:
+        """Too old to serve: past the hard TTL, or a fallback past its retry TTL"""
+        age = now - cached_item.created_at
+        return (self.hard_ttl is not None and age > self.hard_ttl) or (cached_item.fallback and age > self.fallback_ttl)
+    
+    def peek_cached_entry(self, name: str, model: str, allow_expired: bool = False) -> Optional[CacheRecord]:
+        """The entry get_cached_entry would serve, without counting a hit or miss or touching it"""
+        now = int(time.time())
+        with self._lock:
+            cached_item = self.cache.get(self._resolve_key(name, model))
+        if cached_item is None:
+            return None
+        if self.cache.ttl is not None and now - cached_item.last_accessed > self.cache.ttl:
+            return None
+        if self._expired(cached_item, now) and not allow_expired:
+            return None
+        return cached_item
+    
+    def _lookup(self, name: str, model: str, now: int, allow_expired: bool = False) -> Optional[Tuple[str, CacheRecord]]:
+        """Find and touch the cache entry for a request; caller holds the lock"""
+        key = self._resolve_key(name, model)
+        cached_item = self.cache.lookup(key)
+        if cached_item is None:
+            CACHE_LOOKUPS.inc("miss", model)
+            return None
+        if self._expired(cached_item, now) and not allow_expired:
+            # Too old to serve; the caller regenerates and overwrites it
+            CACHE_LOOKUPS.inc("expired", model)
+            return None
+        CACHE_LOOKUPS.inc("hit" if key == cache_key(name, model) else "fuzzy_hit", model)
+        # Update access count and timestamp
+        cached_item.access_count += 1
+        cached_item.last_accessed = now
+        self.cache.touch(key, cached_item)
+        return key, cached_item
+    
+    def _is_stale(self, cached_item: CacheRecord, now: int) -> bool:
+        return self.soft_ttl is not None and now - cached_item.created_at > self.soft_ttl
+    
+    def _report_stale(self, stale: List[Tuple[str, CacheRecord]]):
+        """Hand stale entries to the refresh hook, outside the lock"""
+        if self.on_stale is None:
+            return
+        for key, cached_item in stale:
+            self.on_stale(key, cached_item.name, cached_item.model, cached_item.access_count)
+    
+    async def wait_for_writer(self):
+        """Backpressure for async callers: wait, off the event loop, while the persistence queue is full"""
+        await self.backend.wait_for_capacity()
     
-    def _load_data(self):
-        """Load existing data from storage files"""
+    def flush(self):
+        """Write all pending changes to disk now"""
+        self.backend.flush()
+    
+    def close(self):
+        """Stop background persistence and release the storage backend"""
+        self.backend.close()
+    
+    def cache_stats(self) -> dict:
+        """Hit, miss and eviction counters for the description cache"""
+        with self._lock:
+            stats = self.cache.stats()
+        stats["soft_ttl_seconds"] = self.soft_ttl
+        stats["hard_ttl_seconds"] = self.hard_ttl
+        return stats
+    
+    def get_history(self, name: str) -> List[FoodItemHistory]:
+        """Get every retained generation for a food item and its spelling variants, oldest first"""
+        # Queued appends land first, so a caller sees its own generations
+        self.backend.drain()
+        return [record.to_schema() for record in self.storage.history(normalize_name(name))]
+    
+    @staticmethod
+    def _encode_cursor(cursor: Optional[tuple]) -> Optional[str]:
+        if cursor is None:
+            return None
+        return base64.urlsafe_b64encode(json.dumps(list(cursor)).encode()).decode()
+    
+    def _decode_cursor(self, token: Optional[str]) -> Optional[tuple]:
+        if not token:
+            return None
         try:
-            if os.path.exists(self.storage_file):
-                with open(self.storage_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for item_data in data.values():
-                        # Convert string timestamps back to datetime objects
-                        item_data['created_at'] = datetime.fromisoformat(item_data['created_at'])
-                        self.storage[item_data['name']] = FoodItemHistory(**item_data)
-        except Exception as e:
-            print(f"Warning: Could not load storage data: {e}")
-            self.storage = {}
+            cursor = json.loads(base64.urlsafe_b64decode(token.encode()))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise ValueError("Invalid history cursor")
+        # Exact types, so a bool or float never reaches the index as an int
+        expected = self.storage.CURSOR_TYPES
+        if (
+            not isinstance(cursor, list)
+            or len(cursor) != len(expected)
+            or any(type(value) is not kind for value, kind in zip(cursor, expected))
+        ):
+            raise ValueError("Invalid history cursor")
+        return tuple(cursor)
+    
+    def query_history(
+        self,
+        model: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50
+    ) -> Tuple[List[FoodItemHistory], Optional[str]]:
+        """
+        Get one page of history across all items, newest first
         
-        try:
-            if os.path.exists(self.cache_file):
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for item_data in data.values():
-                        # Convert string timestamps back to datetime objects
-                        item_data['last_accessed'] = datetime.fromisoformat(item_data['last_accessed'])
-                        self.cache[item_data['name']] = FoodItemCache(**item_data)
-        except Exception as e:
-            print(f"Warning: Could not load cache data: {e}")
-            self.cache = {}
-    
-    def _save_data(self):
-        """Save data to storage files"""
-        try:
-            # Save storage data
-            storage_data = {}
-            for name, history_list in self.storage.items():
-                storage_data[name] = []
-                for item in history_list:  # iterate through FoodItemHistory objects
-                    item_dict = item.model_dump()
-                    item_dict['created_at'] = item.created_at.isoformat()
-                    storage_data[name].append(item_dict)
-            
-            with open(self.storage_file, 'w', encoding='utf-8') as f:
-                json.dump(storage_data, f, indent=2, ensure_ascii=False)
-            
-            # Save cache data
-            cache_data = {}
-            for name, item in self.cache.items():
-                item_dict = item.model_dump()
-                item_dict['last_accessed'] = item.last_accessed.isoformat()
-                cache_data[name] = item_dict
-            
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, indent=2, ensure_ascii=False)
-                
-        except Exception as e:
-            print(f"Error saving data: {e}")
+        Returns:
+            Tuple of (records, cursor for the next page or None); raises
+            ValueError for a cursor this backend did not issue
+        """
+        self.backend.drain()
+        records, next_cursor = self.storage.page(
+            model,
+            to_timestamp(since) if since is not None else None,
+            to_timestamp(until) if until is not None else None,
+            self._decode_cursor(cursor),
+            limit
+        )
+        return [record.to_schema() for record in records], self._encode_cursor(next_cursor)
+    
+    def top_dishes(self, by: str = "accesses", model: Optional[str] = None, limit: int = 10) -> List[DishRanking]:
+        """
+        Most requested dishes, by cache accesses (optionally for one model) or
+        by generations across all models
+        """
+        if by == "generations":
+            self.backend.drain()
+            ranked = []
+            # History is ranked by normalized name; show the name the dish was last generated under
+            for name, count in self.storage.top_names(limit):
+                latest = self.storage.latest(name)
+                ranked.append(DishRanking(name=latest.name if latest else name, count=count))
+            return ranked
+        if by != "accesses":
+            raise ValueError(f"Unknown ranking: {by}. Allowed values: ['accesses', 'generations']")
+        with self._lock:
+            ranked = []
+            for key, count in self.cache.top_accessed(limit, model):
+                cached_item = self.cache.get(key)
+                if cached_item is not None:
+                    ranked.append(DishRanking(name=cached_item.name, model=cached_item.model, count=count))
+        return ranked
+    
+    def get_cached_entry(self, name: str, model: str, allow_expired: bool = False) -> Optional[CacheRecord]:
+        """
+        Get the cache entry that serves a food item, counting the access
+        
+        Entries past the soft TTL are still returned and reported to ``on_stale``;
+        entries past the hard TTL only with ``allow_expired``, e.g. while upstream
+        spend is capped.
+        """
+        now = int(time.time())
+        with time_stage("cache_lookup", model), self._lock:
+            found = self._lookup(name, model, now, allow_expired)
+        if found is None:
+            return None
+        key, cached_item = found
+        self.backend.mark_dirty(f"cache:{key}")
+        if self._is_stale(cached_item, now):
+            self._report_stale([found])
+        return cached_item
     
     def get_cached_description(self, name: str, model: str) -> Optional[Tuple[str, str]]:
         """
@@ -76,46 +242,83 @@ class FoodItemManager:
         Returns:
             Tuple of (description, upsell) if found, None otherwise
         """
-        cache_key = f"{name}_{model}"
-        if cache_key in self.cache:
-            cached_item = self.cache[cache_key]
-            print(f"Cached item: {cached_item}")
-            # Update access count and timestamp
-            cached_item.access_count += 1
-            cached_item.last_accessed = datetime.utcnow()
-            self._save_data()
-            return cached_item.description, cached_item.upsell
-        return None
-    
-    def store_generated_description(self, request: FoodItemRequest, description: str, upsell: str):
+        cached_item = self.get_cached_entry(name, model)
+        if cached_item is None:
+            return None
+        return cached_item.description, cached_item.upsell
+    
+    def get_cached_descriptions(self, requests: List[FoodItemRequest]) -> Dict[str, Tuple[str, str]]:
+        """
+        Look up several food items in one pass
+        
+        Returns:
+            Dict of cache key -> (description, upsell) for the items that were cached
+        """
+        results: Dict[str, Tuple[str, str]] = {}
+        served = set()
+        stale = []
+        now = int(time.time())
+        with self._lock:
+            for request in requests:
+                request_key = cache_key(request.name, request.model)
+                if request_key in results:
+                    continue
+                found = self._lookup(request.name, request.model, now)
+                if found is None:
+                    continue
+                key, cached_item = found
+                if key not in served and self._is_stale(cached_item, now):
+                    stale.append(found)
+                served.add(key)
+                results[request_key] = (cached_item.description, cached_item.upsell)
+        if served:
+            self.backend.mark_dirty(*(f"cache:{key}" for key in served))
+        self._report_stale(stale)
+        return results
+    
+    def store_generated_description(self, request: FoodItemRequest, description: str, upsell: str, fallback: bool = False):
         """Store a newly generated description, handling regeneration"""
-        # Generate unique ID for this generation attempt
-        id = str(uuid.uuid4())
+        self.store_generated_descriptions([(request, description, upsell, fallback)])
+    
+    def store_generated_descriptions(self, generated: List[tuple]):
+        """
+        Store several newly generated descriptions with one history write
         
-        # Create history item
-        history_item = FoodItemHistory(
-            id=id,
-            name=request.name,
-            model=request.model,
-            description=description,
-            upsell=upsell
-        )
+        Each entry is ``(request, description, upsell)`` with an optional fourth
+        ``fallback`` flag. Fallbacks never replace a model generation in the cache.
+        """
+        history_records = []
+        cache_items = {}
+        now = int(time.time())
+        for request, description, upsell, *flags in generated:
+            # Generate unique ID for this generation attempt
+            id = uuid.uuid4()
+            
+            # Create history record
+            history_records.append(HistoryRecord(str(id), request.name, request.model, description, upsell, now))
+            
+            # Update cache with latest version
+            cache_items[cache_key(request.name, request.model)] = CacheRecord(
+                id.bytes,
+                request.name,
+                request.model,
+                description,
+                upsell,
+                created_at=now,
+                last_accessed=now,
+                fallback=bool(flags and flags[0])
+            )
         
-        # Store in main storage - append to list if multiple generations exist
-        if request.name not in self.storage:
-            self.storage[request.name] = []
-        self.storage[request.name].append(history_item)
+        # Append to the history log - one record per generation attempt, written
+        # on the backend's writer thread
+        self.backend.append_history(history_records)
+        # Fallbacks keep serving a model generation; shared backends write on their writer thread
+        with self._lock:
+            self.backend.store_cache(cache_items)
+            for key, cache_item in cache_items.items():
+                self._index_name(key, cache_item.model)
         
-        # Update cache with latest version
-        cache_key = f"{request.name}_{request.model}"
-        cache_item = FoodItemCache(
-            id=id,
-            name=request.name,
-            model=request.model,
-            description=description,
-            upsell=upsell
+        self.backend.mark_dirty(
+            *(f"storage:{record.name}" for record in history_records),
+            *(f"cache:{key}" for key in cache_items)
         )
-        self.cache[cache_key] = cache_item
-        
-        self._save_data()
-    
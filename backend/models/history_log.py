@@ -0,0 +1,311 @@
+import json
+import os
+import threading
+import uuid
+from typing import Dict, Iterator, List, Optional, Tuple
+from models.records import HistoryRecord
+from models.name_index import normalize_name
+from models.secondary_index import Ranking, TimeIndex
+
+
+class HistoryLog:
+    """
+    Append-only JSON-lines log of generation history.
+
+    Records are indexed by normalized name (see ``normalize_name``), so
+    spelling variants of a dish share one history. Each record carries the
+    byte offset of the previous record for the same normalized name, so the
+    in-memory index only needs ``name -> (latest offset, count)``.
+    The count is every generation ever recorded for the name; compaction drops
+    records past ``max_per_name`` from the chain but keeps the count.
+    The index is checkpointed next to the log, and startup only replays the
+    records appended after the last checkpoint.
+
+    Names ranked by generation count are kept in memory as well. Records by
+    ``created_at`` (overall and per model) are appended to ``.time`` files at
+    each checkpoint and searched memory-mapped, so only the records since the
+    last checkpoint cost memory per record.
+
+    Methods that take a name expect the normalized name.
+    """
+
+    # Header marker of logs whose chains link normalized names
+    NAMES = "normalized"
+    # Element types of a page cursor: (created_at epoch seconds, byte offset)
+    CURSOR_TYPES = (int, int)
+
+    def __init__(self, log_file: str, index_file: Optional[str] = None, max_per_name: int = 0):
+        self.log_file = log_file
+        self.index_file = index_file or f"{log_file}.idx"
+        self.max_per_name = max_per_name
+        self.index: Dict[str, Tuple[int, int]] = {}
+        self.total_records = 0
+        # Records within max_per_name of their name's newest, summed over names
+        self.retained_records = 0
+        self.by_time = TimeIndex(f"{log_file}.time")
+        self.by_generations = Ranking()
+        self._lock = threading.Lock()
+        self._checkpointed_size = 0
+        self._open()
+
+    def _open(self):
+        """Open the log, load the index checkpoint and replay the tail"""
+        if not os.path.exists(self.log_file) or os.path.getsize(self.log_file) == 0:
+            self.log_id = str(uuid.uuid4())
+            with open(self.log_file, 'wb') as f:
+                f.write(self._encode({"log_id": self.log_id, "names": self.NAMES}))
+
+        self._reader = open(self.log_file, 'rb')
+        header = json.loads(self._reader.readline())
+        self.log_id = header["log_id"]
+        # Logs written before names were normalized chain raw names until migrated
+        self._normalized = header.get("names") == self.NAMES
+        start = self._reader.tell()
+
+        checkpoint = self._read_checkpoint()
+        # Checkpoints written before the time files existed replay the whole log once
+        if checkpoint is not None and self.by_time.load(checkpoint.get("time_index")):
+            start = checkpoint["log_size"]
+            self.index = {name: tuple(entry) for name, entry in checkpoint["index"].items()}
+            self.total_records = checkpoint["total_records"]
+            self._checkpointed_size = start
+            for name, (_, count) in self.index.items():
+                self.by_generations.set(name, count)
+                self.retained_records += self._retained(count)
+        elif os.path.exists(f"{self.log_file}.cols"):
+            # Sidecar of the in-memory time index the files replace
+            os.remove(f"{self.log_file}.cols")
+
+        end = self._replay(start)
+        if end != os.path.getsize(self.log_file):
+            # Drop a torn record left by a crash mid-append
+            os.truncate(self.log_file, end)
+        self._writer = open(self.log_file, 'ab')
+        if not self._normalized:
+            self._migrate_names()
+
+    def _read_checkpoint(self) -> Optional[dict]:
+        """Return the saved index if it belongs to this log, None otherwise"""
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if checkpoint.get("log_id") != self.log_id:
+            return None
+        if checkpoint.get("log_size", 0) > os.path.getsize(self.log_file):
+            return None
+        return checkpoint
+
+    def _retained(self, count: int) -> int:
+        return min(count, self.max_per_name) if self.max_per_name else count
+
+    def _add_record(self, name: str, offset: int, record: HistoryRecord):
+        """Point the name's index entry at a new record and index it for history queries"""
+        count = self.index.get(name, (None, 0))[1] + 1
+        self.index[name] = (offset, count)
+        self.by_generations.set(name, count)
+        self.retained_records += self._retained(count) - self._retained(count - 1)
+        self.by_time.add(record.created_at, offset, record.model)
+        self.total_records += 1
+
+    def _replay(self, start: int) -> int:
+        """Fold records from ``start`` into the index, returning the end of the last good record"""
+        self._reader.seek(start)
+        offset = start
+        for line in self._reader:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = HistoryRecord.from_json(json.loads(line))
+            except (ValueError, KeyError):
+                break
+            name = normalize_name(record.name) if self._normalized else record.name
+            self._add_record(name, offset, record)
+            offset += len(line)
+        return offset
+
+    @staticmethod
+    def _encode(data: dict) -> bytes:
+        return json.dumps(data, ensure_ascii=False).encode('utf-8') + b"\n"
+
+    def _read_at(self, offset: int) -> Tuple[HistoryRecord, Optional[int]]:
+        """The record at ``offset`` and the offset of the name's previous record"""
+        self._reader.seek(offset)
+        data = json.loads(self._reader.readline())
+        return HistoryRecord.from_json(data), data["prev"]
+
+    def append(self, record: HistoryRecord):
+        """Append one history record for the normalized ``record.name``"""
+        self.append_many([record])
+
+    def append_many(self, records: List[HistoryRecord]):
+        """Append several history records with a single write"""
+        with self._lock:
+            offset = self._writer.tell()
+            chunks = []
+            for record in records:
+                name = normalize_name(record.name)
+                chunk = self._encode({**record.to_json(), "prev": self.index.get(name, (None, 0))[0]})
+                chunks.append(chunk)
+                self._add_record(name, offset, record)
+                offset += len(chunk)
+            self._writer.write(b"".join(chunks))
+            self._writer.flush()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def names(self) -> List[str]:
+        """Names that have at least one generation"""
+        return list(self.index)
+
+    def count(self, name: str) -> int:
+        """Number of generations recorded for a name"""
+        return self.index.get(name, (None, 0))[1]
+
+    def _walk(self, name: str) -> Iterator[Tuple[int, HistoryRecord]]:
+        """Yield ``(offset, record)`` for a name, newest first"""
+        offset = self.index.get(name, (None, 0))[0]
+        while offset is not None:
+            record, prev = self._read_at(offset)
+            yield offset, record
+            offset = prev
+
+    def latest(self, name: str) -> Optional[HistoryRecord]:
+        """Most recent record for a name"""
+        with self._lock:
+            for _, record in self._walk(name):
+                return record
+        return None
+
+    def history(self, name: str) -> List[HistoryRecord]:
+        """All retained records for a name, oldest first"""
+        with self._lock:
+            records = [record for _, record in self._walk(name)]
+        if self.max_per_name:
+            records = records[:self.max_per_name]
+        records.reverse()
+        return records
+
+    def page(
+        self,
+        model: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        cursor: Optional[Tuple[int, int]] = None,
+        limit: int = 50
+    ) -> Tuple[List[HistoryRecord], Optional[Tuple[int, int]]]:
+        """
+        Records newest first, optionally for one model and a ``created_at``
+        range (epoch seconds, inclusive), with the cursor for the next page
+        """
+        with self._lock:
+            offsets, next_cursor = self.by_time.page(model, since, until, cursor, limit)
+            records = [self._read_at(offset)[0] for offset in offsets]
+        return records, next_cursor
+
+    def top_names(self, limit: int = 10) -> List[Tuple[str, int]]:
+        """Names with the most generations, highest first"""
+        with self._lock:
+            return self.by_generations.top(limit)
+
+    def checkpoint(self):
+        """Persist the offset index so the next startup skips replaying the log"""
+        with self._lock:
+            self._writer.flush()
+            log_size = self._writer.tell()
+            if log_size == self._checkpointed_size:
+                return
+            # Time files first: rows past the checkpoint's counts are ignored on load
+            checkpoint = {
+                "log_id": self.log_id,
+                "log_size": log_size,
+                "total_records": self.total_records,
+                "index": dict(self.index),
+                "time_index": self.by_time.save()
+            }
+        tmp_path = f"{self.index_file}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_file)
+        self._checkpointed_size = log_size
+
+    def needs_compaction(self) -> bool:
+        """True when retention limits have left enough dead records to be worth rewriting"""
+        if not self.max_per_name:
+            return False
+        return self.total_records > 2 * self.retained_records
+
+    def compact(self):
+        """Rewrite the log with each name's records contiguous, keeping at most ``max_per_name``"""
+        with self._lock:
+            self._rewrite({name: [name] for name in self.index})
+        self.checkpoint()
+
+    def _migrate_names(self):
+        """Rewrite a log chained by raw names so spelling variants share one chain and count"""
+        groups: Dict[str, List[str]] = {}
+        for name in self.index:
+            groups.setdefault(normalize_name(name), []).append(name)
+        with self._lock:
+            self._rewrite(groups)
+        self.checkpoint()
+
+    def _rewrite(self, groups: Dict[str, List[str]]):
+        """Rewrite the log with the chains of each group's names merged under its key; caller holds the lock"""
+        log_id = str(uuid.uuid4())
+        tmp_path = f"{self.log_file}.tmp"
+        index: Dict[str, Tuple[int, int]] = {}
+        total = 0
+        rows = []
+        with open(tmp_path, 'wb') as out:
+            out.write(self._encode({"log_id": log_id, "names": self.NAMES}))
+            for key, names in groups.items():
+                # Oldest first across every chain in the group
+                walked = sorted((entry for name in names for entry in self._walk(name)), key=lambda entry: entry[0])
+                records = [record for _, record in walked]
+                if self.max_per_name:
+                    records = records[-self.max_per_name:]
+                prev = None
+                for record in records:
+                    offset = out.tell()
+                    out.write(self._encode({**record.to_json(), "prev": prev}))
+                    rows.append((record.created_at, offset, record.model))
+                    prev = offset
+                # Dropped records still count as generations
+                index[key] = (prev, sum(self.index[name][1] for name in names))
+                total += len(records)
+            out.flush()
+            os.fsync(out.fileno())
+
+        self._writer.close()
+        self._reader.close()
+        os.replace(tmp_path, self.log_file)
+        self._reader = open(self.log_file, 'rb')
+        self._writer = open(self.log_file, 'ab')
+        self.log_id = log_id
+        self._normalized = True
+        self.index = index
+        self.total_records = total
+        self._checkpointed_size = 0
+        self.by_time.clear()
+        # Sorted, so every insert is an append; the rewritten log is grouped by name
+        for created_at, offset, model in sorted(rows):
+            self.by_time.add(created_at, offset, model)
+        self.by_generations.clear()
+        self.retained_records = 0
+        for name, (_, count) in index.items():
+            self.by_generations.set(name, count)
+            self.retained_records += self._retained(count)
+
+    def close(self):
+        """Checkpoint the index and close the log"""
+        self.checkpoint()
+        with self._lock:
+            self._writer.close()
+            self._reader.close()
+            self.by_time.close()
@@ -0,0 +1,136 @@
+import math
+import re
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+_NON_WORD = re.compile(r"[^a-z0-9\s]+")
+
+# Words that end in "s" but are not plurals
+_KEEP_S = ("ss", "us", "is")
+
+# Singulars the suffix rules below would cut short (cookies -> cooky, quiches -> quich)
+_E_SINGULARS = frozenset({
+    "brioche", "brownie", "ceviche", "cookie", "hoagie", "pie", "quiche", "smoothie", "veggie",
+})
+
+# Words naming a size or portion: "Pizza XL" is a different item from "Pizza",
+# however close the spelling
+_SIZE_WORDS = frozenset({
+    "double", "family", "full", "half", "jumbo", "kid", "large", "lg", "medium", "mini", "personal",
+    "regular", "single", "small", "sm", "triple", "xl", "xxl",
+})
+
+def singularize(word: str) -> str:
+    """Strip simple English plural endings (tacos -> taco, berries -> berry, dishes -> dish)"""
+    if word.endswith("s") and word[:-1] in _E_SINGULARS:
+        return word[:-1]
+    if len(word) <= 3:
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("ches", "shes", "sses", "xes", "zes", "oes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(_KEEP_S):
+        return word[:-1]
+    return word
+
+def normalize_name(name: str) -> str:
+    """Canonical form of a food item name: case, punctuation, spacing, plurals and word order"""
+    words = _NON_WORD.sub(" ", name.lower()).split()
+    return " ".join(sorted(singularize(word) for word in words))
+
+def cache_key(name: str, model: str) -> str:
+    """Key used for the description cache, so spelling variants of a dish share one entry"""
+    return f"{normalize_name(name)}_{model}"
+
+def split_key(key: str) -> Tuple[str, str]:
+    """``(normalized name, model)`` of a cache key; normalized names never contain underscores"""
+    normalized, _, model = key.rpartition("_")
+    return normalized, model
+
+def variant_words(normalized_name: str) -> FrozenSet[str]:
+    """Words of a normalized name that tell sizes and portions apart: size words and anything with a digit"""
+    return frozenset(
+        word for word in normalized_name.split()
+        if word in _SIZE_WORDS or any(char.isdigit() for char in word)
+    )
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """Character trigrams of a normalized name, padded so short names still match"""
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+class NameIndex:
+    """
+    Near-duplicate lookup over normalized names using character trigrams.
+
+    Candidates are found with prefix filtering: a name with Jaccard similarity
+    >= t to the query must share one of the query's rarest
+    ``|q| - ceil(t * |q|) + 1`` trigrams, so only those short posting lists are
+    read. Candidates are then length-filtered and verified with exact Jaccard.
+    Names that differ in their size or portion words (``variant_words``) never
+    match, so "Pepperoni Pizza XL" is not served "Pepperoni Pizza".
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Set[str]] = {}
+        self._grams: Dict[str, FrozenSet[str]] = {}
+        # Only names that have variant words are listed
+        self._variants: Dict[str, FrozenSet[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._grams)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._grams
+
+    def add(self, key: str, normalized_name: str):
+        """Index ``key`` under its normalized name"""
+        if key in self._grams:
+            return
+        grams = trigrams(normalized_name)
+        self._grams[key] = grams
+        variants = variant_words(normalized_name)
+        if variants:
+            self._variants[key] = variants
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key: str):
+        grams = self._grams.pop(key, None)
+        if grams is None:
+            return
+        self._variants.pop(key, None)
+        for gram in grams:
+            members = self._postings.get(gram)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del self._postings[gram]
+
+    def best_match(self, normalized_name: str, threshold: float) -> Optional[Tuple[str, float]]:
+        """Most similar indexed key with Jaccard similarity >= threshold, if any"""
+        grams = trigrams(normalized_name)
+        variants = variant_words(normalized_name)
+        size = len(grams)
+        prefix = size - math.ceil(threshold * size) + 1
+        rarest = sorted(grams, key=lambda gram: len(self._postings.get(gram, ())))[:prefix]
+
+        candidates: Set[str] = set()
+        for gram in rarest:
+            members = self._postings.get(gram)
+            if members:
+                candidates |= members
+
+        min_size, max_size = threshold * size, size / threshold
+        best: Optional[Tuple[str, float]] = None
+        for key in candidates:
+            other = self._grams[key]
+            if not min_size <= len(other) <= max_size:
+                continue
+            if self._variants.get(key, frozenset()) != variants:
+                continue
+            shared = len(grams & other)
+            score = shared / (size + len(other) - shared)
+            if score >= threshold and (best is None or score > best[1]):
+                best = (key, score)
+        return best
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from typing import Any, Callable, List, Optional, Set, Tuple
+from utils.metrics import PERSISTENCE_BACKPRESSURE
+
+
+def atomic_write_json(path: str, data: Any):
+    """Write JSON to a temp file in the same directory and rename it over the target"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _resolve(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class WriteBehindFlusher:
+    """
+    Runs persistence on one background thread, off the event loop.
+
+    Write jobs (``submit``) run in order from a bounded queue; a full queue is
+    backpressure, so async callers should ``await wait_for_capacity()`` first.
+    Between jobs, dirty records are flushed in batches every ``interval``
+    seconds or once ``max_dirty`` keys are pending.
+    """
+
+    def __init__(
+        self,
+        flush_fn: Optional[Callable[[Set[str]], None]] = None,
+        interval: float = 5.0,
+        max_dirty: int = 100,
+        max_queue: int = 1000
+    ):
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_dirty = max_dirty
+        self._jobs: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max_queue)
+        self._dirty: Set[str] = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        # Coroutines in wait_for_capacity, woken from the thread when it takes a job
+        self._capacity_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._thread = threading.Thread(target=self._run, name="write-behind-flusher", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn: Callable[..., Any], *args: Any):
+        """Queue a write job; blocks while the queue is full"""
+        if self._stopped.is_set():
+            # Closed: nothing will run the queue any more
+            fn(*args)
+            return
+        if self._jobs.full():
+            PERSISTENCE_BACKPRESSURE.inc()
+        self._jobs.put((fn, args))
+
+    def try_submit(self, fn: Callable[..., Any], *args: Any) -> bool:
+        """Queue a write job if there is room; False if the caller should write it itself"""
+        if self._stopped.is_set():
+            return False
+        try:
+            self._jobs.put_nowait((fn, args))
+        except queue.Full:
+            PERSISTENCE_BACKPRESSURE.inc()
+            return False
+        return True
+
+    def has_capacity(self) -> bool:
+        return not self._jobs.full()
+
+    async def wait_for_capacity(self):
+        """Wait, without blocking the event loop, until a job can be queued without blocking"""
+        if self.has_capacity():
+            return
+        PERSISTENCE_BACKPRESSURE.inc()
+        loop = asyncio.get_running_loop()
+        while not self.has_capacity() and not self._stopped.is_set():
+            waiter = loop.create_future()
+            with self._lock:
+                self._capacity_waiters.append((loop, waiter))
+            # The thread may have taken a job before the waiter was listed
+            if self.has_capacity():
+                return
+            await waiter
+
+    def _wake_capacity_waiters(self):
+        """Resolve every wait_for_capacity waiter on its own loop; called from the thread"""
+        with self._lock:
+            if not self._capacity_waiters:
+                return
+            waiters, self._capacity_waiters = self._capacity_waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, waiter)
+            except RuntimeError:
+                # Its loop has closed
+                pass
+
+    def drain(self):
+        """Block until every queued write job has run"""
+        if self._thread.is_alive() and threading.current_thread() is not self._thread:
+            self._jobs.join()
+
+    def mark_dirty(self, *keys: str):
+        """Record that keys changed; wakes the flusher once the size threshold is hit"""
+        with self._lock:
+            self._dirty.update(keys)
+            if len(self._dirty) >= self.max_dirty and not self._wakeup.is_set():
+                self._wakeup.set()
+                self._nudge()
+
+    def _nudge(self):
+        """Wake the thread if it is idle; a full queue means it is busy anyway"""
+        if self._stopped.is_set():
+            return
+        try:
+            self._jobs.put_nowait(None)
+        except queue.Full:
+            pass
+
+    @property
+    def pending(self) -> int:
+        """Number of dirty keys waiting to be flushed"""
+        with self._lock:
+            return len(self._dirty)
+
+    def flush(self):
+        """Run queued write jobs, then flush every dirty key now"""
+        self.drain()
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+            if not dirty or self.flush_fn is None:
+                return
+            try:
+                self.flush_fn(dirty)
+            except Exception as e:
+                print(f"Error flushing data: {e}")
+                # Keep the keys dirty so the next cycle retries them
+                with self._lock:
+                    self._dirty |= dirty
+
+    def _run_job(self, job: tuple):
+        fn, args = job
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"Error writing data: {e}")
+
+    def _run(self):
+        deadline = time.monotonic() + self.interval
+        while True:
+            try:
+                job = self._jobs.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                job = None
+            else:
+                self._wake_capacity_waiters()
+                if job is not None:
+                    self._run_job(job)
+                self._jobs.task_done()
+            if self._stopped.is_set() and self._jobs.empty():
+                return
+            if self._wakeup.is_set() or time.monotonic() >= deadline:
+                self._wakeup.clear()
+                self.flush()
+                deadline = time.monotonic() + self.interval
+
+    def close(self):
+        """Stop the background thread after running queued jobs, and flush anything still pending"""
+        self._stopped.set()
+        self._jobs.put(None)
+        self._thread.join()
+        # Submitting now writes inline, so nobody needs to wait for room
+        self._wake_capacity_waiters()
+        # Jobs that raced with shutdown run here
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                self._run_job(job)
+            self._jobs.task_done()
+        self.flush()
@@ -0,0 +1,172 @@
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Optional, Union
+from schemas.food_item import FoodItemCache, FoodItemHistory
+
+def to_timestamp(value: Union[datetime, str]) -> int:
+    """Whole seconds since the epoch for a datetime or its ISO string; naive values are taken as UTC"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.astimezone(timezone.utc).timestamp())
+
+def from_timestamp(value: int) -> datetime:
+    """Naive UTC datetime, as used by the Pydantic schemas"""
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+
+def pack_id(value: Optional[str]) -> Union[bytes, str, None]:
+    """UUIDs are kept as their 16 raw bytes; anything else is kept as given"""
+    if not value:
+        return None
+    try:
+        return uuid.UUID(value).bytes
+    except ValueError:
+        return value
+
+def unpack_id(value: Union[bytes, str, None]) -> Optional[str]:
+    if isinstance(value, bytes):
+        return str(uuid.UUID(bytes=value))
+    return value
+
+class HistoryRecord:
+    """
+    One generation in the history, as appended to and read back from the log.
+
+    Slotted like CacheRecord, with an integer timestamp, the id as raw UUID
+    bytes and an interned model name; converted to FoodItemHistory only at
+    the API boundary.
+    """
+
+    __slots__ = ("id", "name", "model", "description", "upsell", "created_at", "usage_count")
+
+    def __init__(
+        self,
+        id: Union[bytes, str, None],
+        name: str,
+        model: str,
+        description: str,
+        upsell: str,
+        created_at: int,
+        usage_count: int = 1
+    ):
+        self.id = pack_id(id) if isinstance(id, str) else id
+        self.name = name
+        self.model = sys.intern(model)
+        self.description = description
+        self.upsell = upsell
+        self.created_at = created_at
+        self.usage_count = usage_count
+
+    @classmethod
+    def from_json(cls, data) -> "HistoryRecord":
+        """Read a record in the FoodItemHistory JSON layout (a dict or a row with the same columns)"""
+        return cls(
+            data["id"],
+            data["name"],
+            data["model"],
+            data["description"],
+            data["upsell"],
+            to_timestamp(data["created_at"]),
+            data["usage_count"]
+        )
+
+    def to_json(self) -> dict:
+        """The record in the FoodItemHistory JSON layout"""
+        return {
+            "id": unpack_id(self.id),
+            "name": self.name,
+            "model": self.model,
+            "description": self.description,
+            "upsell": self.upsell,
+            "created_at": from_timestamp(self.created_at).isoformat(),
+            "usage_count": self.usage_count,
+        }
+
+    def to_schema(self) -> FoodItemHistory:
+        return FoodItemHistory(**self.to_json())
+
+class CacheRecord:
+    """
+    In-memory description cache entry.
+
+    Slotted, with integer timestamps, the id as raw UUID bytes and interned
+    model names; converted to FoodItemCache only at the API boundary.
+    """
+
+    __slots__ = (
+        "id", "name", "model", "description", "upsell",
+        "created_at", "last_accessed", "access_count", "fallback", "_fragment"
+    )
+
+    def __init__(
+        self,
+        id: Union[bytes, str, None],
+        name: str,
+        model: str,
+        description: str,
+        upsell: str,
+        created_at: Optional[int] = None,
+        last_accessed: Optional[int] = None,
+        access_count: int = 1,
+        fallback: bool = False
+    ):
+        now = int(time.time())
+        self.id = pack_id(id) if isinstance(id, str) else id
+        self.name = name
+        self.model = sys.intern(model)
+        self.description = description
+        self.upsell = upsell
+        self.created_at = now if created_at is None else created_at
+        self.last_accessed = now if last_accessed is None else last_accessed
+        self.access_count = access_count
+        self.fallback = fallback
+        self._fragment: Optional[bytes] = None
+
+    @classmethod
+    def from_json(cls, data: dict) -> "CacheRecord":
+        """Read an entry in the FoodItemCache JSON layout used by the cache file"""
+        last_accessed = to_timestamp(data["last_accessed"])
+        created_at = data.get("created_at")
+        return cls(
+            data.get("id"),
+            data["name"],
+            data["model"],
+            data["description"],
+            data["upsell"],
+            # Entries written before generation times were tracked count from their last access
+            created_at=to_timestamp(created_at) if created_at else last_accessed,
+            last_accessed=last_accessed,
+            access_count=data.get("access_count", 1),
+            fallback=bool(data.get("fallback", False))
+        )
+
+    def to_json(self) -> dict:
+        """The entry in the FoodItemCache JSON layout"""
+        return {
+            "id": unpack_id(self.id),
+            "name": self.name,
+            "model": self.model,
+            "description": self.description,
+            "upsell": self.upsell,
+            "created_at": from_timestamp(self.created_at).isoformat(),
+            "fallback": self.fallback,
+            "last_accessed": from_timestamp(self.last_accessed).isoformat(),
+            "access_count": self.access_count,
+        }
+
+    def to_schema(self) -> FoodItemCache:
+        return FoodItemCache(**self.to_json())
+
+    def response_fragment(self) -> bytes:
+        """``"description":...,"upsell":...`` as JSON bytes, ready to splice into a response"""
+        if self._fragment is None:
+            self._fragment = json.dumps(
+                {"description": self.description, "upsell": self.upsell},
+                ensure_ascii=False,
+                separators=(",", ":")
+            )[1:-1].encode("utf-8")
+        return self._fragment
@@ -0,0 +1,334 @@
+import heapq
+import mmap
+import os
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+# Bytes per row of a mapped time-index file: created_at and ref as int64
+ROW_BYTES = 16
+
+
+# Time-index entry: (created_at, ref)
+Entry = Tuple[int, int]
+
+
+def _newest(
+    created: Sequence[int],
+    refs: Sequence[int],
+    since: Optional[int],
+    until: Optional[int],
+    cursor: Optional[Entry],
+    limit: int
+) -> List[Entry]:
+    """Up to ``limit`` entries of sorted columns in the range and before the cursor, newest first"""
+    lo = bisect_left(created, since) if since is not None else 0
+    hi = bisect_right(created, until) if until is not None else len(created)
+    if cursor is not None:
+        # Strictly older than the last record of the previous page
+        start = bisect_left(created, cursor[0])
+        end = bisect_right(created, cursor[0], start)
+        hi = min(hi, bisect_left(refs, cursor[1], start, end))
+    return [(created[i], refs[i]) for i in range(hi - 1, max(lo, hi - limit) - 1, -1)]
+
+
+class _Column:
+    """Parallel ``created_at`` / ``ref`` arrays kept sorted by ``(created_at, ref)``"""
+
+    def __init__(self):
+        self.created = array("q")
+        self.refs = array("q")
+
+    def __len__(self) -> int:
+        return len(self.created)
+
+    def add(self, created_at: int, ref: int):
+        n = len(self.created)
+        if not n or (created_at, ref) >= (self.created[-1], self.refs[-1]):
+            self.created.append(created_at)
+            self.refs.append(ref)
+            return
+        # Out of order (clock skew, imported history): insert in place
+        lo = bisect_left(self.created, created_at)
+        hi = bisect_right(self.created, created_at, lo)
+        i = bisect_left(self.refs, ref, lo, hi)
+        self.created.insert(i, created_at)
+        self.refs.insert(i, ref)
+
+    def entries(self) -> Iterator[Entry]:
+        return zip(self.created, self.refs)
+
+    def newest(self, since: Optional[int], until: Optional[int], cursor: Optional[Entry], limit: int) -> List[Entry]:
+        return _newest(self.created, self.refs, since, until, cursor, limit)
+
+
+class _Field:
+    """One field of a mapped column's rows as a read-only sequence, so bisect can search it in place"""
+
+    __slots__ = ("column", "field")
+
+    def __init__(self, column: "_MappedColumn", field: int):
+        self.column = column
+        self.field = field
+
+    def __len__(self) -> int:
+        return self.column.count
+
+    def __getitem__(self, i: int) -> int:
+        return self.column.values[2 * i + self.field]
+
+
+class _MappedColumn:
+    """
+    Entries in a file of native int64 ``(created_at, ref)`` pairs sorted by
+    both, memory-mapped so they cost no heap. The file is only appended to;
+    rows past ``count`` are left by a crash and dropped on the next append.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self.values: Optional[memoryview] = None
+        self._map: Optional[mmap.mmap] = None
+        self.created = _Field(self, 0)
+        self.refs = _Field(self, 1)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def open(self, count: int) -> bool:
+        """Map the first ``count`` rows; False if the file is shorter than that"""
+        self.close()
+        size = count * ROW_BYTES
+        try:
+            if os.path.getsize(self.path) < size:
+                return False
+        except OSError:
+            return count == 0
+        self.count = count
+        if count:
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            self.values = memoryview(self._map).cast("q")
+        return True
+
+    def last(self) -> Optional[Entry]:
+        if not self.count:
+            return None
+        return self.values[2 * self.count - 2], self.values[2 * self.count - 1]
+
+    def append(self, entries: List[Entry]):
+        """Write entries that sort after ``last()`` and map them"""
+        rows = array("q")
+        for created_at, ref in entries:
+            rows.append(created_at)
+            rows.append(ref)
+        count = self.count + len(entries)
+        self.close()
+        with open(self.path, "ab") as f:
+            f.truncate((count - len(entries)) * ROW_BYTES)
+            f.write(rows.tobytes())
+        self.open(count)
+
+    def newest(self, since: Optional[int], until: Optional[int], cursor: Optional[Entry], limit: int) -> List[Entry]:
+        if not self.count:
+            return []
+        return _newest(self.created, self.refs, since, until, cursor, limit)
+
+    def close(self):
+        if self._map is not None:
+            self.values.release()
+            self._map.close()
+        self.values = None
+        self._map = None
+        self.count = 0
+
+
+class TimeIndex:
+    """
+    Record references ordered by ``created_at``, overall and per model.
+
+    Pages run newest first; the cursor is the ``(created_at, ref)`` of the last
+    record returned, so pages stay stable while new records arrive. Every
+    query is a few binary searches plus ``limit`` reads.
+
+    Entries saved by ``save`` live in files named after ``path`` (one for all
+    models, one per model) and are searched memory-mapped; only entries added
+    since the last save are held in memory. An entry older than its file's
+    last row cannot be appended (clock skew), so it stays in memory and in the
+    saved state until the index is rebuilt.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Model of each per-model file, by file number
+        self._models: List[str] = []
+        # None is the column of every model
+        self._saved: Dict[Optional[str], _MappedColumn] = {None: _MappedColumn(path)}
+        self._added: Dict[Optional[str], _Column] = {}
+
+    def __len__(self) -> int:
+        added = self._added.get(None)
+        return len(self._saved[None]) + (len(added) if added is not None else 0)
+
+    def _saved_column(self, model: str) -> _MappedColumn:
+        column = self._saved.get(model)
+        if column is None:
+            self._models.append(model)
+            column = self._saved[model] = _MappedColumn(f"{self.path}.{len(self._models) - 1}")
+        return column
+
+    def _add_to(self, key: Optional[str], created_at: int, ref: int):
+        column = self._added.get(key)
+        if column is None:
+            column = self._added[key] = _Column()
+        column.add(created_at, ref)
+
+    def add(self, created_at: int, ref: int, model: str):
+        self._saved_column(model)
+        self._add_to(None, created_at, ref)
+        self._add_to(model, created_at, ref)
+
+    def load(self, state: Optional[dict]) -> bool:
+        """Map the files as of a ``save``; False, leaving the index empty, if they do not match it"""
+        self.clear()
+        if not state:
+            return False
+        try:
+            for model in state["models"]:
+                self._saved_column(model)
+            keys = [None, *self._models]
+            ok = len(keys) == len(state["rows"]) and all(
+                self._saved[key].open(count) for key, count in zip(keys, state["rows"])
+            )
+            if ok:
+                for created_at, ref, key in state["unsaved"]:
+                    self._add_to(key, created_at, ref)
+        except (KeyError, TypeError, ValueError, OSError):
+            ok = False
+        if not ok:
+            self.clear()
+        return ok
+
+    def save(self) -> dict:
+        """Append entries added since the last save to the files; returns the state ``load`` takes"""
+        unsaved = []
+        for key, column in self._added.items():
+            saved = self._saved[key]
+            last = saved.last()
+            entries = list(column.entries())
+            # Entries older than the file's end cannot be appended
+            split = 0
+            while last is not None and split < len(entries) and entries[split] < last:
+                split += 1
+            if split < len(entries):
+                saved.append(entries[split:])
+            unsaved.extend((created_at, ref, key) for created_at, ref in entries[:split])
+        self._added = {}
+        for created_at, ref, key in unsaved:
+            self._add_to(key, created_at, ref)
+        return {
+            "models": list(self._models),
+            "rows": [len(self._saved[key]) for key in (None, *self._models)],
+            "unsaved": unsaved,
+        }
+
+    def clear(self):
+        """Forget every entry; the files are overwritten by the next save"""
+        for column in self._saved.values():
+            column.close()
+        self._models = []
+        self._saved = {None: _MappedColumn(self.path)}
+        self._added = {}
+
+    def close(self):
+        for column in self._saved.values():
+            column.close()
+
+    def models(self) -> List[str]:
+        return list(self._models)
+
+    def page(
+        self,
+        model: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        cursor: Optional[Entry] = None,
+        limit: int = 50
+    ) -> Tuple[List[int], Optional[Entry]]:
+        """Refs of up to ``limit`` records with ``since <= created_at <= until``, and the next cursor"""
+        columns = [column for column in (self._saved.get(model), self._added.get(model)) if column is not None]
+        # One more than a page tells whether there is a next one
+        entries = list(islice(
+            heapq.merge(*(column.newest(since, until, cursor, limit + 1) for column in columns), reverse=True),
+            limit + 1
+        ))
+        refs = [ref for _, ref in entries[:limit]]
+        next_cursor = entries[limit - 1] if refs and len(entries) > limit else None
+        return refs, next_cursor
+
+
+class Ranking:
+    """
+    Keys ranked by a count, for top-K queries.
+
+    Keys sit in per-count buckets (like LFUPolicy), so updates are O(1) plus a
+    binary search over the distinct counts, and a top-K walks only as many
+    buckets as it needs. Ties keep insertion order.
+    """
+
+    def __init__(self):
+        self._counts: Dict[Hashable, int] = {}
+        self._buckets: Dict[int, Dict[Hashable, None]] = {}
+        # Distinct counts, ascending
+        self._levels: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def __contains__(self, key) -> bool:
+        return key in self._counts
+
+    def get(self, key: Hashable) -> int:
+        return self._counts.get(key, 0)
+
+    def remove(self, key: Hashable):
+        count = self._counts.pop(key, None)
+        if count is None:
+            return
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+            del self._levels[bisect_left(self._levels, count)]
+
+    def set(self, key: Hashable, count: int):
+        if self._counts.get(key) == count:
+            return
+        self.remove(key)
+        self._counts[key] = count
+        bucket = self._buckets.get(count)
+        if bucket is None:
+            bucket = self._buckets[count] = {}
+            insort(self._levels, count)
+        bucket[key] = None
+
+    def increment(self, key: Hashable, amount: int = 1):
+        self.set(key, self._counts.get(key, 0) + amount)
+
+    def clear(self):
+        self._counts.clear()
+        self._buckets.clear()
+        self._levels.clear()
+
+    def top(self, k: int, accept: Optional[Callable[[Hashable], bool]] = None) -> List[Tuple[Hashable, int]]:
+        """The ``k`` highest-counted keys (optionally only those ``accept`` allows), highest first"""
+        result: List[Tuple[Hashable, int]] = []
+        for count in reversed(self._levels):
+            for key in self._buckets[count]:
+                if accept is None or accept(key):
+                    result.append((key, count))
+                    if len(result) >= k:
+                        return result
+        return result
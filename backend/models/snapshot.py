@@ -0,0 +1,212 @@
+import mmap
+import os
+import struct
+from typing import Iterable, Iterator, Tuple, Union
+from models.records import CacheRecord
+
+MAGIC = b"FICACHE\0"
+VERSION = 1
+
+HEADER = struct.Struct("<8sHxxIQ")
+# created_at, last_accessed, access_count, flags, then byte lengths of
+# id, name, model, description and upsell
+RECORD = struct.Struct("<qqIBBHBII")
+# record offset, record length, last_accessed, access_count, key length
+INDEX_ENTRY = struct.Struct("<QIqIH")
+
+FLAG_FALLBACK = 1
+# The id is free text rather than 16 raw UUID bytes
+FLAG_TEXT_ID = 2
+
+class SnapshotEntry:
+    """A cache entry that is still in the snapshot; enough to order and size it without decoding"""
+
+    __slots__ = ("snapshot", "offset", "length", "last_accessed", "access_count")
+
+    def __init__(self, snapshot: "CacheSnapshot", offset: int, length: int, last_accessed: int, access_count: int):
+        self.snapshot = snapshot
+        self.offset = offset
+        self.length = length
+        self.last_accessed = last_accessed
+        self.access_count = access_count
+
+    def raw(self) -> bytes:
+        return self.snapshot.read(self.offset, self.length)
+
+    def load(self) -> CacheRecord:
+        return decode_record(self.snapshot.read(self.offset, self.length))
+
+def encode_record(record: CacheRecord, last_accessed: int, access_count: int) -> bytes:
+    flags = FLAG_FALLBACK if record.fallback else 0
+    id_bytes = record.id or b""
+    if isinstance(id_bytes, str):
+        id_bytes = id_bytes.encode("utf-8")
+        flags |= FLAG_TEXT_ID
+    name = record.name.encode("utf-8")
+    model = record.model.encode("utf-8")
+    description = record.description.encode("utf-8")
+    upsell = record.upsell.encode("utf-8")
+    return b"".join((
+        RECORD.pack(
+            record.created_at, last_accessed, access_count, flags,
+            len(id_bytes), len(name), len(model), len(description), len(upsell)
+        ),
+        id_bytes, name, model, description, upsell
+    ))
+
+def decode_record(data: bytes) -> CacheRecord:
+    (created_at, last_accessed, access_count, flags,
+     id_length, name_length, model_length, description_length, upsell_length) = RECORD.unpack_from(data)
+    fields = []
+    position = RECORD.size
+    for length in (id_length, name_length, model_length, description_length, upsell_length):
+        fields.append(data[position:position + length])
+        position += length
+    id_bytes, name, model, description, upsell = fields
+    if flags & FLAG_TEXT_ID:
+        id_bytes = id_bytes.decode("utf-8")
+    return CacheRecord(
+        id_bytes or None,
+        name.decode("utf-8"),
+        model.decode("utf-8"),
+        description.decode("utf-8"),
+        upsell.decode("utf-8"),
+        created_at=created_at,
+        last_accessed=last_accessed,
+        access_count=access_count,
+        fallback=bool(flags & FLAG_FALLBACK)
+    )
+
+class CacheSnapshot:
+    """
+    Versioned binary snapshot of the description cache.
+
+    Layout (little-endian): a header with magic, version, entry count and index
+    offset; one packed record per entry, oldest access first; then the index,
+    holding each record's offset and length, last_accessed, access_count and
+    cache key. Opening a snapshot memory-maps the file and reads only the
+    index; a record is decoded the first time its key is used.
+
+    Changes made after a snapshot is written are appended to a delta segment
+    (``append_delta``) and replayed over it on load, so a flush only writes
+    the entries that changed; the snapshot is rewritten once the delta grows.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self._index_offset = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a cache snapshot")
+        if version != VERSION:
+            raise ValueError(f"Unsupported cache snapshot version {version} in {path}")
+        if self._index_offset > len(self._map):
+            raise ValueError(f"Cache snapshot {path} is truncated")
+
+    def entries(self) -> Iterator[Tuple[str, SnapshotEntry]]:
+        """``(key, entry)`` for every record, oldest access first, without decoding records"""
+        position = self._index_offset
+        for _ in range(self.count):
+            offset, length, last_accessed, access_count, key_length = INDEX_ENTRY.unpack_from(self._map, position)
+            position += INDEX_ENTRY.size
+            key = self._map[position:position + key_length].decode("utf-8")
+            position += key_length
+            yield key, SnapshotEntry(self, offset, length, last_accessed, access_count)
+
+    def read(self, offset: int, length: int) -> bytes:
+        return self._map[offset:offset + length]
+
+    def close(self):
+        self._map.close()
+
+def write_snapshot(path: str, entries: Iterable[Tuple[str, Union[CacheRecord, SnapshotEntry], int, int]]):
+    """
+    Atomically write a snapshot from ``(key, entry, last_accessed, access_count)``
+    tuples (see BoundedCache.raw_items). Entries still in an older snapshot are
+    copied as raw bytes instead of being decoded and re-encoded.
+    """
+    tmp_path = f"{path}.tmp"
+    index = []
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        offset = HEADER.size
+        for key, item, last_accessed, access_count in sorted(entries, key=lambda entry: entry[2]):
+            data = item.raw() if isinstance(item, SnapshotEntry) else encode_record(item, last_accessed, access_count)
+            f.write(data)
+            key_bytes = key.encode("utf-8")
+            index.append(INDEX_ENTRY.pack(offset, len(data), last_accessed, access_count, len(key_bytes)))
+            index.append(key_bytes)
+            offset += len(data)
+        f.write(b"".join(index))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, len(index) // 2, offset))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+DELTA_MAGIC = b"FIDELTA\0"
+DELTA_HEADER = struct.Struct("<8sH")
+# record length (0 for a removed key), last_accessed, access_count, key length
+DELTA_ENTRY = struct.Struct("<IqIH")
+
+def append_delta(path: str, entries: Iterable[Tuple[str, Union[CacheRecord, SnapshotEntry, None], int, int]]) -> int:
+    """
+    Append changed entries to the snapshot's delta segment, as
+    ``(key, entry or None if removed, last_accessed, access_count)`` tuples.
+    Returns the size of the segment afterwards.
+    """
+    chunks = []
+    for key, item, last_accessed, access_count in entries:
+        if item is None:
+            data = b""
+        elif isinstance(item, SnapshotEntry):
+            data = item.raw()
+        else:
+            data = encode_record(item, last_accessed, access_count)
+        key_bytes = key.encode("utf-8")
+        chunks.append(DELTA_ENTRY.pack(len(data), last_accessed, access_count, len(key_bytes)))
+        chunks.append(key_bytes)
+        chunks.append(data)
+    with open(path, "ab") as f:
+        if f.tell() == 0:
+            f.write(DELTA_HEADER.pack(DELTA_MAGIC, VERSION))
+        f.write(b"".join(chunks))
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+def read_delta(path: str) -> Iterator[Tuple[str, Union[CacheRecord, None]]]:
+    """
+    ``(key, record or None if removed)`` for every complete delta entry, oldest
+    first. A torn entry left by a crash mid-append is cut off the file.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return
+    if len(data) < DELTA_HEADER.size:
+        if data:
+            os.truncate(path, 0)
+        return
+    magic, version = DELTA_HEADER.unpack_from(data, 0)
+    if magic != DELTA_MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a cache snapshot delta")
+    position = DELTA_HEADER.size
+    while position + DELTA_ENTRY.size <= len(data):
+        length, last_accessed, access_count, key_length = DELTA_ENTRY.unpack_from(data, position)
+        end = position + DELTA_ENTRY.size + key_length + length
+        if end > len(data):
+            break
+        key_start = position + DELTA_ENTRY.size
+        key = data[key_start:key_start + key_length].decode("utf-8")
+        record = None
+        if length:
+            record = decode_record(data[key_start + key_length:end])
+            record.last_accessed = last_accessed
+            record.access_count = access_count
+        yield key, record
+        position = end
+    if position != len(data):
+        os.truncate(path, position)
@@ -0,0 +1,545 @@
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+import copy
+import os
+import sqlite3
+import threading
+import time
+from models.records import CacheRecord, HistoryRecord, from_timestamp, to_timestamp, unpack_id
+from models.persistence import WriteBehindFlusher
+from models.storage_backend import StorageBackend, cache_settings, history_retention
+from models.name_index import normalize_name
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    id TEXT,
+    name TEXT NOT NULL,
+    model TEXT NOT NULL,
+    description TEXT NOT NULL,
+    upsell TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    fallback INTEGER NOT NULL DEFAULT 0,
+    last_accessed TEXT NOT NULL,
+    access_count INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS cache_last_accessed ON cache (last_accessed);
+CREATE INDEX IF NOT EXISTS cache_access_count ON cache (access_count, last_accessed);
+CREATE TABLE IF NOT EXISTS history (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT,
+    name TEXT NOT NULL,
+    name_key TEXT,
+    model TEXT NOT NULL,
+    description TEXT NOT NULL,
+    upsell TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    usage_count INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS history_created ON history (created_at, seq);
+CREATE INDEX IF NOT EXISTS history_model_created ON history (model, created_at, seq);
+-- Generations per normalized name, including records dropped by compaction
+CREATE TABLE IF NOT EXISTS history_names (
+    name TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_names_count ON history_names (count);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+CACHE_COLUMNS = ("id", "name", "model", "description", "upsell", "created_at", "fallback", "last_accessed", "access_count")
+HISTORY_COLUMNS = ("id", "name", "model", "description", "upsell", "created_at", "usage_count")
+
+# Text size of a cache row, as counted against max_bytes
+ROW_SIZE_SQL = "LENGTH(name) + LENGTH(model) + LENGTH(description) + LENGTH(upsell)"
+
+# Victim order per eviction policy
+EVICTION_ORDER = {
+    "lru": "last_accessed",
+    "lfu": "access_count, last_accessed",
+}
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open a WAL-mode connection that several worker processes can share"""
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+class SQLiteStore:
+    """Serialises one process's access to the shared database connection"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = connect(path)
+        self._lock = threading.Lock()
+        with self._lock:
+            self.conn.executescript(SCHEMA)
+            self._migrate()
+
+    def _migrate(self):
+        """Bring databases created by older versions up to the current schema"""
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(cache)")}
+        if "created_at" not in columns:
+            self.conn.execute("ALTER TABLE cache ADD COLUMN created_at TEXT")
+            self.conn.execute("UPDATE cache SET created_at = last_accessed")
+        if "fallback" not in columns:
+            self.conn.execute("ALTER TABLE cache ADD COLUMN fallback INTEGER NOT NULL DEFAULT 0")
+        # Running cache totals, so eviction never has to count or measure the table
+        self.conn.execute("INSERT OR IGNORE INTO counters (name, value) SELECT 'entries', COUNT(*) FROM cache")
+        self.conn.execute(
+            f"INSERT OR IGNORE INTO counters (name, value) SELECT 'bytes', COALESCE(SUM({ROW_SIZE_SQL}), 0) FROM cache"
+        )
+        self._migrate_name_keys()
+        if self.conn.execute("SELECT 1 FROM history_names LIMIT 1").fetchone() is None:
+            self.conn.execute(
+                "INSERT INTO history_names (name, count) SELECT name_key, COUNT(*) FROM history GROUP BY name_key"
+            )
+
+    def _migrate_name_keys(self):
+        """Key history by normalized name, merging the counts of spelling variants"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Checked inside the write lock, as another worker may be migrating too
+            if "name_key" not in {row["name"] for row in self.conn.execute("PRAGMA table_info(history)")}:
+                self.conn.create_function("normalize_name", 1, normalize_name, deterministic=True)
+                self.conn.execute("ALTER TABLE history ADD COLUMN name_key TEXT")
+                self.conn.execute("UPDATE history SET name_key = normalize_name(name)")
+                self.conn.execute(
+                    "CREATE TEMP TABLE merged_names AS "
+                    "SELECT normalize_name(name) AS name, SUM(count) AS count FROM history_names GROUP BY 1"
+                )
+                self.conn.execute("DELETE FROM history_names")
+                self.conn.execute("INSERT INTO history_names (name, count) SELECT name, count FROM merged_names")
+                self.conn.execute("DROP TABLE merged_names")
+                self.conn.execute("DROP INDEX IF EXISTS history_name")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS history_name_key ON history (name_key, seq)")
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run statements in one write transaction, taking the write lock up front"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def query(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+class SQLiteCache(MutableMapping):
+    """Description cache shared by every worker through SQLite, with the BoundedCache interface"""
+
+    def __init__(self, store: SQLiteStore, policy: str = "lru", max_entries: int = 0, max_bytes: int = 0, ttl_seconds: float = 0):
+        if policy not in EVICTION_ORDER:
+            raise ValueError(f"Unknown cache policy: {policy}. Allowed values: {list(EVICTION_ORDER)}")
+        self.store = store
+        self.policy_name = policy
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds or None
+        # Set by SQLiteBackend so access updates, upserts and counter flushes leave the event loop
+        self.writer: Optional[WriteBehindFlusher] = None
+        # This process's hit/miss counts not yet added to the shared counters row
+        self._counts: Dict[str, int] = {}
+        # Upserts queued on the writer, served from here until they land
+        self._pending: Dict[str, CacheRecord] = {}
+        self._local_lock = threading.Lock()
+
+    @staticmethod
+    def _to_item(row: sqlite3.Row) -> CacheRecord:
+        return CacheRecord.from_json({column: row[column] for column in CACHE_COLUMNS})
+
+    def _count(self, conn: sqlite3.Connection, counter: str, amount: int = 1):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            (counter, amount)
+        )
+
+    def _count_local(self, counter: str):
+        with self._local_lock:
+            self._counts[counter] = self._counts.get(counter, 0) + 1
+        if self.writer is not None:
+            self.writer.mark_dirty("counters")
+
+    def flush_counters(self):
+        """Add this process's counts to the shared counters in one transaction"""
+        with self._local_lock:
+            counts, self._counts = self._counts, {}
+        if not counts:
+            return
+        try:
+            with self.store.transaction() as conn:
+                for counter, amount in counts.items():
+                    self._count(conn, counter, amount)
+        except Exception:
+            # Keep the counts so the next flush retries them
+            with self._local_lock:
+                for counter, amount in counts.items():
+                    self._counts[counter] = self._counts.get(counter, 0) + amount
+            raise
+
+    def _submit(self, fn, *args):
+        """Run a write on the writer thread, or here if its queue is full"""
+        if self.writer is None or not self.writer.try_submit(fn, *args):
+            fn(*args)
+
+    def lookup(self, key: str) -> Optional[CacheRecord]:
+        """Return the entry for a request, counting the hit or miss in this process"""
+        with self._local_lock:
+            # A copy, so the caller's access bump is not also written by the queued upsert
+            item = copy.copy(self._pending.get(key))
+        if item is None:
+            rows = self.store.query("SELECT * FROM cache WHERE key = ?", (key,))
+            item = self._to_item(rows[0]) if rows else None
+        if item is not None and self.ttl is not None and time.time() - item.last_accessed > self.ttl:
+            self._submit(self._expire, key)
+            self._count_local("expirations")
+            item = None
+        self._count_local("hits" if item is not None else "misses")
+        return item
+
+    def _expire(self, key: str):
+        with self.store.transaction() as conn:
+            row = conn.execute("SELECT last_accessed FROM cache WHERE key = ?", (key,)).fetchone()
+            # Another worker may have refreshed it since it was looked up
+            if row is not None and time.time() - to_timestamp(row["last_accessed"]) > self.ttl:
+                self._delete(conn, key)
+
+    def top_accessed(self, limit: int, model: Optional[str] = None) -> List[Tuple[str, int]]:
+        """``(key, access_count)`` of the most accessed entries, optionally for one model, highest first"""
+        where = "WHERE model = ? " if model is not None else ""
+        rows = self.store.query(
+            f"SELECT key, access_count FROM cache {where}ORDER BY access_count DESC LIMIT ?",
+            (model, limit) if model is not None else (limit,)
+        )
+        return [(row["key"], row["access_count"]) for row in rows]
+
+    def touch(self, key: str, item: CacheRecord):
+        """Record an access on the writer thread, or here if its queue is full"""
+        self._submit(self._touch, key, from_timestamp(item.last_accessed).isoformat())
+
+    def _touch(self, key: str, last_accessed: str):
+        # Increments in SQL so concurrent workers do not lose counts
+        with self.store.transaction() as conn:
+            conn.execute(
+                "UPDATE cache SET access_count = access_count + 1, last_accessed = ? WHERE key = ?",
+                (last_accessed, key)
+            )
+
+    def __getitem__(self, key: str) -> CacheRecord:
+        with self._local_lock:
+            item = self._pending.get(key)
+        if item is not None:
+            return item
+        rows = self.store.query("SELECT * FROM cache WHERE key = ?", (key,))
+        if not rows:
+            raise KeyError(key)
+        return self._to_item(rows[0])
+
+    def _delete(self, conn: sqlite3.Connection, key: str) -> bool:
+        """Delete one entry and take it off the running totals"""
+        row = conn.execute(f"DELETE FROM cache WHERE key = ? RETURNING {ROW_SIZE_SQL}", (key,)).fetchone()
+        if row is None:
+            return False
+        self._count(conn, "entries", -1)
+        self._count(conn, "bytes", -row[0])
+        return True
+
+    def __setitem__(self, key: str, item: CacheRecord):
+        with self.store.transaction() as conn:
+            self._upsert(conn, key, item)
+            self._evict(conn)
+
+    def _upsert(self, conn: sqlite3.Connection, key: str, item: CacheRecord, keep_generation: bool = False):
+        """
+        Insert or replace one entry, keeping its access count and the running
+        totals; with ``keep_generation`` a fallback never replaces a model generation
+        """
+        size = len(item.name) + len(item.model) + len(item.description) + len(item.upsell)
+        previous = conn.execute(f"SELECT {ROW_SIZE_SQL}, fallback FROM cache WHERE key = ?", (key,)).fetchone()
+        if previous is not None and keep_generation and item.fallback and not previous[1]:
+            return
+        conn.execute(
+            "INSERT INTO cache (key, id, name, model, description, upsell, created_at, fallback, last_accessed, access_count) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET id = excluded.id, description = excluded.description, "
+            "upsell = excluded.upsell, created_at = excluded.created_at, fallback = excluded.fallback, "
+            "last_accessed = excluded.last_accessed",
+            (key, unpack_id(item.id), item.name, item.model, item.description, item.upsell,
+             from_timestamp(item.created_at).isoformat(), int(item.fallback),
+             from_timestamp(item.last_accessed).isoformat(), item.access_count)
+        )
+        if previous is None:
+            self._count(conn, "entries")
+        self._count(conn, "bytes", size - (previous[0] if previous is not None else 0))
+
+    def store_many(self, items: Dict[str, CacheRecord]):
+        """
+        Store generated entries on the writer thread. Model generations are
+        served from memory until they land; fallbacks never replace one.
+        """
+        with self._local_lock:
+            self._pending.update((key, item) for key, item in items.items() if not item.fallback)
+        if self.writer is None:
+            self._store_many(items)
+        else:
+            self.writer.submit(self._store_many, items)
+
+    def _store_many(self, items: Dict[str, CacheRecord]):
+        try:
+            with self.store.transaction() as conn:
+                for key, item in items.items():
+                    self._upsert(conn, key, item, keep_generation=True)
+                self._evict(conn)
+        finally:
+            with self._local_lock:
+                for key, item in items.items():
+                    if self._pending.get(key) is item:
+                        del self._pending[key]
+
+    def _totals(self, conn: sqlite3.Connection) -> Tuple[int, int]:
+        rows = dict(conn.execute("SELECT name, value FROM counters WHERE name IN ('entries', 'bytes')").fetchall())
+        return rows.get("entries", 0), rows.get("bytes", 0)
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Delete victims in policy order until the cache is back within budget, using the running totals"""
+        if not self.max_entries and not self.max_bytes:
+            return
+        order = EVICTION_ORDER[self.policy_name]
+        entries, size = self._totals(conn)
+        evicted = freed = 0
+        while True:
+            excess = entries - evicted - self.max_entries if self.max_entries else 0
+            if excess <= 0 and not (self.max_bytes and size - freed > self.max_bytes):
+                break
+            victims = conn.execute(
+                f"DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY {order} LIMIT ?) RETURNING {ROW_SIZE_SQL}",
+                (max(1, excess),)
+            ).fetchall()
+            if not victims:
+                break
+            evicted += len(victims)
+            freed += sum(row[0] for row in victims)
+        if evicted:
+            self._count(conn, "entries", -evicted)
+            self._count(conn, "bytes", -freed)
+            self._count(conn, "evictions", evicted)
+
+    def __delitem__(self, key: str):
+        with self.store.transaction() as conn:
+            if not self._delete(conn, key):
+                raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        with self._local_lock:
+            if key in self._pending:
+                return True
+        return bool(self.store.query("SELECT 1 FROM cache WHERE key = ?", (key,)))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([row["key"] for row in self.store.query("SELECT key FROM cache")])
+
+    def __len__(self) -> int:
+        rows = self.store.query("SELECT value FROM counters WHERE name = 'entries'")
+        return rows[0][0] if rows else 0
+
+    def items(self):
+        return [(row["key"], self._to_item(row)) for row in self.store.query("SELECT * FROM cache")]
+
+    def stats(self) -> dict:
+        """Counters shared by every worker using this database, plus this process's unflushed counts"""
+        counters = {row["name"]: row["value"] for row in self.store.query("SELECT name, value FROM counters")}
+        with self._local_lock:
+            for counter, amount in self._counts.items():
+                counters[counter] = counters.get(counter, 0) + amount
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        lookups = hits + misses
+        return {
+            "policy": self.policy_name,
+            "entries": counters.get("entries", 0),
+            "bytes": counters.get("bytes", 0),
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "evictions": counters.get("evictions", 0),
+            "expirations": counters.get("expirations", 0),
+        }
+
+class SQLiteHistory:
+    """Generation history in SQLite, with the HistoryLog interface; names are normalized as there"""
+
+    # Element types of a page cursor: (created_at ISO string, seq)
+    CURSOR_TYPES = (str, int)
+
+    def __init__(self, store: SQLiteStore, max_per_name: int = 0):
+        self.store = store
+        self.max_per_name = max_per_name
+
+    def append(self, record: HistoryRecord):
+        self.append_many([record])
+
+    def append_many(self, records: List[HistoryRecord]):
+        keys = [normalize_name(record.name) for record in records]
+        with self.store.transaction() as conn:
+            conn.executemany(
+                f"INSERT INTO history (name_key, {', '.join(HISTORY_COLUMNS)}) "
+                f"VALUES (?, {', '.join('?' * len(HISTORY_COLUMNS))})",
+                [(key, *record.to_json().values()) for key, record in zip(keys, records)]
+            )
+            conn.executemany(
+                "INSERT INTO history_names (name, count) VALUES (?, 1) "
+                "ON CONFLICT (name) DO UPDATE SET count = count + 1",
+                [(key,) for key in keys]
+            )
+
+    def page(
+        self,
+        model: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        cursor: Optional[Tuple[str, int]] = None,
+        limit: int = 50
+    ) -> Tuple[List[HistoryRecord], Optional[Tuple[str, int]]]:
+        """Records newest first, with the HistoryLog.page filters; the cursor is ``(created_at, seq)``"""
+        conditions, params = [], []
+        if model is not None:
+            conditions.append("model = ?")
+            params.append(model)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(from_timestamp(since).isoformat())
+        if until is not None:
+            conditions.append("created_at <= ?")
+            params.append(from_timestamp(until).isoformat())
+        if cursor is not None:
+            conditions.append("(created_at, seq) < (?, ?)")
+            params.extend(cursor)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        rows = self.store.query(
+            f"SELECT * FROM history {where}ORDER BY created_at DESC, seq DESC LIMIT ?",
+            (*params, limit + 1)
+        )
+        next_cursor = (rows[limit - 1]["created_at"], rows[limit - 1]["seq"]) if len(rows) > limit else None
+        return [HistoryRecord.from_json(row) for row in rows[:limit]], next_cursor
+
+    def top_names(self, limit: int = 10) -> List[Tuple[str, int]]:
+        """Names with the most generations, highest first"""
+        rows = self.store.query("SELECT name, count FROM history_names ORDER BY count DESC LIMIT ?", (limit,))
+        return [(row["name"], row["count"]) for row in rows]
+
+    @property
+    def total_records(self) -> int:
+        return self.store.query("SELECT COUNT(*) FROM history")[0][0]
+
+    def __contains__(self, name: str) -> bool:
+        return bool(self.store.query("SELECT 1 FROM history WHERE name_key = ? LIMIT 1", (name,)))
+
+    def __len__(self) -> int:
+        return self.store.query("SELECT COUNT(DISTINCT name_key) FROM history")[0][0]
+
+    def names(self) -> List[str]:
+        return [row["name_key"] for row in self.store.query("SELECT DISTINCT name_key FROM history")]
+
+    def count(self, name: str) -> int:
+        """Generations recorded for a name, including records dropped by compaction"""
+        rows = self.store.query("SELECT count FROM history_names WHERE name = ?", (name,))
+        return rows[0][0] if rows else 0
+
+    def latest(self, name: str) -> Optional[HistoryRecord]:
+        rows = self.store.query("SELECT * FROM history WHERE name_key = ? ORDER BY seq DESC LIMIT 1", (name,))
+        return HistoryRecord.from_json(rows[0]) if rows else None
+
+    def history(self, name: str) -> List[HistoryRecord]:
+        limit = self.max_per_name or -1
+        rows = self.store.query("SELECT * FROM history WHERE name_key = ? ORDER BY seq DESC LIMIT ?", (name, limit))
+        return [HistoryRecord.from_json(row) for row in reversed(rows)]
+
+    def checkpoint(self):
+        """Writes are already durable; nothing to checkpoint"""
+
+    def needs_compaction(self) -> bool:
+        """True when retention limits have left enough dead records to be worth deleting, as in HistoryLog"""
+        if not self.max_per_name:
+            return False
+        retained = self.store.query(
+            "SELECT COALESCE(SUM(MIN(count, ?)), 0) FROM history_names", (self.max_per_name,)
+        )[0][0]
+        return self.total_records > 2 * retained
+
+    def compact(self):
+        """Drop records beyond the per-name retention limit"""
+        with self.store.transaction() as conn:
+            conn.execute(
+                "DELETE FROM history WHERE seq IN ("
+                "SELECT seq FROM (SELECT seq, ROW_NUMBER() OVER (PARTITION BY name_key ORDER BY seq DESC) AS rank "
+                "FROM history) WHERE rank > ?)",
+                (self.max_per_name,)
+            )
+
+    def close(self):
+        """Closed with the store"""
+
+class SQLiteBackend(StorageBackend):
+    """Cache, history and rate-limit state in one SQLite (WAL) database shared by all workers"""
+
+    shared = True
+
+    def __init__(self, path: str = "food_items.db"):
+        super().__init__()
+        self.path = path
+        self.store = SQLiteStore(path)
+        self.cache = SQLiteCache(self.store, **cache_settings())
+        self.storage = SQLiteHistory(self.store, max_per_name=history_retention())
+        # History appends, cache upserts and access updates are written on this
+        # thread; hit/miss counts are added to the shared counters every interval
+        self._writer = WriteBehindFlusher(
+            lambda dirty: self.cache.flush_counters(),
+            interval=float(os.getenv("FOOD_ITEMS_FLUSH_INTERVAL", "5")),
+            max_queue=int(os.getenv("FOOD_ITEMS_WRITE_QUEUE_SIZE", "1000"))
+        )
+        self.cache.writer = self._writer
+
+    def append_history(self, records: List[HistoryRecord]):
+        self._writer.submit(self.storage.append_many, records)
+
+    def store_cache(self, items: Dict[str, CacheRecord]):
+        self.cache.store_many(items)
+
+    async def wait_for_capacity(self):
+        await self._writer.wait_for_capacity()
+
+    def drain(self):
+        self._writer.drain()
+
+    def flush(self):
+        self._writer.flush()
+        if self.storage.needs_compaction():
+            self.storage.compact()
+
+    def close(self):
+        self._writer.close()
+        self.flush()
+        self.store.close()
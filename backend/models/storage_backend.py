@@ -0,0 +1,254 @@
+from typing import Dict, List, Optional
+import json
+import os
+import threading
+from schemas.food_item import FoodItemHistory
+from models.records import CacheRecord, HistoryRecord
+from models.persistence import WriteBehindFlusher
+from models.snapshot import CacheSnapshot, append_delta, read_delta, write_snapshot
+from models.history_log import HistoryLog
+from models.cache_policy import BoundedCache
+from models.name_index import cache_key
+from utils.metrics import time_stage
+
+class StorageBackend:
+    """
+    Where FoodItemManager keeps its description cache and generation history.
+
+    ``cache`` is a mapping of cache key -> CacheRecord with ``lookup``/``touch``/
+    ``stats`` (see BoundedCache); ``storage`` is a history store with the
+    HistoryLog interface.
+    """
+
+    # True when several worker processes can safely share this backend
+    shared = False
+
+    def __init__(self):
+        self.cache = None
+        self.storage = None
+
+    def mark_dirty(self, *keys: str):
+        """Note changed keys; backends that write through can ignore this"""
+
+    def append_history(self, records: List[HistoryRecord]):
+        """Add generation records to the history; backends with a writer thread queue them"""
+        self.storage.append_many(records)
+
+    def store_cache(self, items: Dict[str, CacheRecord]):
+        """
+        Put generated entries in the cache; caller holds the manager's lock.
+        A fallback never replaces a model generation, and a regenerated entry
+        keeps the popularity it already earned.
+        """
+        for key, item in items.items():
+            previous = self.cache.get(key)
+            if previous is not None:
+                if item.fallback and not previous.fallback:
+                    continue
+                item.access_count = previous.access_count
+            self.cache[key] = item
+
+    async def wait_for_capacity(self):
+        """Backpressure: wait until a write can be queued without blocking the event loop"""
+
+    def drain(self):
+        """Wait for queued writes to land, so reads see them"""
+
+    def flush(self):
+        """Write all pending changes now"""
+
+    def close(self):
+        """Persist pending changes and release resources"""
+        self.storage.close()
+
+def cache_settings() -> dict:
+    """Eviction settings for the description cache from the FOOD_ITEMS_CACHE_* variables"""
+    return {
+        "policy": os.getenv("FOOD_ITEMS_CACHE_POLICY", "lru"),
+        "max_entries": int(os.getenv("FOOD_ITEMS_CACHE_MAX_ENTRIES", "0")),
+        "max_bytes": int(os.getenv("FOOD_ITEMS_CACHE_MAX_BYTES", "0")),
+        "ttl_seconds": float(os.getenv("FOOD_ITEMS_CACHE_TTL_SECONDS", "0")),
+    }
+
+def history_retention() -> int:
+    """Generations kept per dish from FOOD_ITEMS_HISTORY_MAX_PER_NAME; 0 keeps every one and never compacts"""
+    return int(os.getenv("FOOD_ITEMS_HISTORY_MAX_PER_NAME", "20"))
+
+class JSONFileBackend(StorageBackend):
+    """In-process cache persisted to a binary snapshot, with history in an append-only log"""
+
+    # The delta segment is always allowed to grow this far before the snapshot is rewritten
+    DELTA_MIN_COMPACT_BYTES = 1 << 20
+
+    def __init__(
+        self,
+        lock: threading.RLock,
+        storage_file: str = "food_items_data.json",
+        cache_file: str = "food_items_cache.json",
+        snapshot_file: str = "food_items_cache.snap",
+        history_file: str = "food_items_history.jsonl",
+        flush_interval: Optional[float] = None,
+        flush_max_dirty: Optional[int] = None
+    ):
+        super().__init__()
+        # storage_file and cache_file are the legacy JSON history and cache, imported
+        # once into the history log and the cache snapshot
+        self.storage_file = storage_file
+        self.cache_file = cache_file
+        self.snapshot_file = snapshot_file
+        self._snapshot: Optional[CacheSnapshot] = None
+        # Flushes append changed entries to the delta; the snapshot is rewritten
+        # once the delta is this fraction of its size
+        self.delta_file = f"{snapshot_file}.delta"
+        self.delta_compact_ratio = float(os.getenv("FOOD_ITEMS_SNAPSHOT_COMPACT_RATIO", "1"))
+        self._delta_bytes = 0
+        self.history_file = history_file
+        self.history_max_per_name = history_retention()
+        self._lock = lock
+        self.cache = BoundedCache(**cache_settings())
+        self._load_data()
+
+        # Write-behind persistence: mutations only mark keys dirty, a background
+        # flusher writes them out in batches
+        if flush_interval is None:
+            flush_interval = float(os.getenv("FOOD_ITEMS_FLUSH_INTERVAL", "5"))
+        if flush_max_dirty is None:
+            flush_max_dirty = int(os.getenv("FOOD_ITEMS_FLUSH_MAX_DIRTY", "100"))
+        self._flusher = WriteBehindFlusher(
+            self._save_data,
+            interval=flush_interval,
+            max_dirty=flush_max_dirty,
+            max_queue=int(os.getenv("FOOD_ITEMS_WRITE_QUEUE_SIZE", "1000"))
+        )
+        # Evicted and expired entries are written to the delta as removals
+        self.cache.on_remove = lambda key: self._flusher.mark_dirty(f"cache:{key}")
+
+    def _load_data(self):
+        """Load existing data from storage files"""
+        self.storage = HistoryLog(self.history_file, max_per_name=self.history_max_per_name)
+        if self.storage.total_records == 0:
+            self._import_legacy_storage()
+
+        try:
+            if os.path.exists(self.snapshot_file):
+                # Only the index is read here; records are decoded on first use
+                self._snapshot = CacheSnapshot(self.snapshot_file)
+                self.cache.load_snapshot(self._snapshot)
+            elif os.path.exists(self.cache_file):
+                self._import_legacy_cache()
+            self._replay_delta()
+        except Exception as e:
+            print(f"Warning: Could not load cache data: {e}")
+            self.cache = BoundedCache(**cache_settings())
+
+    def _replay_delta(self):
+        """Apply the changes flushed since the snapshot was written"""
+        for key, record in read_delta(self.delta_file):
+            if record is not None:
+                self.cache[key] = record
+            elif key in self.cache:
+                del self.cache[key]
+        if os.path.exists(self.delta_file):
+            self._delta_bytes = os.path.getsize(self.delta_file)
+
+    def _import_legacy_cache(self):
+        """Load the old JSON cache file and write it out as a snapshot"""
+        with open(self.cache_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # Insert oldest first so recency-based policies rebuild their order
+        for item_data in sorted(data.values(), key=lambda item: item['last_accessed']):
+            record = CacheRecord.from_json(item_data)
+            # Re-derive the key so files written before key normalization still load
+            self.cache[cache_key(record.name, record.model)] = record
+        write_snapshot(self.snapshot_file, self.cache.raw_items())
+        if os.path.exists(self.delta_file):
+            os.remove(self.delta_file)
+        print(f"Migrated {len(self.cache)} cache entries from {self.cache_file} to {self.snapshot_file}")
+
+    def _import_legacy_storage(self):
+        """Append records from the old whole-file JSON history into the history log"""
+        try:
+            if os.path.exists(self.storage_file):
+                with open(self.storage_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                for history_list in data.values():
+                    # Older files stored a single dict per name instead of a list
+                    if isinstance(history_list, dict):
+                        history_list = [history_list]
+                    for item_data in history_list:
+                        self.storage.append(HistoryRecord.from_json(FoodItemHistory(**item_data).model_dump(mode="json")))
+                self.storage.checkpoint()
+        except Exception as e:
+            print(f"Warning: Could not import legacy storage data: {e}")
+
+    def _save_data(self, dirty: Optional[set] = None):
+        """Persist dirty state: checkpoint the history index and write changed cache entries"""
+        with time_stage("save_data"):
+            self._write_dirty(dirty)
+
+    def _write_dirty(self, dirty: Optional[set]):
+        save_storage = dirty is None or any(key.startswith("storage:") for key in dirty)
+
+        if save_storage:
+            if self.storage.needs_compaction():
+                self.storage.compact()
+            else:
+                self.storage.checkpoint()
+
+        cache_keys = [key[len("cache:"):] for key in dirty or () if key.startswith("cache:")]
+        if dirty is None or (cache_keys and self._needs_snapshot()):
+            self._write_snapshot()
+        elif cache_keys:
+            # Take the changed entries under the lock, encode and append them outside
+            with self._lock:
+                entries = self.cache.raw_entries(cache_keys)
+            self._delta_bytes = append_delta(self.delta_file, entries)
+
+    def _needs_snapshot(self) -> bool:
+        """True when there is no snapshot yet or the delta has outgrown it"""
+        if not os.path.exists(self.snapshot_file):
+            return True
+        limit = max(self.DELTA_MIN_COMPACT_BYTES, self.delta_compact_ratio * os.path.getsize(self.snapshot_file))
+        return self._delta_bytes > limit
+
+    def _write_snapshot(self):
+        """Rewrite the whole snapshot and start an empty delta"""
+        # Take the entry list under the lock, encode and write it outside
+        with self._lock:
+            entries = self.cache.raw_items()
+        write_snapshot(self.snapshot_file, entries)
+        # Replaying a delta the new snapshot already covers is harmless, so a crash here is safe
+        if os.path.exists(self.delta_file):
+            os.remove(self.delta_file)
+        self._delta_bytes = 0
+
+    def mark_dirty(self, *keys: str):
+        self._flusher.mark_dirty(*keys)
+
+    def append_history(self, records: List[HistoryRecord]):
+        self._flusher.submit(self.storage.append_many, records)
+
+    async def wait_for_capacity(self):
+        await self._flusher.wait_for_capacity()
+
+    def drain(self):
+        self._flusher.drain()
+
+    def flush(self):
+        self._flusher.flush()
+
+    def close(self):
+        self._flusher.close()
+        self.storage.close()
+        if self._snapshot is not None:
+            self._snapshot.close()
+
+def create_backend(lock: threading.RLock, **options) -> StorageBackend:
+    """Build the backend selected by FOOD_ITEMS_BACKEND (json or sqlite)"""
+    backend = os.getenv("FOOD_ITEMS_BACKEND", "json")
+    if backend == "json":
+        return JSONFileBackend(lock, **options)
+    if backend == "sqlite":
+        from models.sqlite_backend import SQLiteBackend
+        return SQLiteBackend(os.getenv("FOOD_ITEMS_DB", "food_items.db"))
+    raise ValueError(f"Unknown storage backend: {backend}. Allowed values: ['json', 'sqlite']")
@@ -0,0 +1,237 @@
+"""
+Pre-warm the description cache from a menu file before a restaurant goes live.
+
+Usage:
+    python prewarm.py menu.csv [--model gpt-4.1-mini] [--concurrency 8] [--dry-run]
+
+The menu is a CSV with ``name`` (and optionally ``model``) columns, or JSON lines
+with the same keys. Rows are streamed, so memory stays flat for any file size.
+Progress is checkpointed so an interrupted run resumes where it stopped; the
+checkpoint never moves past a row that failed, so a rerun retries it.
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import heapq
+import json
+import logging
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+from schemas.food_item import FoodItemRequest
+from models.food_item_manager import FoodItemManager
+from utils.openai_client import openai_client
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("prewarm")
+
+class BloomFilter:
+    """Fixed-size set membership with no false negatives, used to dedupe dry runs"""
+
+    def __init__(self, size_bits: int = 1 << 24, hashes: int = 4):
+        self.size_bits = size_bits
+        self.hashes = hashes
+        self.bits = bytearray(size_bits // 8)
+
+    def _positions(self, key: str) -> Iterator[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8 * self.hashes).digest()
+        for i in range(self.hashes):
+            yield int.from_bytes(digest[i * 8:(i + 1) * 8], "little") % self.size_bits
+
+    def add(self, key: str) -> bool:
+        """Add a key, returning True if it was (probably) already present"""
+        present = True
+        for position in self._positions(key):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                present = False
+                self.bits[byte] |= 1 << bit
+        return present
+
+def read_menu(path: str, default_model: str) -> Iterator[Tuple[int, Optional[dict]]]:
+    """Yield ``(line_number, row)`` from a CSV or JSON-lines menu file; row is None for a malformed line"""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except ValueError as e:
+                        logger.error(f"Skipping line {line_number}: invalid JSON: {e}")
+                        yield line_number, None
+                        continue
+                    if not isinstance(row, dict):
+                        logger.error(f"Skipping line {line_number}: expected a JSON object, got {type(row).__name__}")
+                        yield line_number, None
+                        continue
+                    yield line_number, {"model": default_model, **row}
+        else:
+            for line_number, row in enumerate(csv.DictReader(f), start=2):
+                yield line_number, {"model": row.get("model") or default_model, "name": row.get("name", "")}
+
+def load_checkpoint(path: str) -> int:
+    """First line that has not been fully processed yet"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["next_line"]
+    except (OSError, ValueError, KeyError):
+        return 0
+
+def save_checkpoint(path: str, next_line: int, stats: Dict[str, int]):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"next_line": next_line, "stats": stats}, f)
+    os.replace(tmp_path, path)
+
+class Prewarmer:
+    """Streams menu rows through validation, dedupes against the cache and generates misses"""
+
+    def __init__(self, manager: FoodItemManager, concurrency: int, write_batch: int, checkpoint_file: Optional[str]):
+        self.manager = manager
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.write_batch = write_batch
+        self.checkpoint_file = checkpoint_file
+        self.stats = {"rows": 0, "invalid": 0, "cached": 0, "duplicates": 0, "generated": 0, "failed": 0}
+        self._pending: List[Tuple[FoodItemRequest, str, str, bool]] = []
+        # Line numbers still in flight; the checkpoint can only advance past the smallest
+        self._in_flight: List[int] = []
+        # Keys being generated or buffered but not yet stored
+        self._in_flight_keys: Dict[str, int] = {}
+        self._done_through = 0
+        # Earliest row whose generation failed; the checkpoint stays at or before it
+        self._first_failed: Optional[int] = None
+
+    def _validate(self, row: Optional[dict]) -> Optional[FoodItemRequest]:
+        if row is None:
+            # Already logged by read_menu
+            self.stats["invalid"] += 1
+            return None
+        try:
+            return FoodItemRequest(name=row.get("name", ""), model=row.get("model"))
+        except Exception as e:
+            logger.warning(f"Skipping invalid row {row!r}: {e}")
+            self.stats["invalid"] += 1
+            return None
+
+    def _next_line(self) -> int:
+        """First line not yet stored: the oldest in flight or failed, else the line after the last one read"""
+        candidates = [self._done_through + 1]
+        if self._in_flight:
+            candidates.append(self._in_flight[0])
+        if self._first_failed is not None:
+            candidates.append(self._first_failed)
+        return min(candidates)
+
+    def _write_pending(self, next_line: int):
+        """Bulk-store buffered results, then move the checkpoint"""
+        if self._pending:
+            self.manager.store_generated_descriptions(self._pending)
+            self.manager.flush()
+            for food_request, *_ in self._pending:
+                # Stored now, so the cache check covers later duplicates
+                self._in_flight_keys.pop(self.manager.cache_key(food_request.name, food_request.model), None)
+            self._pending = []
+        if self.checkpoint_file:
+            save_checkpoint(self.checkpoint_file, next_line, self.stats)
+
+    async def _generate(self, line_number: int, key: str, food_request: FoodItemRequest):
+        try:
+            generation = await openai_client.generate_food_description(
+                food_name=food_request.name,
+                model_type=food_request.model
+            )
+            if generation.fallback:
+                # Do not pre-warm with template or downgraded text; count the row as failed
+                raise RuntimeError("got the template or a downgraded model instead of the requested one")
+            self._pending.append((food_request, *generation))
+            self.stats["generated"] += 1
+        except Exception as e:
+            logger.error(f"Failed to generate {food_request.name}: {e}")
+            self.stats["failed"] += 1
+            del self._in_flight_keys[key]
+            if self._first_failed is None or line_number < self._first_failed:
+                self._first_failed = line_number
+        finally:
+            self._in_flight.remove(line_number)
+            heapq.heapify(self._in_flight)
+            self.semaphore.release()
+            if len(self._pending) >= self.write_batch:
+                self._write_pending(self._next_line())
+
+    async def run(self, rows: Iterator[Tuple[int, dict]], start_line: int, dry_run: bool) -> Dict[str, int]:
+        seen = BloomFilter() if dry_run else None
+        tasks = set()
+        for line_number, row in rows:
+            if line_number < start_line:
+                continue
+            self.stats["rows"] += 1
+            self._done_through = line_number
+            food_request = self._validate(row)
+            if food_request is None:
+                continue
+
+            key = self.manager.cache_key(food_request.name, food_request.model)
+            if key in self._in_flight_keys:
+                self.stats["duplicates"] += 1
+                continue
+            if self.manager.is_cached(food_request.name, food_request.model):
+                self.stats["cached"] += 1
+                continue
+            if dry_run:
+                if seen.add(key):
+                    self.stats["duplicates"] += 1
+                else:
+                    self.stats["generated"] += 1
+                continue
+
+            await self.semaphore.acquire()
+            self._in_flight_keys[key] = line_number
+            heapq.heappush(self._in_flight, line_number)
+            task = asyncio.create_task(self._generate(line_number, key, food_request))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        if not dry_run:
+            self._write_pending(self._next_line())
+            if self._first_failed is not None:
+                logger.warning(f"Some rows failed; rerun to retry from line {self._first_failed}")
+        return self.stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-warm the description cache from a menu file")
+    parser.add_argument("menu", help="CSV (name[,model]) or JSON-lines menu file")
+    parser.add_argument("--model", default="gpt-3.5-turbo", help="Model for rows that do not specify one")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum upstream generations in flight")
+    parser.add_argument("--write-batch", type=int, default=50, help="Results buffered per bulk write")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <menu>.prewarm.json)")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many upstream calls would be made")
+    args = parser.parse_args()
+
+    checkpoint_file = None if args.dry_run else (args.checkpoint or f"{args.menu}.prewarm.json")
+    start_line = 0 if args.restart or checkpoint_file is None else load_checkpoint(checkpoint_file)
+    if start_line:
+        logger.info(f"Resuming from line {start_line}")
+
+    async def prewarm() -> Dict[str, int]:
+        try:
+            prewarmer = Prewarmer(manager, args.concurrency, args.write_batch, checkpoint_file)
+            return await prewarmer.run(read_menu(args.menu, args.model), start_line, args.dry_run)
+        finally:
+            # Flushes the usage stats for the generations made here
+            await openai_client.aclose()
+
+    manager = FoodItemManager()
+    try:
+        stats = asyncio.run(prewarm())
+    finally:
+        manager.close()
+
+    if args.dry_run:
+        stats["expected_upstream_calls"] = stats.pop("generated")
+    print(json.dumps(stats, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,25 @@
 from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+import asyncio
 import logging
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+import os
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from schemas.food_item import (
     FoodItemRequest, 
-    FoodItemResponse
+    FoodItemResponse,
+    FoodItemBatchRequest,
+    FoodItemBatchResult,
+    FoodItemBatchResponse
 )
 from models.food_item_manager import FoodItemManager
-from utils.openai_client import openai_client
+from utils.openai_client import Generation, openai_client
+from utils.single_flight import SingleFlight
+from utils.refresh import RefreshScheduler
+from utils.streaming import format_sse
+from utils.rate_limit import token_limiter
+from utils.metrics import time_stage
+from utils.responses import cached_food_item_response
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,15 +30,84 @@ router = APIRouter()
 # Initialize the food item manager
 food_manager = FoodItemManager()
 
-# Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
+# Coalesce concurrent cache misses for the same item into one upstream call
+generation_flight = SingleFlight(timeout=float(os.getenv("GENERATION_COALESCE_TIMEOUT", "60")))
+
+# Batch generation: dishes packed per upstream prompt and upstream calls run in parallel
+BATCH_PROMPT_SIZE = int(os.getenv("BATCH_PROMPT_SIZE", "5"))
+BATCH_MAX_PARALLEL = int(os.getenv("BATCH_MAX_PARALLEL", "4"))
+
+async def refresh_description(name: str, model: str):
+    """Regenerate a stale cache entry in the background"""
+    food_request = FoodItemRequest(name=name, model=model)
+    
+    async def run() -> Generation:
+        generation = await openai_client.generate_food_description(food_name=name, model_type=model)
+        if generation.fallback:
+            # Upstream is failing or routed elsewhere; keep serving the stale entry rather than the template
+            logger.warning(f"Refresh for {name} with model {model} fell back, keeping the cached entry")
+            return generation
+        await food_manager.wait_for_writer()
+        with time_stage("store", model):
+            food_manager.store_generated_description(food_request, *generation)
+        return generation
+    
+    logger.info(f"Refreshing stale description for: {name} with model {model}")
+    await generation_flight.do(food_manager.cache_key(name, model), run)
+
+# Stale hits are served immediately and refreshed here, with a small cap of their own
+# so background refreshes cannot take upstream capacity from live misses
+refresh_scheduler = RefreshScheduler(
+    refresh_description,
+    max_concurrency=int(os.getenv("REFRESH_MAX_CONCURRENCY", "2")),
+    max_queue=int(os.getenv("REFRESH_QUEUE_SIZE", "1000"))
+)
+food_manager.on_stale = refresh_scheduler.schedule
+
+def invalid_request(error: ValidationError) -> HTTPException:
+    """422 for a request body that fails validation, in FastAPI's error layout"""
+    return HTTPException(
+        status_code=422,
+        detail=[{"loc": list(e["loc"]), "msg": e["msg"], "type": e["type"]} for e in error.errors()]
+    )
 
 def get_food_manager() -> FoodItemManager:
     """Dependency to get the food item manager instance"""
     return food_manager
 
+async def generate_and_store(manager: FoodItemManager, food_request: FoodItemRequest) -> Generation:
+    """Generate a description once per (name, model), shared by all concurrent callers"""
+    async def run() -> Generation:
+        # Another flight may have filled the cache between our miss and now; the
+        # miss is already counted, so only peek
+        cached_item = manager.peek_cached_entry(food_request.name, food_request.model)
+        if cached_item:
+            return Generation(cached_item.description, cached_item.upsell, cached_item.fallback)
+        # Opt-in multi-style mode also fills the other styles this dish is missing
+        other_models = [
+            model for model in openai_client.models
+            if model != food_request.model and not manager.is_cached(food_request.name, model)
+        ] if openai_client.multi_style else []
+        if other_models:
+            generations = await openai_client.generate_food_styles(food_request.name, food_request.model)
+        else:
+            generations = {food_request.model: await openai_client.generate_food_description(
+                food_name=food_request.name,
+                model_type=food_request.model
+            )}
+        generation = generations[food_request.model]
+        
+        await manager.wait_for_writer()
+        with time_stage("store", food_request.model):
+            manager.store_generated_descriptions([(food_request, *generation)] + [
+                (FoodItemRequest(name=food_request.name, model=model), *generations[model])
+                for model in other_models if model in generations and not generations[model].fallback
+            ])
+        return generation
+    
+    return await generation_flight.do(manager.cache_key(food_request.name, food_request.model), run)
+
 @router.post("/generate-description", response_model=FoodItemResponse)
-@limiter.limit("5/minute")
 async def generate_food_description(
     request: Request,
     manager: FoodItemManager = Depends(get_food_manager)
@@ -39,30 +120,31 @@ async def generate_food_description(
     try:
         # Parse request body manually
         body = await request.json()
-        food_request = FoodItemRequest(**body)
+        with time_stage("validation"):
+            food_request = FoodItemRequest.fast_parse(body) or FoodItemRequest(**body)
         
         logger.info(f"Generating description for: {food_request.name} with model {food_request.model}")
         
-        # Check cache first
-        cached_result = manager.get_cached_description(food_request.name, food_request.model)
-        if cached_result:
-            logger.info(f"Cache hit for: {food_request.name} with model {food_request.model}")
-            description, upsell = cached_result
-            return FoodItemResponse(
-                name=food_request.name,
-                model=food_request.model,
-                description=description,
-                upsell=upsell,
-                success=True
+        # Check cache first; hits are answered from pre-serialized bytes. Expired entries
+        # still count while the routing policy is keeping requests off upstream. The
+        # charge is priced from a peek, so a rejected request never counts as a hit or miss
+        allow_expired = openai_client.prefers_cache()
+        cached = manager.peek_cached_entry(food_request.name, food_request.model, allow_expired) is not None
+        token_limiter.charge(request, token_limiter.cost(food_request.model, cached=cached), food_request.model)
+        cached_item = manager.get_cached_entry(food_request.name, food_request.model, allow_expired)
+        if cached and not cached_item:
+            # Evicted since the peek; charge the rest of a generation
+            token_limiter.charge(
+                request,
+                token_limiter.cost(food_request.model) - token_limiter.cost(food_request.model, cached=True),
+                food_request.model
             )
+        if cached_item:
+            logger.info(f"Cache hit for: {food_request.name} with model {food_request.model}")
+            return cached_food_item_response(food_request.name, food_request.model, cached_item)
         
-        # Generate new description using OpenAI client
-        description, upsell = await openai_client.generate_food_description(
-            food_name=food_request.name,
-            model_type=food_request.model
-        )
-        # Store the generated description
-        manager.store_generated_description(food_request, description, upsell)
+        # Generate and store a new description, coalesced with concurrent identical misses
+        description, upsell, _ = await generate_and_store(manager, food_request)
         
         logger.info(f"Successfully generated description for: {food_request.name}")
         
@@ -74,6 +156,10 @@ async def generate_food_description(
             success=True
         )
         
+    except HTTPException:
+        raise
+    except ValidationError as e:
+        raise invalid_request(e)
     except Exception as e:
         logger.error(f"Error generating description: {str(e)}")
         raise HTTPException(
@@ -81,8 +167,217 @@ async def generate_food_description(
             detail=f"Error generating description: {str(e)}"
         )
 
+async def stream_generation(
+    manager: FoodItemManager,
+    food_request: FoodItemRequest,
+    use_cache: bool
+) -> AsyncIterator[str]:
+    """Server-sent events for one generation; cache hits are sent as a single result event"""
+    try:
+        if use_cache:
+            cached_result = manager.get_cached_description(food_request.name, food_request.model)
+            if cached_result:
+                logger.info(f"Cache hit for: {food_request.name} with model {food_request.model}")
+                description, upsell = cached_result
+                yield format_sse("result", {
+                    "name": food_request.name,
+                    "model": food_request.model,
+                    "description": description,
+                    "upsell": upsell,
+                    "cached": True
+                })
+                return
+        
+        async for event, data in openai_client.stream_food_description(food_request.name, food_request.model):
+            if event != "result":
+                yield format_sse(event, data)
+                continue
+            
+            # Store the assembled result before telling the client we are done
+            await manager.wait_for_writer()
+            with time_stage("store", food_request.model):
+                manager.store_generated_description(
+                    food_request, data["description"], data["upsell"], fallback=data["fallback"]
+                )
+            logger.info(f"Successfully streamed description for: {food_request.name}")
+            yield format_sse("result", {
+                "name": food_request.name,
+                "model": food_request.model,
+                **data,
+                "cached": False
+            })
+    
+    except Exception as e:
+        logger.error(f"Error streaming description: {str(e)}")
+        yield format_sse("error", {"detail": f"Error streaming description: {str(e)}"})
+
+async def parse_food_request(request: Request) -> FoodItemRequest:
+    """Parse and validate a FoodItemRequest body, raising a 422 or 500 like the other handlers"""
+    try:
+        body = await request.json()
+        with time_stage("validation"):
+            return FoodItemRequest.fast_parse(body) or FoodItemRequest(**body)
+    except ValidationError as e:
+        raise invalid_request(e)
+    except Exception as e:
+        logger.error(f"Error parsing request: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error generating description: {str(e)}"
+        )
+
+@router.post("/generate-description/stream")
+async def stream_food_description(
+    request: Request,
+    manager: FoodItemManager = Depends(get_food_manager)
+):
+    """
+    Stream a description and upsell message as server-sent events.
+    Emits `section`/`token` events while generating and a final `result` event;
+    cache hits are served as one immediate `result` event.
+    """
+    food_request = await parse_food_request(request)
+    cached = manager.is_cached(food_request.name, food_request.model)
+    token_limiter.charge(request, token_limiter.cost(food_request.model, cached=cached), food_request.model)
+    logger.info(f"Streaming description for: {food_request.name} with model {food_request.model}")
+    return StreamingResponse(
+        stream_generation(manager, food_request, use_cache=True),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/regenerate-description/stream")
+async def stream_regenerate_food_description(
+    request: Request,
+    manager: FoodItemManager = Depends(get_food_manager)
+):
+    """
+    Stream a fresh generation as server-sent events, skipping the cache.
+    """
+    food_request = await parse_food_request(request)
+    token_limiter.charge(request, token_limiter.cost(food_request.model), food_request.model)
+    logger.info(f"Streaming regeneration for: {food_request.name} with model {food_request.model}")
+    return StreamingResponse(
+        stream_generation(manager, food_request, use_cache=False),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/generate-descriptions/batch", response_model=FoodItemBatchResponse)
+async def generate_food_descriptions_batch(
+    request: Request,
+    manager: FoodItemManager = Depends(get_food_manager)
+):
+    """
+    Generate descriptions for a whole menu in one request.
+    Cached items are served directly; only misses are generated upstream, several
+    dishes per prompt, with bounded parallelism.
+    
+    - **items**: List of food items (name and model), up to 200
+    """
+    try:
+        # Parse request body manually
+        body = await request.json()
+        with time_stage("validation"):
+            batch_request = FoodItemBatchRequest(**body)
+        items = batch_request.items
+        
+        logger.info(f"Batch generating descriptions for {len(items)} items")
+        
+        # Resolve every cache hit in one pass
+        cached = manager.get_cached_descriptions(items)
+        
+        # Group the distinct misses by model
+        misses: Dict[str, List[FoodItemRequest]] = {}
+        seen = set(cached)
+        for item in items:
+            cache_key = manager.cache_key(item.name, item.model)
+            if cache_key not in seen:
+                seen.add(cache_key)
+                misses.setdefault(item.model, []).append(item)
+        
+        # Cached and repeated items are cheap; each distinct miss costs its model's rate
+        miss_count = sum(len(model_items) for model_items in misses.values())
+        cost = (len(items) - miss_count) * token_limiter.cost("", cached=True)
+        cost += sum(token_limiter.cost(model) * len(model_items) for model, model_items in misses.items())
+        token_limiter.charge(request, cost)
+        
+        chunks = [
+            (model, model_items[i:i + BATCH_PROMPT_SIZE])
+            for model, model_items in misses.items()
+            for i in range(0, len(model_items), BATCH_PROMPT_SIZE)
+        ]
+        semaphore = asyncio.Semaphore(BATCH_MAX_PARALLEL)
+        
+        async def generate_chunk(model: str, chunk: List[FoodItemRequest]) -> Dict[str, Generation]:
+            async with semaphore:
+                return await openai_client.generate_food_descriptions([item.name for item in chunk], model)
+        
+        outcomes = await asyncio.gather(
+            *(generate_chunk(model, chunk) for model, chunk in chunks),
+            return_exceptions=True
+        )
+        
+        generated: Dict[str, Tuple[str, str]] = {}
+        errors: Dict[str, str] = {}
+        to_store = []
+        for (model, chunk), outcome in zip(chunks, outcomes):
+            for item in chunk:
+                cache_key = manager.cache_key(item.name, item.model)
+                if isinstance(outcome, Exception):
+                    errors[cache_key] = str(outcome)
+                elif item.name in outcome:
+                    generation = outcome[item.name]
+                    generated[cache_key] = (generation.description, generation.upsell)
+                    to_store.append((item, *generation))
+                else:
+                    errors[cache_key] = "No description returned"
+        
+        # Persist every new result with one write
+        if to_store:
+            await manager.wait_for_writer()
+            with time_stage("store"):
+                manager.store_generated_descriptions(to_store)
+        
+        results = []
+        for item in items:
+            cache_key = manager.cache_key(item.name, item.model)
+            if cache_key in cached:
+                status, result = "cached", cached[cache_key]
+            elif cache_key in generated:
+                status, result = "generated", generated[cache_key]
+            else:
+                status, result = "failed", (None, None)
+            results.append(FoodItemBatchResult(
+                name=item.name,
+                model=item.model,
+                description=result[0],
+                upsell=result[1],
+                status=status,
+                error=errors.get(cache_key)
+            ))
+        
+        logger.info(f"Batch complete: {len(cached)} cached, {len(generated)} generated, {len(errors)} failed")
+        
+        return FoodItemBatchResponse(
+            results=results,
+            cache_hits=len(cached),
+            generated=len(generated),
+            failed=len(errors)
+        )
+        
+    except HTTPException:
+        raise
+    except ValidationError as e:
+        raise invalid_request(e)
+    except Exception as e:
+        logger.error(f"Error batch generating descriptions: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error batch generating descriptions: {str(e)}"
+        )
+
 @router.post("/regenerate-description", response_model=FoodItemResponse)
-@limiter.limit("5/minute")
 async def regenerate_food_description(
     request: Request,
     manager: FoodItemManager = Depends(get_food_manager)
@@ -97,18 +392,31 @@ async def regenerate_food_description(
     try:
         # Parse request body manually
         body = await request.json()
-        food_request = FoodItemRequest(**body)
+        with time_stage("validation"):
+            food_request = FoodItemRequest.fast_parse(body) or FoodItemRequest(**body)
         
         logger.info(f"Regenerating description for: {food_request.name} with model {food_request.model}")
         
-        # Always generate new description using OpenAI client (no cache check for regeneration)
-        description, upsell = await openai_client.generate_food_description(
+        # Over budget or SLO, the current entry is served instead of a new generation
+        if openai_client.prefers_cache() and manager.peek_cached_entry(food_request.name, food_request.model, allow_expired=True):
+            token_limiter.charge(request, token_limiter.cost(food_request.model, cached=True), food_request.model)
+            cached_item = manager.get_cached_entry(food_request.name, food_request.model, allow_expired=True)
+            if cached_item:
+                logger.info(f"Serving cached description instead of regenerating: {food_request.name}")
+                return cached_food_item_response(food_request.name, food_request.model, cached_item)
+        token_limiter.charge(request, token_limiter.cost(food_request.model), food_request.model)
+        
+        # Generate a new description using OpenAI client (no cache check for regeneration)
+        generation = await openai_client.generate_food_description(
             food_name=food_request.name,
             model_type=food_request.model
         )
+        description, upsell, _ = generation
         
         # Store the regenerated description
-        manager.store_generated_description(food_request, description, upsell)
+        await manager.wait_for_writer()
+        with time_stage("store", food_request.model):
+            manager.store_generated_description(food_request, *generation)
         
         logger.info(f"Successfully regenerated description for: {food_request.name}")
         
@@ -120,9 +428,36 @@ async def regenerate_food_description(
             success=True
         )
         
+    except HTTPException:
+        raise
+    except ValidationError as e:
+        raise invalid_request(e)
     except Exception as e:
         logger.error(f"Error regenerating description: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Error regenerating description: {str(e)}"
         )
+
+@router.get("/cache/stats")
+async def cache_stats(manager: FoodItemManager = Depends(get_food_manager)):
+    """Get description cache size, eviction policy and hit/miss/eviction counters"""
+    return manager.cache_stats()
+
+# Usage reports flush pending totals to the database first, so these are plain
+# functions that FastAPI runs in its threadpool off the event loop
+
+@router.get("/usage")
+def usage_by_model():
+    """Get upstream calls, tokens, estimated cost and latency per model, and the spend budget"""
+    return {
+        "models": openai_client.usage.by_model(),
+        "budget_usd": openai_client.routing.budget_usd,
+        "window_spent_usd": round(openai_client.usage.window_spent(), 6),
+        "latency_slo_seconds": openai_client.routing.latency_slo,
+    }
+
+@router.get("/usage/items")
+def usage_by_item(model: Optional[str] = None, limit: int = 50):
+    """Get the food items with the highest upstream spend, optionally for one model"""
+    return {"items": openai_client.usage.by_item(model, max(1, min(limit, 1000)))}
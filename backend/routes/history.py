@@ -0,0 +1,70 @@
+from fastapi import APIRouter, HTTPException, Depends
+from datetime import datetime
+import logging
+from typing import List, Optional
+from schemas.food_item import DishRanking, FoodItemHistory, FoodItemHistoryPage
+from models.food_item_manager import FoodItemManager
+from routes.generate import get_food_manager
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Handlers are plain functions: they drain the write queue and read the log or
+# database, so FastAPI runs them in its threadpool off the event loop
+
+# Largest page a client can ask for
+MAX_PAGE_SIZE = 200
+
+@router.get("/history", response_model=FoodItemHistoryPage)
+def list_history(
+    model: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    manager: FoodItemManager = Depends(get_food_manager)
+):
+    """List generations newest first, optionally for one model and a created_at range (UTC)"""
+    try:
+        items, next_cursor = manager.query_history(model, since, until, cursor, max(1, min(limit, MAX_PAGE_SIZE)))
+        return FoodItemHistoryPage(items=items, next_cursor=next_cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error listing history: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error listing history: {str(e)}"
+        )
+
+@router.get("/history/{name}", response_model=List[FoodItemHistory])
+def item_history(name: str, manager: FoodItemManager = Depends(get_food_manager)):
+    """Get every retained generation for one food item, oldest first"""
+    try:
+        return manager.get_history(name)
+    except Exception as e:
+        logger.error(f"Error getting history for {name}: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error getting history: {str(e)}"
+        )
+
+@router.get("/analytics/top-dishes", response_model=List[DishRanking])
+def top_dishes(
+    by: str = "accesses",
+    model: Optional[str] = None,
+    limit: int = 10,
+    manager: FoodItemManager = Depends(get_food_manager)
+):
+    """Get the most requested dishes, by cache accesses or by number of generations"""
+    try:
+        return manager.top_dishes(by, model, max(1, min(limit, MAX_PAGE_SIZE)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error ranking dishes: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error ranking dishes: {str(e)}"
+        )
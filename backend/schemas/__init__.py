@@ -3,6 +3,9 @@
 from .food_item import (
     FoodItemRequest,
     FoodItemResponse,
+    FoodItemBatchRequest,
+    FoodItemBatchResult,
+    FoodItemBatchResponse,
     FoodItemHistory,
     FoodItemCache
 )
@@ -10,6 +13,9 @@ from .food_item import (
 __all__ = [
     "FoodItemRequest",
     "FoodItemResponse", 
+    "FoodItemBatchRequest",
+    "FoodItemBatchResult",
+    "FoodItemBatchResponse",
     "FoodItemHistory",
     "FoodItemCache"
 ]
@@ -1,8 +1,36 @@
 from pydantic import BaseModel, Field, field_validator
-from typing import Optional
+from typing import Any, List, Optional
 from datetime import datetime
 import re
 
+# Letters, numbers, spaces, hyphens and apostrophes
+VALID_NAME = re.compile(r'^[a-zA-Z0-9\s\-\']+$')
+ALLOWED_MODELS = ("gpt-3.5-turbo", "gpt-4.1-mini")
+DEFAULT_MODEL = "gpt-3.5-turbo"
+NAME_MAX_LENGTH = 100
+
+def sanitize_name(v: str) -> str:
+    """Collapse whitespace and check a food item name, raising ValueError if it is invalid"""
+    if not v or not v.strip():
+        raise ValueError('Food item name cannot be empty')
+    
+    # Remove extra whitespace and normalize
+    sanitized = ' '.join(v.strip().split())
+    
+    # Check for valid characters (letters, numbers, spaces, hyphens, apostrophes)
+    if not VALID_NAME.match(sanitized):
+        raise ValueError('Food item name contains invalid characters')
+    
+    # Check length after sanitization
+    if len(sanitized) > NAME_MAX_LENGTH:
+        raise ValueError('Food item name is too long (max 100 characters)')
+    
+    # Names are cached and recorded by their letters and numbers, so punctuation alone would collide
+    if not any(c.isalnum() for c in sanitized):
+        raise ValueError('Food item name must contain a letter or number')
+    
+    return sanitized
+
 class FoodItemRequest(BaseModel):
     """Request model for food item description generation"""
     name: str = Field(
@@ -13,7 +41,7 @@ class FoodItemRequest(BaseModel):
         example="Margherita Pizza"
     )
     model: str = Field(
-        "gpt-3.5-turbo", 
+        DEFAULT_MODEL, 
         description="LLM model for description generation (gpt-3.5 or gpt-4.1-mini)",
         example="gpt-4.1-mini"
     )
@@ -22,31 +50,35 @@ class FoodItemRequest(BaseModel):
     @classmethod
     def validate_and_sanitize_name(cls, v):
         """Validate and sanitize the food item name"""
-        if not v or not v.strip():
-            raise ValueError('Food item name cannot be empty')
-        
-        # Remove extra whitespace and normalize
-        sanitized = ' '.join(v.strip().split())
-        
-        # Check for valid characters (letters, numbers, spaces, hyphens, apostrophes)
-        if not re.match(r'^[a-zA-Z0-9\s\-\']+$', sanitized):
-            raise ValueError('Food item name contains invalid characters')
-        
-        # Check length after sanitization
-        if len(sanitized) > 100:
-            raise ValueError('Food item name is too long (max 100 characters)')
-        
-        return sanitized
+        return sanitize_name(v)
     
     @field_validator("model")
     @classmethod
     def validate_model(cls, v: str) -> str:
         """Ensure only supported models are allowed"""
-        allowed = ["gpt-3.5-turbo", "gpt-4.1-mini"]
-        if v not in allowed:
-            raise ValueError(f"Invalid model. Allowed values: {allowed}")
+        if v not in ALLOWED_MODELS:
+            raise ValueError(f"Invalid model. Allowed values: {list(ALLOWED_MODELS)}")
         return v
     
+    @classmethod
+    def fast_parse(cls, body: Any) -> Optional["FoodItemRequest"]:
+        """
+        Validate a well-formed request body without a full Pydantic validation pass.
+        
+        Returns None for anything unusual, so the caller can fall back to
+        ``FoodItemRequest(**body)`` and get the normal validation errors.
+        """
+        if type(body) is not dict:
+            return None
+        name = body.get("name")
+        model = body.get("model", DEFAULT_MODEL)
+        if type(name) is not str or len(name) > NAME_MAX_LENGTH or model not in ALLOWED_MODELS:
+            return None
+        try:
+            name = sanitize_name(name)
+        except ValueError:
+            return None
+        return cls.model_construct(name=name, model=model)
 
 class FoodItemResponse(BaseModel):
     """Response model for generated food item description"""
@@ -57,6 +89,32 @@ class FoodItemResponse(BaseModel):
     success: bool = Field(..., description="Whether the generation was successful")
     timestamp: datetime = Field(default_factory=datetime.utcnow, description="Generation timestamp")
 
+class FoodItemBatchRequest(BaseModel):
+    """Request model for generating descriptions for a whole menu"""
+    items: List[FoodItemRequest] = Field(
+        ...,
+        min_length=1,
+        max_length=200,
+        description="Food items to generate descriptions for"
+    )
+
+class FoodItemBatchResult(BaseModel):
+    """Per-item result of a batch generation"""
+    name: str = Field(..., description="Name of the food item")
+    model: str = Field(..., description="Selected model option")
+    description: Optional[str] = Field(None, description="Generated description for the food item")
+    upsell: Optional[str] = Field(None, description="Upsell message for the food item")
+    status: str = Field(..., description="cached, generated or failed")
+    error: Optional[str] = Field(None, description="Error message when generation failed")
+
+class FoodItemBatchResponse(BaseModel):
+    """Response model for batch generation"""
+    results: List[FoodItemBatchResult] = Field(..., description="Results in request order")
+    cache_hits: int = Field(..., description="Number of items served from cache")
+    generated: int = Field(..., description="Number of items generated upstream")
+    failed: int = Field(..., description="Number of items that could not be generated")
+    timestamp: datetime = Field(default_factory=datetime.utcnow, description="Generation timestamp")
+
 class FoodItemHistory(BaseModel):
     """Model for storing food item generation history"""
     id: Optional[str] = Field(None, description="Unique identifier")
@@ -74,5 +132,18 @@ class FoodItemCache(BaseModel):
     model: str = Field(..., description="Model used for generation")
     description: str = Field(..., description="Generated description")
     upsell: str = Field(..., description="Generated upsell message")
+    created_at: datetime = Field(default_factory=datetime.utcnow, description="Generation timestamp")
+    fallback: bool = Field(default=False, description="Template fallback rather than a model generation")
     last_accessed: datetime = Field(default_factory=datetime.utcnow, description="Last access timestamp")
     access_count: int = Field(default=1, description="Number of times accessed")
+
+class FoodItemHistoryPage(BaseModel):
+    """One page of generation history, newest first"""
+    items: List[FoodItemHistory] = Field(..., description="History records, newest first")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page; absent on the last page")
+
+class DishRanking(BaseModel):
+    """A dish in a top-dishes ranking"""
+    name: str = Field(..., description="Name of the food item")
+    model: Optional[str] = Field(None, description="Model option, for rankings by cache accesses")
+    count: int = Field(..., description="Cache accesses or generations, depending on the ranking")
@@ -0,0 +1,99 @@
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# The app builds its upstream client at import time; give it a key so it is enabled
+os.environ.update({
+    "OPENAI_API_KEY": "test",
+    "FOOD_ITEMS_BACKEND": "json",
+    "OPENAI_RETRY_BASE_DELAY": "0.001",
+    "OPENAI_RETRY_MAX_DELAY": "0.005",
+})
+
+import httpx
+import pytest
+from stubs import StubClient, StubCompletions
+
+@pytest.fixture(scope="session", autouse=True)
+def _workdir():
+    """The app opens its stores at import time; keep those files out of the source tree"""
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix="menu-widget-tests-"))
+    yield
+    os.chdir(cwd)
+
+@pytest.fixture
+def upstream() -> StubCompletions:
+    return StubCompletions(delay=0.01)
+
+@pytest.fixture
+def make_openai(upstream, tmp_path, monkeypatch):
+    """Build an OpenAIClient wired to the stub upstream, after the test has set its environment"""
+    from utils.openai_client import OpenAIClient
+    monkeypatch.setenv("USAGE_FILE", str(tmp_path / "usage_stats.json"))
+    clients = []
+
+    def make() -> OpenAIClient:
+        client = OpenAIClient()
+        client.client = StubClient(upstream)
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        if client._usage is not None:
+            client._usage.close()
+
+@pytest.fixture
+def openai(make_openai):
+    return make_openai()
+
+@pytest.fixture
+def make_manager(tmp_path):
+    """Build FoodItemManagers on the JSON-file backend in the test's directory"""
+    from models.food_item_manager import FoodItemManager
+    managers = []
+
+    def make(**options) -> FoodItemManager:
+        manager = FoodItemManager(
+            storage_file=str(tmp_path / "food_items_data.json"),
+            cache_file=str(tmp_path / "food_items_cache.json"),
+            snapshot_file=str(tmp_path / "food_items_cache.snap"),
+            history_file=str(tmp_path / "food_items_history.jsonl"),
+            **options
+        )
+        managers.append(manager)
+        return manager
+
+    yield make
+    for manager in managers:
+        manager.close()
+
+@pytest.fixture
+def manager(make_manager):
+    return make_manager()
+
+@pytest.fixture
+def limiter(openai):
+    """A token-bucket limiter generous enough to stay out of the way"""
+    from utils.rate_limit import TokenBucketLimiter
+    return TokenBucketLimiter(1e9, 1e9, {model: config["rate_cost"] for model, config in openai.models.items()})
+
+@pytest.fixture
+def app(openai, manager, limiter, monkeypatch):
+    """The FastAPI app serving from the test's manager, upstream client and limiter"""
+    import routes.generate as generate
+    from main import app
+    monkeypatch.setattr(generate, "openai_client", openai)
+    monkeypatch.setattr(generate, "token_limiter", limiter)
+    app.dependency_overrides[generate.get_food_manager] = lambda: manager
+    yield app
+    app.dependency_overrides.clear()
+
+@pytest.fixture
+def api(app):
+    """Build an in-process client for the app; call it inside the test's event loop"""
+    return lambda: httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
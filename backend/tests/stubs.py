@@ -0,0 +1,67 @@
+"""
+Scripted stand-in for the OpenAI client, so tests control every upstream call.
+"""
+import asyncio
+from collections import deque
+from types import SimpleNamespace
+from typing import Deque, List, Union
+import httpx
+from openai import APIConnectionError
+from benchmarks.fake_openai import estimate_tokens, fake_reply, prompt_tokens
+
+def connection_error() -> APIConnectionError:
+    """A retryable upstream failure"""
+    return APIConnectionError(request=httpx.Request("POST", "http://stub/v1/chat/completions"))
+
+class StubCompletions:
+    """
+    ``client.chat.completions`` with scripted behaviour.
+
+    Each call takes the next step from ``script``: an exception is raised, a
+    number is the call's latency in seconds, and an exhausted script answers
+    after ``delay``. Replies are the fake server's deterministic JSON; a
+    ``stream=True`` request gets it in 16-character chunks.
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.script: Deque[Union[BaseException, float]] = deque()
+        self.requests: List[dict] = []
+
+    @property
+    def calls(self) -> int:
+        return len(self.requests)
+
+    async def create(self, **request):
+        self.requests.append(request)
+        step = self.script.popleft() if self.script else self.delay
+        if isinstance(step, BaseException):
+            await asyncio.sleep(self.delay)
+            raise step
+        await asyncio.sleep(step)
+        content = fake_reply(request["messages"])
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens(request["messages"]),
+            completion_tokens=estimate_tokens(content),
+            prompt_tokens_details=None
+        )
+        if request.get("stream"):
+            return self._chunks(content, usage)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=usage
+        )
+
+    async def _chunks(self, content: str, usage: SimpleNamespace):
+        for i in range(0, len(content), 16):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[i:i + 16]))], usage=None)
+        yield SimpleNamespace(choices=[], usage=usage)
+
+class StubClient:
+    """Just enough of AsyncOpenAI for OpenAIClient"""
+
+    def __init__(self, completions: StubCompletions):
+        self.chat = SimpleNamespace(completions=completions)
+
+    async def close(self):
+        pass
@@ -0,0 +1,41 @@
+import asyncio
+import routes.generate as generate
+from utils.rate_limit import TokenBucketLimiter
+
+REQUEST = {"name": "Paneer Tikka", "model": "gpt-3.5-turbo"}
+
+def post(api, *bodies):
+    async def run():
+        async with api() as client:
+            return [await client.post("/api/v1/generate-description", json=body) for body in bodies]
+    return asyncio.run(run())
+
+def test_miss_then_hit_counts_once_each(api, manager, upstream):
+    responses = post(api, REQUEST, REQUEST)
+    assert [response.status_code for response in responses] == [200, 200]
+    stats = manager.cache_stats()
+    # The single-flight leader's re-check does not count a second miss
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert upstream.calls == 1
+
+def test_rate_limited_request_does_not_count_or_touch(api, manager, monkeypatch):
+    post(api, REQUEST)
+    entry = manager.peek_cached_entry(REQUEST["name"], REQUEST["model"])
+    before = manager.cache_stats()
+    # Drained and never refilled
+    limiter = TokenBucketLimiter(1, 0, {})
+    limiter.try_acquire("ip:127.0.0.1", 1)
+    monkeypatch.setattr(generate, "token_limiter", limiter)
+    responses = post(api, REQUEST)
+    assert responses[0].status_code == 429
+    after = manager.cache_stats()
+    assert (after["hits"], after["misses"]) == (before["hits"], before["misses"])
+    assert entry.access_count == 1
+
+def test_peek_respects_fallback_ttl(manager):
+    request = generate.FoodItemRequest(**REQUEST)
+    manager.fallback_ttl = -1
+    manager.store_generated_description(request, "template", "template", fallback=True)
+    assert manager.peek_cached_entry(REQUEST["name"], REQUEST["model"]) is None
+    assert manager.peek_cached_entry(REQUEST["name"], REQUEST["model"], allow_expired=True).description == "template"
+    assert manager.cache_stats()["hits"] == manager.cache_stats()["misses"] == 0
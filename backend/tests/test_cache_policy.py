@@ -0,0 +1,29 @@
+import pytest
+from models.cache_policy import BoundedCache
+from models.records import CacheRecord
+
+def record(name: str) -> CacheRecord:
+    return CacheRecord(None, name, "gpt-3.5-turbo", "Crispy and golden.", "Add fries!")
+
+@pytest.mark.parametrize("policy", ["lru", "lfu"])
+def test_full_cache_admits_a_new_key(policy):
+    cache = BoundedCache(policy=policy, max_entries=2)
+    cache["a"], cache["b"] = record("a"), record("b")
+    for _ in range(2):
+        cache.lookup("a")
+        cache.lookup("b")
+    cache["new"] = record("new")
+    assert "new" in cache and len(cache) == 2
+    assert cache.evictions == 1
+
+def test_lfu_evicts_the_least_used_resident():
+    cache = BoundedCache(policy="lfu", max_entries=2)
+    cache["a"], cache["b"] = record("a"), record("b")
+    cache.lookup("a")
+    cache["new"] = record("new")
+    assert sorted(cache) == ["a", "new"]
+
+def test_entry_over_the_byte_budget_is_kept_alone():
+    cache = BoundedCache(max_bytes=1)
+    cache["a"], cache["b"] = record("a"), record("b")
+    assert list(cache) == ["b"]
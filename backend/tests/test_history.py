@@ -0,0 +1,107 @@
+import asyncio
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+import pytest
+from models.food_item_manager import FoodItemManager
+from models.history_log import HistoryLog
+from models.records import HistoryRecord, to_timestamp
+from models.sqlite_backend import SQLiteBackend
+from schemas.food_item import FoodItemRequest
+
+def get(api, *urls):
+    async def run():
+        async with api() as client:
+            return [await client.get(url) for url in urls]
+    return asyncio.run(run())
+
+def token(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+def generate(manager, name: str):
+    manager.store_generated_description(FoodItemRequest(name=name, model="gpt-3.5-turbo"), "description", "upsell")
+
+def test_pages_follow_the_cursor(api, manager):
+    for i in range(5):
+        generate(manager, f"Dish {i}")
+    first, = get(api, "/api/v1/history?limit=3")
+    assert first.status_code == 200
+    page = first.json()
+    second, = get(api, f"/api/v1/history?limit=3&cursor={page['next_cursor']}")
+    assert len(page["items"]) == 3 and len(second.json()["items"]) == 2
+    assert second.json()["next_cursor"] is None
+
+@pytest.mark.parametrize("cursor", [["2026-01-01T00:00:00", 1], [1, "2"], [1.5, 1], [True, 1], [1, 2, 3], {"a": 1}])
+def test_cursor_of_the_wrong_shape_is_rejected(api, cursor):
+    response, = get(api, f"/api/v1/history?cursor={token(cursor)}")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid history cursor"
+
+def test_sqlite_cursor_needs_a_timestamp_string(tmp_path):
+    manager = FoodItemManager(backend=SQLiteBackend(str(tmp_path / "food_items.db")))
+    try:
+        for i in range(3):
+            generate(manager, f"Dish {i}")
+        _, next_cursor = manager.query_history(limit=2)
+        assert len(manager.query_history(cursor=next_cursor, limit=2)[0]) == 1
+        with pytest.raises(ValueError):
+            manager.query_history(cursor=token([1, 2]))
+    finally:
+        manager.close()
+
+def test_aware_datetimes_are_converted_to_utc():
+    naive = datetime(2026, 1, 1, 12, 0)
+    plus_two = naive.replace(tzinfo=timezone(timedelta(hours=2))) + timedelta(hours=2)
+    assert to_timestamp(naive) == to_timestamp(plus_two) == to_timestamp(plus_two.isoformat())
+
+def test_since_with_an_offset_filters_in_utc(api, manager):
+    generate(manager, "Dal")
+    created = manager.get_history("Dal")[0].created_at
+    # Just before created_at, written two hours ahead of UTC; read as UTC it would be two hours later
+    since = (created.replace(tzinfo=timezone.utc) - timedelta(seconds=1)).astimezone(timezone(timedelta(hours=2)))
+    response, = get(api, f"/api/v1/history?since={quote(since.isoformat())}")
+    assert [item["name"] for item in response.json()["items"]] == ["Dal"]
+
+def record(i: int, created_at: int, name: str = None) -> dict:
+    model = "gpt-4.1-mini" if i % 3 == 0 else "gpt-3.5-turbo"
+    return HistoryRecord(str(i), name or f"Dish {i}", model, "d", "u", created_at)
+
+def all_pages(log: HistoryLog, model: str = None):
+    ids, cursor = [], None
+    while True:
+        records, cursor = log.page(model, cursor=cursor, limit=4)
+        ids += [int(record.id) for record in records]
+        if cursor is None:
+            return ids
+
+def test_pages_span_checkpointed_and_new_records(tmp_path):
+    path = str(tmp_path / "history.jsonl")
+    log = HistoryLog(path)
+    log.append_many([record(i, 1000 + i) for i in range(10)])
+    log.checkpoint()
+    # 10 is late: older than everything already in the time files
+    log.append_many([record(i, 1000 + i) for i in range(11, 15)] + [record(10, 900)])
+    newest_first = [14, 13, 12, 11, 9, 8, 7, 6, 5, 4, 3, 2, 1, 0, 10]
+    assert all_pages(log) == newest_first
+    log.close()
+
+    log = HistoryLog(path)
+    assert all_pages(log) == newest_first
+    assert all_pages(log, "gpt-4.1-mini") == [i for i in newest_first if i % 3 == 0]
+    records, _ = log.page(since=1005, until=1012, limit=50)
+    assert [int(record.id) for record in records] == [12, 11, 9, 8, 7, 6, 5]
+    log.close()
+
+def test_retention_compacts_the_log(tmp_path):
+    log = HistoryLog(str(tmp_path / "history.jsonl"), max_per_name=2)
+    log.append_many([record(i, 1000 + i, name="Dal") for i in range(5)])
+    assert log.needs_compaction()
+    log.compact()
+    assert not log.needs_compaction()
+    assert [record.id for record in log.history("dal")] == ["3", "4"]
+    assert log.count("dal") == 5 and all_pages(log) == [4, 3]
+    log.close()
+
+def test_history_is_capped_by_default(manager):
+    assert manager.storage.max_per_name == 20
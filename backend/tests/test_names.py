@@ -0,0 +1,110 @@
+import asyncio
+import json
+import sqlite3
+import pytest
+from models.history_log import HistoryLog
+from models.name_index import normalize_name
+from models.records import HistoryRecord, to_timestamp
+from models.sqlite_backend import SQLiteBackend
+from schemas.food_item import FoodItemRequest
+
+def send(api, *requests):
+    async def run():
+        async with api() as client:
+            return [await client.request(method, url, json=body) for method, url, body in requests]
+    return asyncio.run(run())
+
+def test_names_without_letters_or_numbers_are_rejected(api, upstream):
+    responses = send(
+        api,
+        ("POST", "/api/v1/generate-description", {"name": "--", "model": "gpt-3.5-turbo"}),
+        ("POST", "/api/v1/regenerate-description", {"name": "' -", "model": "gpt-3.5-turbo"}),
+        ("POST", "/api/v1/generate-descriptions/batch", {"items": [{"name": "Dal"}, {"name": "--"}]}),
+        ("POST", "/api/v1/generate-description/stream", {"name": "-", "model": "gpt-3.5-turbo"}),
+    )
+    assert [response.status_code for response in responses] == [422] * 4
+    assert responses[0].json()["detail"][0]["loc"] == ["name"]
+    assert upstream.calls == 0
+
+def test_spelling_variants_share_history(api):
+    body = {"model": "gpt-3.5-turbo"}
+    responses = send(
+        api,
+        ("POST", "/api/v1/generate-description", {**body, "name": "Margherita Pizza"}),
+        ("POST", "/api/v1/regenerate-description", {**body, "name": "pizza margherita"}),
+        ("POST", "/api/v1/regenerate-description", {**body, "name": "Margherita Pizzas"}),
+        ("GET", "/api/v1/history/MARGHERITA-PIZZA", None),
+        ("GET", "/api/v1/analytics/top-dishes?by=generations", None),
+    )
+    history, ranking = responses[-2].json(), responses[-1].json()
+    assert [record["name"] for record in history] == ["Margherita Pizza", "pizza margherita", "Margherita Pizzas"]
+    assert ranking == [{"name": "Margherita Pizzas", "model": None, "count": 3}]
+
+@pytest.mark.parametrize("singular, plural", [
+    ("Cookie", "Cookies"), ("Brownie", "Brownies"), ("Pie", "Pies"), ("Quiche", "Quiches"),
+    ("Berry", "Berries"), ("Sandwich", "Sandwiches"), ("Taco", "Tacos"),
+])
+def test_plurals_share_a_key(singular, plural):
+    assert normalize_name(singular) == normalize_name(plural) == singular.lower()
+
+def store(manager, name: str):
+    """Cache a generation whose description is the name it was generated for"""
+    manager.store_generated_description(FoodItemRequest(name=name, model="gpt-3.5-turbo"), name, "upsell")
+
+def test_size_variants_are_not_merged(manager):
+    store(manager, "Pepperoni Pizza")
+    assert manager.peek_cached_entry("Pepperoni Pizza XL", "gpt-3.5-turbo") is None
+    store(manager, "Pepperoni Pizza XL")
+    # Misspellings still match within the same size
+    assert manager.peek_cached_entry("Peperoni Pizza XL", "gpt-3.5-turbo").description == "Pepperoni Pizza XL"
+    assert manager.peek_cached_entry("Peperoni Pizza", "gpt-3.5-turbo").description == "Pepperoni Pizza"
+
+def test_history_log_from_raw_names_is_migrated(tmp_path):
+    path = tmp_path / "history.jsonl"
+    lines = [{"log_id": "old"}]
+    offsets = {}
+    position = 0
+    for i, name in enumerate(["Pizza Margherita", "Dal", "margherita pizzas"]):
+        position += len(json.dumps(lines[-1]).encode()) + 1
+        lines.append({
+            "id": str(i), "name": name, "model": "gpt-3.5-turbo", "description": f"d{i}", "upsell": f"u{i}",
+            "created_at": f"2026-01-0{i + 1}T00:00:00", "usage_count": 1, "prev": offsets.get(name)
+        })
+        offsets[name] = position
+    path.write_text("".join(json.dumps(line) + "\n" for line in lines))
+
+    log = HistoryLog(str(path))
+    assert log.count("margherita pizza") == 2
+    assert [record.description for record in log.history("margherita pizza")] == ["d0", "d2"]
+    assert log.top_names(1) == [("margherita pizza", 2)]
+    log.close()
+    # The rewritten log opens without migrating again
+    log = HistoryLog(str(path))
+    assert log.count("margherita pizza") == 2 and log.count("dal") == 1
+    log.close()
+
+def test_sqlite_history_from_raw_names_is_migrated(tmp_path):
+    path = str(tmp_path / "food_items.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE history (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT, name TEXT NOT NULL, model TEXT NOT NULL,
+            description TEXT NOT NULL, upsell TEXT NOT NULL, created_at TEXT NOT NULL,
+            usage_count INTEGER NOT NULL DEFAULT 1
+        );
+        CREATE INDEX history_name ON history (name, seq);
+        CREATE TABLE history_names (name TEXT PRIMARY KEY, count INTEGER NOT NULL);
+        INSERT INTO history (name, model, description, upsell, created_at) VALUES
+            ('Pizza Margherita', 'gpt-3.5-turbo', 'd0', 'u0', '2026-01-01T00:00:00'),
+            ('margherita pizzas', 'gpt-3.5-turbo', 'd1', 'u1', '2026-01-02T00:00:00');
+        -- Counts include generations already dropped by compaction
+        INSERT INTO history_names VALUES ('Pizza Margherita', 5), ('margherita pizzas', 1);
+    """)
+    conn.close()
+
+    backend = SQLiteBackend(path)
+    assert backend.storage.count("margherita pizza") == 6
+    assert [record.description for record in backend.storage.history("margherita pizza")] == ["d0", "d1"]
+    backend.storage.append(HistoryRecord(None, "Margherita Pizza", "gpt-3.5-turbo", "d2", "u2", to_timestamp("2026-01-03T00:00:00")))
+    assert backend.storage.top_names(1) == [("margherita pizza", 7)]
+    backend.close()
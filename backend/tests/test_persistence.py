@@ -0,0 +1,51 @@
+import asyncio
+import time
+from models.persistence import WriteBehindFlusher
+
+def test_backpressure_does_not_stall_the_loop():
+    flusher = WriteBehindFlusher(max_queue=2)
+    written = []
+
+    def slow_write(i: int):
+        time.sleep(0.02)
+        written.append(i)
+
+    async def produce():
+        for i in range(20):
+            await flusher.wait_for_capacity()
+            flusher.submit(slow_write, i)
+
+    async def run() -> float:
+        # Ticks on the loop while the producer waits for the slow writer to make room
+        producer = asyncio.create_task(produce())
+        worst = 0.0
+        while not producer.done():
+            start = time.monotonic()
+            await asyncio.sleep(0.005)
+            worst = max(worst, time.monotonic() - start)
+        await producer
+        return worst
+
+    try:
+        assert asyncio.run(run()) < 0.05
+        flusher.drain()
+        assert written == list(range(20))
+    finally:
+        flusher.close()
+
+def test_waiters_wake_when_the_writer_takes_a_job():
+    flusher = WriteBehindFlusher(max_queue=1)
+
+    async def run() -> float:
+        flusher.submit(time.sleep, 0.05)
+        flusher.submit(time.sleep, 0.05)
+        start = time.monotonic()
+        await asyncio.wait_for(flusher.wait_for_capacity(), timeout=1.0)
+        return time.monotonic() - start
+
+    try:
+        # Room opens once the first job finishes and the writer takes the second
+        assert asyncio.run(run()) < 0.2
+        assert flusher.has_capacity()
+    finally:
+        flusher.close()
@@ -0,0 +1,34 @@
+import asyncio
+import prewarm
+from prewarm import Prewarmer, load_checkpoint, read_menu
+
+MENU = [
+    '{"name": "Dal Makhani"}',
+    '[1, 2]',
+    'not json',
+    '{"name": "Paneer Tikka"}',
+    '{"name": "Aloo Gobi"}',
+]
+
+def test_bad_rows_are_skipped_and_failed_rows_are_retried(tmp_path, manager, openai, upstream, monkeypatch):
+    menu = tmp_path / "menu.jsonl"
+    menu.write_text("\n".join(MENU) + "\n")
+    checkpoint = str(tmp_path / "menu.jsonl.prewarm.json")
+    monkeypatch.setattr(prewarm, "openai_client", openai)
+    # The second generation (line 4) fails without retries
+    upstream.script.extend([0.0, ValueError("bad request")])
+
+    def run(start_line: int) -> dict:
+        prewarmer = Prewarmer(manager, concurrency=1, write_batch=1, checkpoint_file=checkpoint)
+        return asyncio.run(prewarmer.run(read_menu(str(menu), "gpt-3.5-turbo"), start_line, dry_run=False))
+
+    stats = run(0)
+    assert (stats["invalid"], stats["generated"], stats["failed"]) == (2, 2, 1)
+    # The checkpoint stops at the failed row rather than passing it
+    assert load_checkpoint(checkpoint) == 4
+
+    stats = run(load_checkpoint(checkpoint))
+    assert (stats["generated"], stats["cached"], stats["failed"]) == (1, 1, 0)
+    assert load_checkpoint(checkpoint) == 6
+    assert upstream.calls == 4
+    assert manager.is_cached("Paneer Tikka", "gpt-3.5-turbo")
@@ -0,0 +1,86 @@
+import asyncio
+import sqlite3
+import time
+import routes.generate as generate
+from starlette.requests import Request
+from utils.rate_limit import SQLiteTokenBuckets, TokenBucketLimiter, parse_api_keys
+
+def request_with(headers: dict, host: str = "10.0.0.1") -> Request:
+    return Request({
+        "type": "http",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        "client": (host, 1234),
+    })
+
+def test_batch_larger_than_the_burst_is_served_and_leaves_debt(api, upstream, monkeypatch):
+    # Refills one token per second, so the debt is visible in Retry-After
+    limiter = TokenBucketLimiter(10, 1, {"gpt-3.5-turbo": 1.0, "gpt-4.1-mini": 2.0})
+    monkeypatch.setattr(generate, "token_limiter", limiter)
+    items = [{"name": f"Dish {i}", "model": "gpt-4.1-mini"} for i in range(20)]
+
+    async def run():
+        async with api() as client:
+            batch = await client.post("/api/v1/generate-descriptions/batch", json={"items": items})
+            single = await client.post("/api/v1/generate-description", json={"name": "Dal", "model": "gpt-3.5-turbo"})
+            return batch, single
+
+    batch, single = asyncio.run(run())
+    assert batch.status_code == 200
+    assert batch.json()["generated"] == 20
+    # 40 tokens spent from 10: about 30 seconds of debt plus the next request's cost
+    assert single.status_code == 429
+    assert 30 <= int(single.headers["Retry-After"]) <= 32
+
+def test_batch_over_capacity_waits_for_a_full_bucket():
+    limiter = TokenBucketLimiter(10, 1, {})
+    assert limiter.try_acquire("ip:a", 3) == (True, 0.0)
+    allowed, retry_after = limiter.try_acquire("ip:a", 50)
+    assert not allowed and 2.9 < retry_after <= 3.0
+
+def test_only_configured_api_keys_get_their_own_bucket():
+    limiter = TokenBucketLimiter(10, 1, {}, api_keys=parse_api_keys("alpha=acme, beta=acme, gamma"))
+    assert limiter.client_key(request_with({"X-API-Key": "alpha"})) == "tenant:acme"
+    assert limiter.client_key(request_with({"X-API-Key": "beta"})) == "tenant:acme"
+    assert limiter.client_key(request_with({"X-API-Key": "gamma"})) == "key:gamma"
+    # Unlisted keys and tenant headers cannot pick a fresh bucket
+    assert limiter.client_key(request_with({"X-API-Key": "forged"})) == "ip:10.0.0.1"
+    assert limiter.client_key(request_with({"X-Tenant-ID": "acme"})) == "ip:10.0.0.1"
+
+def test_workers_share_buckets_through_sqlite(tmp_path):
+    store = str(tmp_path / "food_items.db")
+    first = TokenBucketLimiter(10, 0, {}, store=SQLiteTokenBuckets(store))
+    second = TokenBucketLimiter(10, 0, {}, store=SQLiteTokenBuckets(store))
+    try:
+        assert first.try_acquire("ip:a", 8)[0]
+        first.sync()
+        # Unknown to the second worker until it syncs the key
+        assert second.try_acquire("ip:a", 1)[0]
+        second.sync()
+        assert not second.try_acquire("ip:a", 2)[0]
+        assert second.try_acquire("ip:a", 1)[0]
+    finally:
+        first.close()
+        second.close()
+
+def test_checks_do_not_wait_for_a_locked_database(tmp_path):
+    store = str(tmp_path / "food_items.db")
+    limiter = TokenBucketLimiter(1e9, 1e9, {}, store=SQLiteTokenBuckets(store), sync_interval=0.01)
+    other = sqlite3.connect(store, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+
+    async def run() -> float:
+        # Checks keep passing and the loop keeps ticking while the sync thread waits on the lock
+        worst = 0.0
+        for _ in range(50):
+            start = time.monotonic()
+            await asyncio.sleep(0.01)
+            assert limiter.try_acquire("ip:a", 1)[0]
+            worst = max(worst, time.monotonic() - start)
+        return worst
+
+    try:
+        assert asyncio.run(run()) < 0.1
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+        limiter.close()
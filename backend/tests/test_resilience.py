@@ -0,0 +1,107 @@
+import asyncio
+import time
+from stubs import connection_error
+
+def generate(client, name: str = "Dal Makhani", model: str = "gpt-3.5-turbo"):
+    return client.generate_food_description(food_name=name, model_type=model)
+
+def test_retryable_errors_are_retried(make_openai, upstream):
+    openai = make_openai()
+    upstream.script.extend([connection_error(), connection_error()])
+    generation = asyncio.run(generate(openai))
+    assert not generation.fallback
+    assert upstream.calls == 3
+
+def test_breaker_opens_probes_and_closes(make_openai, upstream, monkeypatch):
+    monkeypatch.setenv("OPENAI_MAX_RETRIES", "0")
+    monkeypatch.setenv("OPENAI_BREAKER_FAILURES", "3")
+    monkeypatch.setenv("OPENAI_BREAKER_RESET_SECONDS", "0.05")
+    openai = make_openai()
+    breaker = openai.breakers["gpt-3.5-turbo"]
+
+    async def run():
+        upstream.script.extend([connection_error()] * 3)
+        for _ in range(3):
+            assert (await generate(openai)).fallback
+        assert breaker.state == "open"
+        # Open: served from the template without calling upstream
+        assert (await generate(openai)).fallback
+        assert upstream.calls == 3
+
+        # Half-open: one probe, and its failure re-opens the circuit
+        await asyncio.sleep(0.06)
+        upstream.script.append(connection_error())
+        assert (await generate(openai)).fallback
+        assert breaker.state == "open" and upstream.calls == 4
+
+        # Concurrent requests while half-open send a single probe; its success closes the circuit
+        await asyncio.sleep(0.06)
+        upstream.script.append(0.02)
+        generations = await asyncio.gather(*(generate(openai) for _ in range(5)))
+        assert sum(not generation.fallback for generation in generations) == 1
+        assert breaker.state == "closed" and upstream.calls == 5
+
+    asyncio.run(run())
+
+def test_retry_budget_caps_retries(make_openai, upstream, monkeypatch):
+    monkeypatch.setenv("OPENAI_MAX_RETRIES", "100")
+    monkeypatch.setenv("OPENAI_BREAKER_FAILURES", "1000")
+    # No deposits, so only the initial 10 tokens can be spent
+    monkeypatch.setenv("OPENAI_RETRY_BUDGET_RATIO", "0")
+    monkeypatch.setenv("OPENAI_RETRY_BUDGET_MIN_PER_SECOND", "0")
+    openai = make_openai()
+    upstream.script.extend([connection_error()] * 100)
+
+    async def run():
+        assert (await generate(openai)).fallback
+        assert upstream.calls == 1 + 10
+        # Budget spent: the next request gets its first attempt only
+        assert (await generate(openai)).fallback
+        assert upstream.calls == 12
+
+    asyncio.run(run())
+
+def test_slow_call_is_hedged(make_openai, upstream, monkeypatch):
+    monkeypatch.setenv("OPENAI_HEDGE_REQUESTS", "true")
+    monkeypatch.setenv("OPENAI_HEDGE_PERCENTILE", "0.5")
+    openai = make_openai()
+    upstream.delay = 0.01
+
+    async def run():
+        # Enough samples for a hedge delay
+        for i in range(20):
+            await generate(openai, f"Warm up {i}")
+        calls = upstream.calls
+        upstream.script.extend([1.0, 0.0])
+        start = time.monotonic()
+        generation = await generate(openai)
+        assert time.monotonic() - start < 0.5
+        assert not generation.fallback
+        assert upstream.calls == calls + 2
+
+        # Without retry budget there is no hedge, so the slow call is waited out
+        openai.retry_budget.tokens = 0
+        openai.retry_budget.min_per_second = 0
+        upstream.script.append(0.2)
+        start = time.monotonic()
+        await generate(openai)
+        assert time.monotonic() - start >= 0.2
+        assert upstream.calls == calls + 3
+
+    asyncio.run(run())
+
+def test_slow_stream_reader_does_not_hold_an_upstream_slot(make_openai, monkeypatch):
+    monkeypatch.setenv("OPENAI_MAX_CONCURRENCY", "1")
+    openai = make_openai()
+
+    async def run():
+        stream = openai.stream_food_description("Dal Makhani")
+        await stream.__anext__()
+        # The client stops reading; its reply has ended upstream, so the only slot is free
+        other = await asyncio.wait_for(generate(openai, "Paneer Tikka"), timeout=1.0)
+        events = [event async for event in stream]
+        return other, events[-1]
+
+    other, (event, result) = asyncio.run(run())
+    assert not other.fallback
+    assert event == "result" and not result["fallback"]
@@ -0,0 +1,92 @@
+import asyncio
+import sqlite3
+import time
+from schemas.food_item import FoodItemRequest
+from utils.usage import UsageTracker
+
+PREMIUM = {"name": "Lamb Rogan Josh", "model": "gpt-4.1-mini"}
+
+def post(api, body):
+    async def run():
+        async with api() as client:
+            return await client.post("/api/v1/generate-description", json=body)
+    return asyncio.run(run())
+
+def test_budget_downgrade_is_cached_as_a_fallback(api, openai, manager, upstream):
+    openai.routing.budget_usd = 1.0
+    openai.usage.record("gpt-4.1-mini", [], 0, 500_000, 0.0)
+    assert post(api, PREMIUM).status_code == 200
+    assert upstream.requests[-1]["model"] == "gpt-3.5-turbo"
+    entry = manager.peek_cached_entry(PREMIUM["name"], PREMIUM["model"])
+    assert entry.fallback
+
+    # A later premium generation replaces it; the downgraded reply never replaces a premium one
+    openai.routing.budget_usd = 0.0
+    manager.fallback_ttl = -1
+    assert post(api, PREMIUM).status_code == 200
+    assert upstream.requests[-1]["model"] == "gpt-4.1-mini"
+    assert not manager.peek_cached_entry(PREMIUM["name"], PREMIUM["model"]).fallback
+
+def test_over_budget_serves_the_template_without_calling_upstream(api, openai, upstream):
+    openai.routing.budget_usd = 1.0
+    openai.usage.record("gpt-4.1-mini", [], 0, 1_000_000, 0.0)
+    response = post(api, PREMIUM)
+    assert response.status_code == 200
+    assert upstream.calls == 0
+
+def test_slow_premium_model_is_downgraded_and_probed(openai, upstream):
+    openai.routing.latency_slo = 1.0
+    for _ in range(20):
+        openai.latencies["gpt-4.1-mini"].observe(2.0)
+
+    async def run():
+        return [await openai.generate_food_description(f"Dish {i}", "gpt-4.1-mini") for i in range(20)]
+
+    generations = asyncio.run(run())
+    models = [request["model"] for request in upstream.requests]
+    # One in probe_every still goes to the slow model so its latency window moves
+    assert models.count("gpt-4.1-mini") == 1 and models.count("gpt-3.5-turbo") == 19
+    assert sum(generation.fallback for generation in generations) == 19
+
+def test_budget_window_is_shared_through_sqlite(tmp_path):
+    prices = {"gpt-4.1-mini": (0.0, 1.0)}
+    db = str(tmp_path / "food_items.db")
+    first = UsageTracker(prices, db_path=db, window_sync_interval=0)
+    second = UsageTracker(prices, db_path=db, window_sync_interval=0)
+    try:
+        first.record("gpt-4.1-mini", ["Dal"], 0, 1000, 0.1)
+        second.record("gpt-4.1-mini", ["Dal"], 0, 2000, 0.1)
+        # Each worker adds its own spend on sync and reads back everyone's
+        first.flush()
+        assert first.window_spent() == 1.0
+        second.flush()
+        first.flush()
+        assert second.window_spent() == first.window_spent() == 3.0
+    finally:
+        first.close()
+        second.close()
+
+def test_fallback_flag_survives_unpacking(openai, manager):
+    openai.routing.budget_usd = 1.0
+    openai.usage.record("gpt-4.1-mini", [], 0, 500_000, 0.0)
+    generation = asyncio.run(openai.generate_food_description(PREMIUM["name"], PREMIUM["model"]))
+    request = FoodItemRequest(**PREMIUM)
+    # Stored the way the batch and prewarm paths store it
+    manager.store_generated_descriptions([(request, *generation)])
+    assert generation.fallback and manager.peek_cached_entry(request.name, request.model).fallback
+
+def test_window_sync_does_not_wait_on_the_database(tmp_path):
+    db = str(tmp_path / "food_items.db")
+    tracker = UsageTracker({"gpt-4.1-mini": (0.0, 1.0)}, db_path=db, window_sync_interval=0)
+    other = sqlite3.connect(db, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        tracker.record("gpt-4.1-mini", ["Dal"], 0, 1000, 0.1)
+        start = time.monotonic()
+        # The sync is queued for the flusher thread, which waits on the lock instead
+        assert [tracker.window_spent() for _ in range(100)] == [1.0] * 100
+        assert time.monotonic() - start < 0.1
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+        tracker.close()
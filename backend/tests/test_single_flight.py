@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+from utils.single_flight import SingleFlight
+
+def test_concurrent_identical_misses_make_one_upstream_call(api, upstream):
+    upstream.delay = 0.05
+
+    async def run():
+        async with api() as client:
+            return await asyncio.gather(*(
+                client.post("/api/v1/generate-description", json={"name": "Margherita Pizza", "model": "gpt-4.1-mini"})
+                for _ in range(500)
+            ))
+
+    responses = asyncio.run(run())
+    assert [response.status_code for response in responses] == [200] * 500
+    assert len({response.json()["description"] for response in responses}) == 1
+    assert upstream.calls == 1
+
+def test_spelling_variants_share_one_upstream_call(api, upstream):
+    upstream.delay = 0.05
+
+    async def run():
+        async with api() as client:
+            return await asyncio.gather(*(
+                client.post("/api/v1/generate-description", json={"name": name, "model": "gpt-3.5-turbo"})
+                for name in ("Margherita Pizza", "margherita pizzas", "Pizza Margherita") * 20
+            ))
+
+    responses = asyncio.run(run())
+    assert all(response.status_code == 200 for response in responses)
+    assert upstream.calls == 1
+
+def test_failure_reaches_every_waiter_and_is_not_cached():
+    flight = SingleFlight()
+    calls = 0
+
+    async def fail():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        outcomes = await asyncio.gather(*(flight.do("key", fail) for _ in range(10)), return_exceptions=True)
+        assert flight.in_flight() == 0
+        # The next call after a failure runs again rather than reusing the error
+        with pytest.raises(RuntimeError):
+            await flight.do("key", fail)
+        return outcomes
+
+    outcomes = asyncio.run(run())
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert calls == 2
+
+def test_waiter_timeout_does_not_cancel_the_shared_call():
+    flight = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        impatient = asyncio.ensure_future(flight.do("key", slow, timeout=0.01))
+        patient = asyncio.ensure_future(flight.do("key", slow))
+        with pytest.raises(asyncio.TimeoutError):
+            await impatient
+        return await patient
+
+    assert asyncio.run(run()) == "done"
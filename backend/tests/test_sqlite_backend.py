@@ -0,0 +1,89 @@
+import multiprocessing
+import time
+from models.records import CacheRecord
+from models.sqlite_backend import SQLiteBackend
+from utils.rate_limit import SQLiteTokenBuckets, TokenBucketLimiter
+
+WORKERS = 4
+LOOKUPS = 200
+
+def record(name: str, fallback: bool = False) -> CacheRecord:
+    return CacheRecord(None, name, "gpt-4.1-mini", f"{name} description", f"{name} upsell", fallback=fallback)
+
+def look_up(path: str, worker: int):
+    backend = SQLiteBackend(path)
+    for i in range(LOOKUPS):
+        # Even lookups hit the seeded entry, odd ones miss
+        backend.cache.lookup("seeded" if i % 2 == 0 else f"missing-{worker}-{i}")
+    backend.close()
+
+def take_tokens(path: str, results):
+    limiter = TokenBucketLimiter(25.0, 0.0, {}, store=SQLiteTokenBuckets(path))
+    granted = 0
+    for _ in range(20):
+        granted += limiter.try_acquire("ip:shared", 1.0)[0]
+        limiter.sync()
+    limiter.close()
+    results.put(granted)
+
+def run_processes(context, target, args):
+    """Run ``target`` in WORKERS forked processes, each with its own connections"""
+    processes = [context.Process(target=target, args=args(worker)) for worker in range(WORKERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+
+def test_hit_rate_is_consistent_across_processes(tmp_path):
+    path = str(tmp_path / "food_items.db")
+    backend = SQLiteBackend(path)
+    backend.cache["seeded"] = record("seeded")
+    run_processes(multiprocessing.get_context("fork"), look_up, lambda worker: (path, worker))
+    stats = backend.cache.stats()
+    backend.close()
+    assert stats["hits"] == WORKERS * LOOKUPS // 2
+    assert stats["misses"] == WORKERS * LOOKUPS // 2
+    assert stats["hit_rate"] == 0.5
+
+def test_lookups_do_not_write_until_the_counters_are_flushed(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "food_items.db"))
+    backend.cache["seeded"] = record("seeded")
+    backend.cache.lookup("seeded")
+    backend.cache.lookup("missing")
+    shared = dict(backend.store.query("SELECT name, value FROM counters"))
+    assert "hits" not in shared and "misses" not in shared
+    # This process still sees its own counts
+    assert backend.cache.stats()["hits"] == 1
+    backend.flush()
+    shared = dict(backend.store.query("SELECT name, value FROM counters"))
+    assert shared["hits"] == 1 and shared["misses"] == 1
+    backend.close()
+
+def test_queued_upsert_is_served_before_it_lands(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "food_items.db"))
+    backend._writer.submit(time.sleep, 0.2)
+    backend.store_cache({"dish": record("dish")})
+    assert backend.cache.lookup("dish").description == "dish description"
+    backend.flush()
+    assert backend.store.query("SELECT description FROM cache WHERE key = 'dish'")[0][0] == "dish description"
+    assert len(backend.cache) == 1
+    backend.close()
+
+def test_fallback_does_not_replace_a_generation(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "food_items.db"))
+    backend.store_cache({"dish": record("dish")})
+    backend.store_cache({"dish": CacheRecord(None, "dish", "gpt-4.1-mini", "template", "template", fallback=True)})
+    backend.flush()
+    assert backend.cache["dish"].description == "dish description"
+    backend.close()
+
+def test_token_buckets_are_shared_across_processes(tmp_path):
+    path = str(tmp_path / "food_items.db")
+    SQLiteTokenBuckets(path)
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    run_processes(context, take_tokens, lambda worker: (path, results))
+    # No refill: the capacity is shared, plus at most one check per worker
+    # admitted on a balance another worker had already spent
+    assert 25 <= sum(results.get() for _ in range(WORKERS)) <= 25 + WORKERS
@@ -1,5 +1,20 @@
 # Utils package for AI-Powered Menu Intelligence Widget API
 
-from .openai_client import OpenAIClient, openai_client
+from importlib import import_module
 
-__all__ = ["OpenAIClient", "openai_client"]
+# Where each re-export lives. They load on first access: importing the upstream
+# client here would run whenever any utils module is imported (the models
+# package imports utils.metrics), and the client imports the models package back
+_EXPORTS = {
+    "OpenAIClient": ".openai_client",
+    "openai_client": ".openai_client",
+    "SingleFlight": ".single_flight",
+    "RefreshScheduler": ".refresh",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(_EXPORTS[name], __name__), name)
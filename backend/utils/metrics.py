@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Sequence, Tuple
+
+# Set METRICS_ENABLED=false to turn every metric into a no-op
+ENABLED = os.getenv("METRICS_ENABLED", "true").lower() not in ("0", "false", "no")
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_NOOP = nullcontext()
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    """Base class for a labelled metric in the Prometheus text format"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+    def expose(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(lines + self.collect())
+
+class Counter(Metric):
+    """Monotonic counter"""
+
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in values]
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    type = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+    @contextmanager
+    def track_inprogress(self, *labels: str):
+        """Increment while the block runs"""
+        self.inc(*labels)
+        try:
+            yield
+        finally:
+            self.dec(*labels)
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram of observed values"""
+
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        if not ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 2)
+            state[index] += 1
+            state[-1] += value
+
+    @contextmanager
+    def _timer(self, labels: Tuple[str, ...]):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def time(self, *labels: str):
+        """Context manager that observes the block's duration in seconds"""
+        if not ENABLED:
+            return _NOOP
+        return self._timer(labels)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = [(labels, list(state)) for labels, state in self._values.items()]
+        lines = []
+        for labels, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {state[-1]}")
+        return lines
+
+REGISTRY: List[Metric] = []
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text exposition format"""
+    return "\n".join(metric.expose() for metric in REGISTRY) + "\n"
+
+# Hot-path metrics
+STAGE_SECONDS = Histogram(
+    "menu_stage_duration_seconds",
+    "Time spent in each request-handling stage",
+    ["stage", "model"]
+)
+CACHE_LOOKUPS = Counter(
+    "menu_cache_lookups_total",
+    "Description cache lookups by result",
+    ["result", "model"]
+)
+FALLBACK_GENERATIONS = Counter(
+    "menu_fallback_generations_total",
+    "Descriptions produced by the template fallback instead of the LLM",
+    ["model", "reason"]
+)
+UPSTREAM_ERRORS = Counter(
+    "menu_upstream_errors_total",
+    "Failed calls to the upstream LLM API",
+    ["model"]
+)
+UPSTREAM_RETRIES = Counter(
+    "menu_upstream_retries_total",
+    "Extra upstream attempts spent from the retry budget",
+    ["model", "kind"]
+)
+CIRCUIT_OPEN = Gauge(
+    "menu_upstream_circuit_open",
+    "1 while the model's circuit breaker is open or half-open",
+    ["model"]
+)
+GENERATIONS_IN_FLIGHT = Gauge(
+    "menu_generations_in_flight",
+    "Upstream generations currently running",
+    ["model"]
+)
+BACKGROUND_REFRESHES = Counter(
+    "menu_background_refreshes_total",
+    "Stale-while-revalidate refreshes by outcome",
+    ["model", "outcome"]
+)
+UPSTREAM_TOKENS = Counter(
+    "menu_upstream_tokens_total",
+    "Tokens reported by the upstream LLM API",
+    ["model", "kind"]
+)
+UPSTREAM_COST = Counter(
+    "menu_upstream_cost_usd_total",
+    "Estimated upstream spend in USD",
+    ["model"]
+)
+ROUTING_DECISIONS = Counter(
+    "menu_routing_decisions_total",
+    "Generations rerouted by the budget and latency policy",
+    ["model", "decision"]
+)
+PERSISTENCE_BACKPRESSURE = Counter(
+    "menu_persistence_backpressure_total",
+    "Writes that found the persistence queue full and had to wait"
+)
+
+RATE_LIMIT_REJECTIONS = Counter(
+    "menu_rate_limit_rejections_total",
+    "Requests rejected by the token-bucket rate limiter",
+    ["model"]
+)
+
+def time_stage(stage: str, model: str = ""):
+    """Time a request-handling stage; a shared no-op when metrics are disabled"""
+    if not ENABLED:
+        return _NOOP
+    return STAGE_SECONDS.time(stage, model)
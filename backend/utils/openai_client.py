@@ -1,49 +1,239 @@
 import os
+import asyncio
 import logging
-from typing import Tuple
-from openai import OpenAI
+import time
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+import httpx
+from openai import AsyncOpenAI, APIConnectionError, InternalServerError, RateLimitError
 from dotenv import load_dotenv
+from utils.streaming import SectionStreamParser
+from utils.prompts import MultiStylePrompt, PromptTemplate, parse_item, parse_items, parse_styles
+from utils.resilience import CircuitBreaker, CircuitOpenError, LatencyTracker, RetryBudget, backoff_delay, hedged
+from utils.usage import UsageTracker, create_routing_policy, create_usage_tracker
+from utils.metrics import (
+    CIRCUIT_OPEN,
+    FALLBACK_GENERATIONS,
+    GENERATIONS_IN_FLIGHT,
+    UPSTREAM_ERRORS,
+    UPSTREAM_RETRIES,
+    UPSTREAM_TOKENS,
+    time_stage
+)
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Upstream errors worth retrying and counting against the circuit breaker;
+# anything else (bad request, auth) fails the same way every time
+RETRYABLE_ERRORS = (APIConnectionError, InternalServerError, RateLimitError, asyncio.TimeoutError)
+
+class Generation(NamedTuple):
+    """A description and upsell, and whether they came from the template or a downgraded model"""
+    description: str
+    upsell: str
+    fallback: bool = False
+
 class OpenAIClient:
     """OpenAI client for AI-powered food item description generation"""
     
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
+        self.base_url = os.getenv("OPENAI_BASE_URL")
+        
+        # Connection pool and timeout settings shared by every request
+        self.request_timeout = float(os.getenv("OPENAI_REQUEST_TIMEOUT", "30"))
+        self.connect_timeout = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+        self.max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+        self.max_keepalive_connections = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+        self.max_concurrency = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+        
+        # Caps the number of completions in flight at once
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._http_client = None
+        
+        # Resilience: retries are jittered and limited by a budget shared by all models,
+        # and hedged requests (off by default) fire after the recent p95 latency
+        self.max_retries = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+        self.retry_base_delay = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.2"))
+        self.retry_max_delay = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "2"))
+        self.retry_budget = RetryBudget(
+            ratio=float(os.getenv("OPENAI_RETRY_BUDGET_RATIO", "0.1")),
+            min_per_second=float(os.getenv("OPENAI_RETRY_BUDGET_MIN_PER_SECOND", "1"))
+        )
+        self.hedge_requests = os.getenv("OPENAI_HEDGE_REQUESTS", "false").lower() in ("1", "true", "yes")
+        self.hedge_percentile = float(os.getenv("OPENAI_HEDGE_PERCENTILE", "0.95"))
+        
         if not self.api_key:
             logger.warning("OPENAI_API_KEY not found in environment variables")
             self.client = None
         else:
-            self.client = OpenAI(api_key=self.api_key)
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections
+                ),
+                timeout=httpx.Timeout(self.request_timeout, connect=self.connect_timeout)
+            )
+            # Retries are handled by _create_completion, under the retry budget
+            self.client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=self._http_client,
+                max_retries=0
+            )
         
         # Model configurations
         self.models = {
             "gpt-3.5-turbo": {
                 "name": "gpt-3.5-turbo",
-                "max_tokens": 500,
+                # Completion cap for one JSON reply: a 30-word description and a short upsell
+                "max_tokens": 120,
                 "temperature": 0.7,
-                "style": "light and fresh"
+                "style": "light and fresh",
+                # Rate-limit tokens charged per generation
+                "rate_cost": 1.0,
+                # USD per 1k tokens, for usage accounting and the spend budget
+                "prompt_cost_per_1k": 0.0005,
+                "completion_cost_per_1k": 0.0015
             },
             "gpt-4.1-mini": {
                 "name": "gpt-4.1-mini",
-                "max_tokens": 800,
+                "max_tokens": 160,
                 "temperature": 0.8,
-                "style": "sophisticated and detailed"
+                "style": "sophisticated and detailed",
+                "rate_cost": 2.0,
+                "prompt_cost_per_1k": 0.0004,
+                "completion_cost_per_1k": 0.0016
             }
         }
+        
+        # Prompts are built once per model, so every call shares the same prefix
+        self.prompts = {
+            model: PromptTemplate(config["style"], config["max_tokens"]) for model, config in self.models.items()
+        }
+        # Opt-in: a miss asks one call for every style, so toggling styles afterwards is a cache hit
+        self.multi_style = os.getenv("OPENAI_MULTI_STYLE", "false").lower() in ("1", "true", "yes")
+        self.multi_style_prompt = MultiStylePrompt(
+            {model: config["style"] for model, config in self.models.items()},
+            sum(config["max_tokens"] for config in self.models.values())
+        )
+        
+        # One circuit breaker and latency window per model
+        breaker_failures = int(os.getenv("OPENAI_BREAKER_FAILURES", "5"))
+        breaker_reset = float(os.getenv("OPENAI_BREAKER_RESET_SECONDS", "30"))
+        self.breakers = {model: CircuitBreaker(breaker_failures, breaker_reset) for model in self.models}
+        self.latencies = {model: LatencyTracker() for model in self.models}
+        
+        # Token, cost and latency accounting, and the budget/SLO routing it feeds;
+        # the tracker starts on first use, once the storage modules have loaded
+        self._usage: Optional[UsageTracker] = None
+        self.routing = create_routing_policy()
     
     def is_available(self) -> bool:
         """Check if OpenAI client is properly configured"""
         return self.client is not None and self.api_key is not None
     
+    async def aclose(self):
+        """Close the pooled HTTP connections and flush usage totals"""
+        if self.client is not None:
+            await self.client.close()
+        if self._usage is not None:
+            # The last flush writes to disk or the database
+            await asyncio.to_thread(self._usage.close)
+    
+    @property
+    def usage(self) -> UsageTracker:
+        if self._usage is None:
+            self._usage = create_usage_tracker(self.models)
+        return self._usage
+    
+    def _p95(self, model_type: str) -> Optional[float]:
+        tracker = self.latencies.get(model_type)
+        return tracker.percentile(0.95) if tracker is not None else None
+    
+    def route(self, model_type: str) -> Optional[str]:
+        """Model config that should serve a request for ``model_type``, or None to skip upstream"""
+        return self.routing.route(model_type, self.usage.window_spent(), self._p95)
+    
+    def prefers_cache(self) -> bool:
+        """Whether an expired cache entry should be served instead of calling upstream"""
+        return self.routing.prefers_cache(self.usage.window_spent(), self._p95)
+    
+    def _record_usage(self, model_type: str, items: List[str], usage: Any, latency: float):
+        """Account one upstream response; responses without usage still count the call"""
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+        completion_tokens = getattr(usage, "completion_tokens", None) or 0
+        # Prompt tokens served from upstream's prefix cache
+        cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None) or 0
+        if cached_tokens:
+            UPSTREAM_TOKENS.inc(model_type, "cached_prompt", amount=cached_tokens)
+        self.usage.record(model_type, items, prompt_tokens, completion_tokens, latency)
+    
+    def _record_outcome(self, model_type: str, error: Optional[Exception] = None):
+        """Feed a call outcome to the model's circuit breaker; non-retryable errors still mean upstream is up"""
+        breaker = self.breakers[model_type]
+        if isinstance(error, RETRYABLE_ERRORS):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        CIRCUIT_OPEN.set(model_type, value=float(breaker.state != "closed"))
+    
+    async def _call_once(self, model_type: str, items: List[str], request: Dict[str, Any]) -> Any:
+        """A single upstream attempt under the concurrency cap"""
+        async with self._semaphore:
+            start = time.monotonic()
+            response = await self.client.chat.completions.create(**request)
+        latency = time.monotonic() - start
+        self.latencies[model_type].observe(latency)
+        self._record_usage(model_type, items, getattr(response, "usage", None), latency)
+        return response
+    
+    async def _create_completion(self, model_type: str, items: List[str], **request) -> Any:
+        """
+        Non-streaming completion through the circuit breaker, with jittered
+        retries and optional hedging paid for from the shared retry budget.
+        Every attempt's usage is recorded against ``items``.
+        
+        Raises CircuitOpenError without calling upstream while the breaker is open.
+        """
+        if not self.breakers[model_type].allow():
+            raise CircuitOpenError(f"Circuit open for {model_type}")
+        self.retry_budget.record_request()
+        
+        def allow_hedge() -> bool:
+            if not self.retry_budget.try_spend():
+                return False
+            UPSTREAM_RETRIES.inc(model_type, "hedge")
+            return True
+        
+        attempt = 0
+        while True:
+            delay = self.latencies[model_type].percentile(self.hedge_percentile) if self.hedge_requests else None
+            try:
+                response = await hedged(lambda: self._call_once(model_type, items, request), delay, allow_hedge)
+            except Exception as e:
+                self._record_outcome(model_type, e)
+                if (
+                    not isinstance(e, RETRYABLE_ERRORS)
+                    or attempt >= self.max_retries
+                    or self.breakers[model_type].state != "closed"
+                    or not self.retry_budget.try_spend()
+                ):
+                    raise
+                UPSTREAM_RETRIES.inc(model_type, "retry")
+                logger.warning(f"Retrying {model_type} call after error: {str(e)}")
+                await asyncio.sleep(backoff_delay(attempt, self.retry_base_delay, self.retry_max_delay))
+                attempt += 1
+                continue
+            self._record_outcome(model_type)
+            return response
+    
     async def generate_food_description(
         self, 
         food_name: str, 
         model_type: str = "gpt-3.5"
-    ) -> Tuple[str, str]:
+    ) -> Generation:
         """
         Generate food description and upsell suggestions using OpenAI
         
@@ -52,99 +242,307 @@ class OpenAIClient:
             model_type: Model type ('gpt-3.5-turbo' or 'gpt-4.1-mini')
             
         Returns:
-            Tuple of (description, upsell_suggestions)
+            Generation of (description, upsell_suggestions, fallback); ``fallback``
+            is set when the template or a downgraded model was used
         """
         if not self.is_available():
             logger.warning("OpenAI client not available, using fallback generation")
-            return self._fallback_generation(food_name, model_type)
+            return self._fallback_generation(food_name, model_type, reason="unavailable")
         
         if model_type not in self.models:
             logger.warning(f"Unknown model type: {model_type}, falling back to gpt-3.5-turbo")
             model_type = "gpt-3.5-turbo"
         
-        model_config = self.models[model_type]
+        # The routing policy may move the call to a cheaper model or keep it off upstream
+        upstream_model = self.route(model_type)
+        if upstream_model is None:
+            return self._fallback_generation(food_name, model_type, reason="over_budget")
+        model_config = self.models[upstream_model]
+        # A downgraded reply is cached like a fallback, so it expires and never replaces the requested model's output
+        downgraded = upstream_model != model_type
+        
+        prompt = self.prompts[upstream_model]
         
         try:
-            # Create system prompt
-            system_prompt = f"""You are a professional AI food menu assistant and restaurant marketing expert. 
-            Generate compelling descriptions and upsell messages for food items.
-            Your Tasks:
-            1. Generate a SHORT, catchy description (max 30 words).
-                - Use engaging, food-friendly language.
-                - Use sensory language (taste, smell, texture)
-                - Style should be similar to professional menus (crispy, juicy, tender, spicy, etc.).
-                - Do NOT exceed 30 words.
-                - Include premium ingredients and preparation methods
-            2. Suggest ONE upsell item (a side, drink, or dessert that pairs well).
-                - suggest pairings or enhancements
-                - Keep it short, fun, and appealing.
-            """
-            
-            # Create user prompt
-            user_prompt = f"""Please create a description and upsell suggestions for: {food_name}
-            
-            Format your response as:
-            DESCRIPTION: [your description here]
-            UPSELL: [your upsell message here]"""
-            
-            # Make API call
-            response = self.client.chat.completions.create(
-                model=model_config["name"],
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                max_tokens=model_config["max_tokens"],
-                temperature=model_config["temperature"]
-            )
+            # Make API call without blocking the event loop
+            with GENERATIONS_IN_FLIGHT.track_inprogress(upstream_model), time_stage("llm_call", upstream_model):
+                response = await self._create_completion(
+                    upstream_model,
+                    [food_name],
+                    model=model_config["name"],
+                    messages=prompt.single(food_name),
+                    max_tokens=prompt.max_tokens,
+                    temperature=model_config["temperature"],
+                    response_format={"type": "json_object"},
+                    timeout=self.request_timeout
+                )
             
             # Parse response
             content = response.choices[0].message.content
-            description, upsell = self._parse_openai_response(content)
+            with time_stage("parse", model_type):
+                generation = self._parse_openai_response(content, food_name, model_type, downgraded)
             
-            logger.info(f"Successfully generated description for {food_name} using {model_type}")
-            return description, upsell
+            logger.info(f"Successfully generated description for {food_name} using {upstream_model}")
+            return generation
             
+        except CircuitOpenError:
+            return self._fallback_generation(food_name, model_type, reason="circuit_open")
         except Exception as e:
             logger.error(f"Error calling OpenAI API: {str(e)}")
             logger.info("Falling back to template-based generation")
+            UPSTREAM_ERRORS.inc(upstream_model)
             return self._fallback_generation(food_name, model_type)
     
-    def _parse_openai_response(self, content: str) -> Tuple[str, str]:
-        """Parse OpenAI response to extract description and upsell"""
+    async def generate_food_styles(self, food_name: str, model_type: str = "gpt-3.5-turbo") -> Dict[str, Generation]:
+        """
+        Generate a food item in every model's style with a single OpenAI call
+        
+        Args:
+            food_name: Name of the food item
+            model_type: Model type the caller asked for; its route picks the upstream model
+            
+        Returns:
+            Dict of model type -> Generation. ``model_type`` is always present,
+            from the single-style path if the combined reply missed it; other
+            styles are only present when the model produced them.
+        """
+        if not self.is_available() or model_type not in self.models:
+            return {model_type: await self.generate_food_description(food_name, model_type)}
+        
+        upstream_model = self.route(model_type)
+        if upstream_model is None:
+            return {model_type: self._fallback_generation(food_name, model_type, reason="over_budget")}
+        model_config = self.models[upstream_model]
+        downgraded = upstream_model != model_type
+        prompt = self.multi_style_prompt
+        results: Dict[str, Generation] = {}
+        
         try:
-            lines = content.split('\n')
-            description = ""
-            upsell = ""
-            
-            for line in lines:
-                line = line.strip()
-                if line.startswith("DESCRIPTION:"):
-                    description = line.replace("DESCRIPTION:", "").strip()
-                elif line.startswith("UPSELL:"):
-                    upsell = line.replace("UPSELL:", "").strip()
-            
-            # Fallback parsing if format is different
-            if not description or not upsell:
-                parts = content.split("UPSELL:")
-                if len(parts) == 2:
-                    description = parts[0].replace("DESCRIPTION:", "").strip()
-                    upsell = parts[1].strip()
-                else:
-                    # If parsing fails, split content in half
-                    mid = len(content) // 2
-                    description = content[:mid].strip()
-                    upsell = content[mid:].strip()
-            
-            return description, upsell
+            with GENERATIONS_IN_FLIGHT.track_inprogress(upstream_model), time_stage("llm_call", upstream_model):
+                response = await self._create_completion(
+                    upstream_model,
+                    [food_name],
+                    model=model_config["name"],
+                    messages=prompt.single(food_name),
+                    max_tokens=prompt.max_tokens,
+                    temperature=model_config["temperature"],
+                    response_format={"type": "json_object"},
+                    timeout=self.request_timeout
+                )
             
+            content = response.choices[0].message.content
+            with time_stage("parse", model_type):
+                results = {
+                    model: Generation(*fields, fallback=downgraded)
+                    for model, fields in parse_styles(content, list(self.models)).items()
+                }
+            logger.info(f"Generated {len(results)}/{len(self.models)} styles for {food_name} in one call using {upstream_model}")
+            
+        except CircuitOpenError:
+            pass
+        except Exception as e:
+            logger.error(f"Error calling OpenAI API for styles: {str(e)}")
+            UPSTREAM_ERRORS.inc(upstream_model)
+        
+        if model_type not in results:
+            results[model_type] = await self.generate_food_description(food_name, model_type)
+        return results
+    
+    async def _pump_stream(self, upstream_model: str, food_name: str, chunks: asyncio.Queue):
+        """
+        Read a streamed completion into ``chunks`` under the concurrency cap,
+        then put ``None``, or the error that ended it. The queue holds at most
+        one reply, which ``max_tokens`` bounds.
+        """
+        model_config = self.models[upstream_model]
+        prompt = self.prompts[upstream_model]
+        try:
+            with GENERATIONS_IN_FLIGHT.track_inprogress(upstream_model), time_stage("llm_call", upstream_model):
+                async with self._semaphore:
+                    start = time.monotonic()
+                    usage = None
+                    stream = await self.client.chat.completions.create(
+                        model=model_config["name"],
+                        messages=prompt.single(food_name),
+                        max_tokens=prompt.max_tokens,
+                        temperature=model_config["temperature"],
+                        response_format={"type": "json_object"},
+                        timeout=self.request_timeout,
+                        stream=True,
+                        # The last chunk then carries the token usage
+                        stream_options={"include_usage": True}
+                    )
+                    async for chunk in stream:
+                        usage = getattr(chunk, "usage", None) or usage
+                        if not chunk.choices:
+                            continue
+                        text = chunk.choices[0].delta.content
+                        if text:
+                            chunks.put_nowait(text)
+            self._record_usage(upstream_model, [food_name], usage, time.monotonic() - start)
         except Exception as e:
-            logger.error(f"Error parsing OpenAI response: {str(e)}")
-            # Return fallback if parsing fails
-            return self._fallback_generation("food item", "gpt-3.5")
+            chunks.put_nowait(e)
+        else:
+            chunks.put_nowait(None)
+    
+    async def stream_food_description(
+        self,
+        food_name: str,
+        model_type: str = "gpt-3.5-turbo"
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Stream a food description as it is generated
+        
+        Yields ``(event, data)`` pairs: ``section`` when the description or upsell field
+        starts, ``token`` for each piece of text, and a final ``result``
+        with the assembled description and upsell. Streams go through the
+        circuit breaker but are not retried or hedged once tokens may have been sent.
+        """
+        if not self.is_available():
+            logger.warning("OpenAI client not available, using fallback generation")
+            description, upsell = self._fallback_generation(food_name, model_type, reason="unavailable")
+            yield "result", {"description": description, "upsell": upsell, "fallback": True}
+            return
+        
+        if model_type not in self.models:
+            logger.warning(f"Unknown model type: {model_type}, falling back to gpt-3.5-turbo")
+            model_type = "gpt-3.5-turbo"
+        
+        upstream_model = self.route(model_type)
+        if upstream_model is None:
+            description, upsell = self._fallback_generation(food_name, model_type, reason="over_budget")
+            yield "result", {"description": description, "upsell": upsell, "fallback": True}
+            return
+        
+        parser = SectionStreamParser()
+        fallback = upstream_model != model_type
+        
+        try:
+            if not self.breakers[upstream_model].allow():
+                raise CircuitOpenError(f"Circuit open for {upstream_model}")
+            
+            # Upstream is read by its own task, which gives back the concurrency
+            # slot as soon as the reply ends, however slowly the client reads it
+            chunks: asyncio.Queue = asyncio.Queue()
+            pump = asyncio.create_task(self._pump_stream(upstream_model, food_name, chunks))
+            try:
+                while True:
+                    text = await chunks.get()
+                    if text is None:
+                        break
+                    if isinstance(text, Exception):
+                        raise text
+                    for event in parser.feed(text):
+                        yield event
+            finally:
+                # Only still running when the client went away mid-stream
+                pump.cancel()
+            self._record_outcome(upstream_model)
+            
+            for event in parser.close():
+                yield event
+            
+            with time_stage("parse", model_type):
+                description, upsell = parser.result()
+                if not description or not upsell:
+                    # Cut off or malformed reply
+                    description, upsell = self._fallback_generation(food_name, model_type, reason="parse_error")
+                    fallback = True
+            logger.info(f"Successfully streamed description for {food_name} using {upstream_model}")
+            
+        except CircuitOpenError:
+            description, upsell = self._fallback_generation(food_name, model_type, reason="circuit_open")
+            fallback = True
+        except Exception as e:
+            logger.error(f"Error streaming from OpenAI API: {str(e)}")
+            logger.info("Falling back to template-based generation")
+            UPSTREAM_ERRORS.inc(upstream_model)
+            self._record_outcome(upstream_model, e)
+            description, upsell = self._fallback_generation(food_name, model_type)
+            fallback = True
+        
+        yield "result", {"description": description, "upsell": upsell, "fallback": fallback}
+    
+    async def generate_food_descriptions(
+        self,
+        food_names: List[str],
+        model_type: str = "gpt-3.5-turbo"
+    ) -> Dict[str, Generation]:
+        """
+        Generate descriptions for several food items in a single OpenAI call
+        
+        Args:
+            food_names: Names of the food items
+            model_type: Model type ('gpt-3.5-turbo' or 'gpt-4.1-mini')
+            
+        Returns:
+            Dict of name -> (description, upsell_suggestions). Items the model
+            skipped are generated individually.
+        """
+        if len(food_names) == 1:
+            return {food_names[0]: await self.generate_food_description(food_names[0], model_type)}
+        
+        if not self.is_available():
+            logger.warning("OpenAI client not available, using fallback generation")
+            return {name: self._fallback_generation(name, model_type, reason="unavailable") for name in food_names}
+        
+        if model_type not in self.models:
+            logger.warning(f"Unknown model type: {model_type}, falling back to gpt-3.5-turbo")
+            model_type = "gpt-3.5-turbo"
+        
+        upstream_model = self.route(model_type)
+        if upstream_model is None:
+            return {name: self._fallback_generation(name, model_type, reason="over_budget") for name in food_names}
+        
+        model_config = self.models[upstream_model]
+        prompt = self.prompts[upstream_model]
+        results: Dict[str, Generation] = {}
+        
+        try:
+            with GENERATIONS_IN_FLIGHT.track_inprogress(upstream_model), time_stage("llm_call", upstream_model):
+                response = await self._create_completion(
+                    upstream_model,
+                    food_names,
+                    model=model_config["name"],
+                    messages=prompt.batch(food_names),
+                    max_tokens=prompt.batch_max_tokens(len(food_names)),
+                    temperature=model_config["temperature"],
+                    response_format={"type": "json_object"},
+                    timeout=self.request_timeout
+                )
+            
+            content = response.choices[0].message.content
+            with time_stage("parse", model_type):
+                results = self._parse_batch_response(content, food_names, upstream_model != model_type)
+            logger.info(f"Generated {len(results)}/{len(food_names)} descriptions in one call using {upstream_model}")
+            
+        except CircuitOpenError:
+            pass
+        except Exception as e:
+            logger.error(f"Error calling OpenAI API for batch: {str(e)}")
+            UPSTREAM_ERRORS.inc(upstream_model)
+        
+        # Anything the batched call missed goes through the single-item path
+        for name in food_names:
+            if name not in results:
+                results[name] = await self.generate_food_description(name, model_type)
+        return results
+    
+    def _parse_batch_response(self, content: str, food_names: List[str], downgraded: bool = False) -> Dict[str, Generation]:
+        """Split a multi-item JSON reply into per-item (description, upsell) pairs"""
+        return {name: Generation(*fields, fallback=downgraded) for name, fields in parse_items(content, food_names).items()}
+    
+    def _parse_openai_response(self, content: str, food_name: str, model_type: str, downgraded: bool = False) -> Generation:
+        """Parse a single-item JSON reply; a cut-off or malformed reply gets the template"""
+        fields = parse_item(content)
+        if fields is None:
+            logger.error(f"Could not parse OpenAI response for {food_name}: {content!r}")
+            return self._fallback_generation(food_name, model_type, reason="parse_error")
+        return Generation(*fields, fallback=downgraded)
     
-    def _fallback_generation(self, food_name: str, model_type: str) -> Tuple[str, str]:
+    def _fallback_generation(self, food_name: str, model_type: str, reason: str = "error") -> Generation:
         """Fallback generation when OpenAI is not available"""
+        FALLBACK_GENERATIONS.inc(model_type, reason)
         if model_type == "gpt-3.5-turbo":
             description = f"A delightful {food_name} that brings light and freshness to your palate. "
             description += "This carefully crafted dish features premium ingredients and a balanced flavor profile "
@@ -161,6 +559,6 @@ class OpenAIClient:
             upsell = f"Enhance your {food_name} experience with our premium wine pairing recommendations "
             upsell += "and decadent dessert selection for a truly memorable dining journey!"
         
-        return description, upsell
+        return Generation(description, upsell, fallback=True)
 
 openai_client = OpenAIClient()
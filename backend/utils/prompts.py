@@ -0,0 +1,112 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# One system prompt per model serves single and batched requests, so every call
+# for a model starts with the same tokens and upstream prefix caching can reuse them;
+# only the short user message that follows it varies
+TASK = (
+    "You are a restaurant menu copywriter. For each food item write:\n"
+    "- description: a catchy menu description of at most 30 words, using sensory words "
+    "(taste, smell, texture) and premium ingredients or preparation\n"
+    "- upsell: one short, fun suggestion of a side, drink or dessert that pairs well\n"
+)
+INSTRUCTIONS = TASK + (
+    "Style: {style}.\n"
+    'Reply in JSON only. One item: {{"description": "...", "upsell": "..."}}. '
+    'Several items: {{"items": [{{"name": "...", "description": "...", "upsell": "..."}}]}}, '
+    "with each name exactly as given."
+)
+
+# Both styles of one item in a single reply, keyed by model option
+MULTI_STYLE_INSTRUCTIONS = TASK + (
+    "Write it once in each of these styles:\n{styles}"
+    'Reply in JSON only: {{"styles": {{"<style key>": {{"description": "...", "upsell": "..."}}}}}}, '
+    "with every style key."
+)
+
+# Completion tokens for the name and punctuation of one item in a batched reply
+BATCH_ITEM_OVERHEAD_TOKENS = 24
+
+class PromptTemplate:
+    """Chat messages for one model style, with the system prompt built once"""
+
+    def __init__(self, style: str, max_tokens: int):
+        self.system_message = {"role": "system", "content": INSTRUCTIONS.format(style=style)}
+        self.max_tokens = max_tokens
+
+    def single(self, food_name: str) -> List[Dict[str, str]]:
+        return [self.system_message, {"role": "user", "content": f"Item: {food_name}"}]
+
+    def batch(self, food_names: List[str]) -> List[Dict[str, str]]:
+        items = "\n".join(f"- {name}" for name in food_names)
+        return [self.system_message, {"role": "user", "content": f"Items:\n{items}"}]
+
+    def batch_max_tokens(self, count: int) -> int:
+        return (self.max_tokens + BATCH_ITEM_OVERHEAD_TOKENS) * count
+
+class MultiStylePrompt:
+    """Chat messages asking for every style of an item in one reply, with the system prompt built once"""
+
+    def __init__(self, styles: Dict[str, str], max_tokens: int):
+        lines = "".join(f'- "{key}": {style}\n' for key, style in styles.items())
+        self.system_message = {"role": "system", "content": MULTI_STYLE_INSTRUCTIONS.format(styles=lines)}
+        self.max_tokens = max_tokens
+
+    def single(self, food_name: str) -> List[Dict[str, str]]:
+        return [self.system_message, {"role": "user", "content": f"Item: {food_name}"}]
+
+def _fields(data: Any) -> Optional[Tuple[str, str]]:
+    """(description, upsell) from a decoded item, or None if either is missing"""
+    if not isinstance(data, dict):
+        return None
+    description, upsell = data.get("description"), data.get("upsell")
+    if not isinstance(description, str) or not isinstance(upsell, str):
+        return None
+    description, upsell = description.strip(), upsell.strip()
+    if not description or not upsell:
+        return None
+    return description, upsell
+
+def parse_item(content: str) -> Optional[Tuple[str, str]]:
+    """(description, upsell) from a single-item JSON reply, or None if it is malformed"""
+    try:
+        return _fields(json.loads(content))
+    except (TypeError, ValueError):
+        return None
+
+def parse_items(content: str, food_names: List[str]) -> Dict[str, Tuple[str, str]]:
+    """Name -> (description, upsell) for the requested items found in a batched JSON reply"""
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return {}
+    items = data.get("items") if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return {}
+    wanted = {name.lower(): name for name in food_names}
+    results: Dict[str, Tuple[str, str]] = {}
+    for item in items:
+        fields = _fields(item)
+        name = item.get("name") if isinstance(item, dict) else None
+        if fields is None or not isinstance(name, str):
+            continue
+        name = wanted.get(name.strip().lower())
+        if name is not None:
+            results[name] = fields
+    return results
+
+def parse_styles(content: str, keys: List[str]) -> Dict[str, Tuple[str, str]]:
+    """Style key -> (description, upsell) for the styles found in a multi-style JSON reply"""
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return {}
+    styles = data.get("styles") if isinstance(data, dict) else None
+    if not isinstance(styles, dict):
+        return {}
+    results: Dict[str, Tuple[str, str]] = {}
+    for key in keys:
+        fields = _fields(styles.get(key))
+        if fields is not None:
+            results[key] = fields
+    return results
@@ -0,0 +1,260 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+from fastapi import HTTPException, Request
+from models.persistence import WriteBehindFlusher
+from models.sqlite_backend import connect
+from utils.openai_client import openai_client
+from utils.metrics import RATE_LIMIT_REJECTIONS
+
+class SQLiteTokenBuckets:
+    """Token bucket balances in the shared SQLite database, so every worker process draws on one balance"""
+    
+    # Idle buckets are deleted every this many syncs
+    PRUNE_EVERY = 100
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = connect(path)
+        self._lock = threading.Lock()
+        self._syncs = 0
+        with self._lock:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+    
+    def sync(self, spent: Dict[str, float], capacity: float, refill_per_second: float) -> Dict[str, float]:
+        """
+        Refill the shared buckets of ``spent``'s keys and take what this process
+        spent from them; returns the shared balances. Waits on other workers'
+        writes, so it must not run on the event loop.
+        """
+        now = time.time()
+        balances = {}
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for key, cost in spent.items():
+                    row = self.conn.execute(
+                        "SELECT tokens, updated_at FROM token_buckets WHERE key = ?", (key,)
+                    ).fetchone()
+                    tokens = capacity
+                    if row is not None:
+                        tokens = min(capacity, row[0] + max(0.0, now - row[1]) * refill_per_second)
+                    balances[key] = tokens - cost
+                    self.conn.execute(
+                        "INSERT INTO token_buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                        (key, balances[key], now)
+                    )
+                self._syncs += 1
+                if self._syncs % self.PRUNE_EVERY == 0 and refill_per_second > 0:
+                    # Buckets that have refilled completely are the same as no bucket
+                    self.conn.execute(
+                        "DELETE FROM token_buckets WHERE tokens + (? - updated_at) * ? >= ?",
+                        (now, refill_per_second, capacity)
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return balances
+
+class TokenBucketLimiter:
+    """
+    Cost-aware token buckets keyed by API key or client address.
+    
+    Each caller's bucket holds up to ``capacity`` tokens and refills at
+    ``refill_per_second``; a request spends the cost of what it does, so cache
+    hits are cheap and generations cost their model's ``rate_cost``. A request
+    costing more than ``capacity`` (a large batch) is let through once the
+    bucket is full and leaves it in debt, so the caller waits for the whole cost
+    to refill before the next request. Checks are O(1) against buckets in
+    process memory. With a shared ``store``, what this process spent is pushed
+    to it every ``sync_interval`` seconds on a background thread, and the
+    buckets take the shared balances back, so workers can together overshoot a
+    limit by at most what they admit within one interval.
+    
+    Only API keys in ``api_keys`` get their own bucket, since the header is not
+    otherwise authenticated; a key mapped to a tenant shares that tenant's
+    bucket. Anything else is keyed on the client address.
+    """
+    
+    # How many idle buckets a check may drop, keeping pruning O(1) amortized
+    PRUNE_PER_CHECK = 2
+    
+    def __init__(
+        self,
+        capacity: float,
+        refill_per_second: float,
+        model_costs: Dict[str, float],
+        cache_hit_cost: float = 0.1,
+        api_keys: Optional[Dict[str, Optional[str]]] = None,
+        api_key_header: str = "X-API-Key",
+        store: Optional[SQLiteTokenBuckets] = None,
+        sync_interval: float = 1.0
+    ):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.model_costs = model_costs
+        self.cache_hit_cost = cache_hit_cost
+        # API key -> tenant (or None for a bucket of its own)
+        self.api_keys = api_keys or {}
+        self.api_key_header = api_key_header
+        self.store = store
+        # key -> [tokens, last refill time], least recently used first
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        # Taken on the event loop and by the sync thread
+        self._lock = threading.Lock()
+        # key -> tokens spent here since the last sync with ``store``
+        self._unsynced: Dict[str, float] = {}
+        self._syncer = WriteBehindFlusher(self._sync, sync_interval, max_dirty=10_000) if store is not None else None
+    
+    def client_key(self, request: Request) -> str:
+        """Bucket key: tenant or API key for a configured key, else client address"""
+        api_key = request.headers.get(self.api_key_header)
+        if api_key and api_key in self.api_keys:
+            tenant = self.api_keys[api_key]
+            return f"tenant:{tenant}" if tenant else f"key:{api_key}"
+        return f"ip:{request.client.host if request.client else '127.0.0.1'}"
+    
+    def cost(self, model: str, cached: bool = False) -> float:
+        """Tokens charged for serving one item"""
+        if cached:
+            return self.cache_hit_cost
+        return self.model_costs.get(model, 1.0)
+    
+    def _refill(self, key: str, now: float) -> list:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.capacity, now]
+        else:
+            bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.refill_per_second)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+    
+    def _prune(self, now: float):
+        """Forget least recently used buckets that have refilled completely"""
+        if self.refill_per_second <= 0:
+            return
+        for _ in range(min(self.PRUNE_PER_CHECK, len(self._buckets))):
+            key, bucket = next(iter(self._buckets.items()))
+            if bucket[0] + (now - bucket[1]) * self.refill_per_second < self.capacity:
+                return
+            del self._buckets[key]
+    
+    def _take(self, key: str, cost: float) -> float:
+        """Refill the bucket and spend ``cost`` if it is allowed; returns the balance before spending"""
+        now = time.monotonic()
+        spent = False
+        with self._lock:
+            # Before the refill, so the bucket being charged is never the one dropped
+            self._prune(now)
+            bucket = self._refill(key, now)
+            tokens = bucket[0]
+            if tokens >= min(cost, self.capacity):
+                bucket[0] -= cost
+                if self._syncer is not None and cost:
+                    self._unsynced[key] = self._unsynced.get(key, 0.0) + cost
+                    spent = True
+        if spent:
+            self._syncer.mark_dirty(key)
+        return tokens
+    
+    def _sync(self, keys: Set[str]):
+        """Push the spend on ``keys`` to the store and adopt the shared balances; runs on the sync thread"""
+        with self._lock:
+            spent = {key: self._unsynced.pop(key) for key in keys if key in self._unsynced}
+            synced_at = time.monotonic()
+        try:
+            balances = self.store.sync(spent, self.capacity, self.refill_per_second)
+        except Exception:
+            with self._lock:
+                for key, cost in spent.items():
+                    self._unsynced[key] = self._unsynced.get(key, 0.0) + cost
+            raise
+        with self._lock:
+            for key, tokens in balances.items():
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    # Less what was spent here while the sync ran
+                    bucket[0] = tokens - self._unsynced.get(key, 0.0)
+                    bucket[1] = synced_at
+    
+    def sync(self):
+        """Reconcile with the shared store now; blocks, so call it off the event loop"""
+        if self._syncer is not None:
+            self._syncer.flush()
+    
+    def close(self):
+        """Stop the sync thread after a last sync"""
+        if self._syncer is not None:
+            self._syncer.close()
+    
+    def try_acquire(self, key: str, cost: float) -> Tuple[bool, float]:
+        """Spend ``cost`` tokens if allowed; returns (allowed, seconds until it would be)"""
+        # A cost above capacity only needs a full bucket, and leaves it in debt
+        required = min(cost, self.capacity)
+        tokens = self._take(key, cost)
+        if tokens >= required:
+            return True, 0.0
+        if self.refill_per_second <= 0:
+            return False, float("inf")
+        return False, (required - tokens) / self.refill_per_second
+    
+    def charge(self, request: Request, cost: float, model: str = ""):
+        """Spend ``cost`` from the caller's bucket or raise a 429 with Retry-After"""
+        allowed, retry_after = self.try_acquire(self.client_key(request), cost)
+        if allowed:
+            return
+        RATE_LIMIT_REJECTIONS.inc(model)
+        headers = {"Retry-After": str(math.ceil(retry_after))} if math.isfinite(retry_after) else None
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded: this request costs {cost:g} tokens",
+            headers=headers
+        )
+    
+    def status(self, request: Request) -> dict:
+        """Remaining tokens for the caller, without spending any"""
+        key = self.client_key(request)
+        return {
+            "bucket": key.split(":", 1)[0],
+            "tokens": round(self._take(key, 0.0), 3),
+            "capacity": self.capacity,
+            "refill_per_second": self.refill_per_second,
+            "costs": {**self.model_costs, "cache_hit": self.cache_hit_cost},
+        }
+
+def parse_api_keys(value: str) -> Dict[str, Optional[str]]:
+    """``key[=tenant]`` entries, comma-separated, as an API key -> tenant mapping"""
+    api_keys = {}
+    for entry in value.split(","):
+        key, _, tenant = entry.strip().partition("=")
+        if key:
+            api_keys[key] = tenant.strip() or None
+    return api_keys
+
+def create_token_limiter() -> TokenBucketLimiter:
+    """Token buckets from the RATE_LIMIT_* variables, with model costs from OpenAIClient.models"""
+    # Shared with the cache when the SQLite backend is in use
+    store = None
+    if os.getenv("FOOD_ITEMS_BACKEND", "json") == "sqlite":
+        store = SQLiteTokenBuckets(os.getenv("FOOD_ITEMS_DB", "food_items.db"))
+    return TokenBucketLimiter(
+        capacity=float(os.getenv("RATE_LIMIT_BURST", "10")),
+        refill_per_second=float(os.getenv("RATE_LIMIT_TOKENS_PER_MINUTE", "5")) / 60,
+        model_costs={model: config["rate_cost"] for model, config in openai_client.models.items()},
+        cache_hit_cost=float(os.getenv("RATE_LIMIT_CACHE_HIT_COST", "0.1")),
+        api_keys=parse_api_keys(os.getenv("RATE_LIMIT_API_KEYS", "")),
+        store=store,
+        sync_interval=float(os.getenv("RATE_LIMIT_SYNC_SECONDS", "1"))
+    )
+
+# Cost-aware limits for the generation endpoints
+token_limiter = create_token_limiter()
@@ -0,0 +1,88 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+from utils.metrics import BACKGROUND_REFRESHES
+
+logger = logging.getLogger(__name__)
+
+class RefreshScheduler:
+    """
+    Regenerates stale cache entries in the background.
+
+    Stale hits are queued hottest first (by ``access_count``) and worked off by
+    at most ``max_concurrency`` worker tasks, so refreshes never hold more than
+    that many upstream slots and live misses keep the rest.
+    """
+
+    def __init__(
+        self,
+        refresh_fn: Callable[[str, str], Awaitable[None]],
+        max_concurrency: int = 2,
+        max_queue: int = 1000
+    ):
+        self.refresh_fn = refresh_fn
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        # (-priority, sequence, key, name, model)
+        self._queue: List[Tuple[int, int, str, str, str]] = []
+        # Keys queued or being refreshed, so repeated stale hits schedule one refresh
+        self._pending: Set[str] = set()
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+
+    def queued(self) -> int:
+        """Number of refreshes waiting for a worker"""
+        return len(self._queue)
+
+    def schedule(self, key: str, name: str, model: str, priority: int = 0) -> bool:
+        """Queue a refresh without waiting for it; returns False if it was not queued"""
+        if key in self._pending:
+            return False
+        if len(self._queue) >= self.max_queue or not self._start():
+            BACKGROUND_REFRESHES.inc(model, "dropped")
+            return False
+        self._pending.add(key)
+        heapq.heappush(self._queue, (-priority, next(self._sequence), key, name, model))
+        self._wakeup.set()
+        BACKGROUND_REFRESHES.inc(model, "scheduled")
+        return True
+
+    def _start(self) -> bool:
+        """Start the workers on the running event loop; False outside one"""
+        if self._workers:
+            return True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        self._wakeup = asyncio.Event()
+        self._workers = [loop.create_task(self._work()) for _ in range(self.max_concurrency)]
+        return True
+
+    async def _work(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            _, _, key, name, model = heapq.heappop(self._queue)
+            try:
+                await self.refresh_fn(name, model)
+                BACKGROUND_REFRESHES.inc(model, "completed")
+            except Exception as e:
+                logger.error(f"Error refreshing {name} with model {model}: {str(e)}")
+                BACKGROUND_REFRESHES.inc(model, "failed")
+            finally:
+                self._pending.discard(key)
+
+    async def stop(self):
+        """Cancel the workers and drop queued refreshes"""
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._queue.clear()
+        self._pending.clear()
@@ -0,0 +1,139 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Optional
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while a circuit breaker is open"""
+
+class CircuitBreaker:
+    """
+    Stops calling a failing upstream for a while.
+
+    Closed until ``failure_threshold`` consecutive failures, then open for
+    ``reset_timeout`` seconds, then half-open: one probe call is let through
+    and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        # When the current half-open probe started, or None if there is none
+        self._probe_started: Optional[float] = None
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now"""
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if self.state == "open" and now - self._opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._probe_started = None
+        # A probe that never reported back (e.g. cancelled) is replaced after reset_timeout
+        if self.state == "half_open" and (
+            self._probe_started is None or now - self._probe_started >= self.reset_timeout
+        ):
+            self._probe_started = now
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._probe_started = None
+
+class RetryBudget:
+    """
+    Caps retries (and hedges) to a fraction of first attempts, so a brownout
+    cannot multiply upstream load.
+
+    Every request deposits ``ratio`` tokens and every retry spends one; a
+    trickle of ``min_per_second`` tokens keeps low-traffic periods retryable.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 1.0, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._updated = time.monotonic()
+
+    def _deposit(self, amount: float):
+        self.tokens = min(self.max_tokens, self.tokens + amount)
+
+    def record_request(self):
+        self._deposit(self.ratio)
+
+    def try_spend(self) -> bool:
+        """Take one retry token if there is one"""
+        now = time.monotonic()
+        self._deposit((now - self._updated) * self.min_per_second)
+        self._updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff for the given retry attempt (0-based)"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class LatencyTracker:
+    """Recent call latencies, for picking a hedge delay"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Latency at ``fraction`` (e.g. 0.95) of the window, or None until there are enough samples"""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def hedged(
+    call: Callable[[], Awaitable[Any]],
+    delay: Optional[float],
+    allow_hedge: Callable[[], bool]
+) -> Any:
+    """
+    Run ``call``; if it has not finished after ``delay`` seconds and
+    ``allow_hedge()`` agrees, start a second copy and return whichever
+    succeeds first. The loser is cancelled.
+    """
+    primary = asyncio.ensure_future(call())
+    tasks = {primary}
+    try:
+        if delay is None:
+            return await primary
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done or not allow_hedge():
+            return await primary
+        tasks.add(asyncio.ensure_future(call()))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is None:
+                    return task.result()
+        # Both copies failed; report the primary's error
+        return primary.result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,20 @@
+from datetime import datetime
+import json
+from fastapi.responses import Response
+from models.records import CacheRecord
+
+class PreSerializedJSONResponse(Response):
+    """JSON response with an already-encoded body; FastAPI returns it without re-validating against response_model"""
+    media_type = "application/json"
+
+def cached_food_item_response(name: str, model: str, cached_item: CacheRecord) -> PreSerializedJSONResponse:
+    """FoodItemResponse body for a cache hit, spliced around the entry's pre-serialized fragment"""
+    head = json.dumps({"name": name, "model": model}, ensure_ascii=False, separators=(",", ":"))[:-1]
+    return PreSerializedJSONResponse(b"".join((
+        head.encode("utf-8"),
+        b",",
+        cached_item.response_fragment(),
+        b',"success":true,"timestamp":"',
+        datetime.utcnow().isoformat().encode("ascii"),
+        b'"}'
+    )))
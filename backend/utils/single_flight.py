@@ -0,0 +1,47 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into a single in-flight task"""
+    
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = timeout
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+    
+    def in_flight(self) -> int:
+        """Number of keys with a call currently running"""
+        return len(self._inflight)
+    
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Run ``fn`` for ``key`` unless a call for that key is already running,
+        in which case wait for its result instead.
+        
+        The result or exception of the shared call is delivered to every waiter.
+        A waiter that times out raises ``asyncio.TimeoutError`` without
+        cancelling the shared call for the others.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        
+        if timeout is None:
+            timeout = self.timeout
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+    
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Retrieve the exception so it is not reported as unhandled when every waiter timed out
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Coalesced call for {key} failed: {task.exception()}")
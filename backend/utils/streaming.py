@@ -0,0 +1,110 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+# JSON fields of a streamed reply that are reported as sections, in reply order
+SECTIONS = ("description", "upsell")
+
+# Single-character JSON string escapes
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+class SectionStreamParser:
+    """
+    Splits a streamed JSON-mode reply into description/upsell sections as tokens arrive.
+    
+    Walks the flat JSON object a character at a time, so keys, escapes and
+    ``\\uXXXX`` sequences may be split across tokens; string values of known
+    fields are emitted as they are decoded and everything else is skipped.
+    """
+    
+    def __init__(self):
+        self.section: Optional[str] = None
+        self.sections = {name: "" for name in SECTIONS}
+        self.text = ""
+        self._state = "object"
+        self._key = ""
+        self._escape = ""
+        # High half of a surrogate pair, waiting for the low half
+        self._surrogate: Optional[int] = None
+    
+    def _emit(self, text: str, events: List[Tuple[str, Any]]):
+        if not text or self.section is None:
+            return
+        self.sections[self.section] += text
+        if events and events[-1][0] == "token" and events[-1][1]["section"] == self.section:
+            events[-1][1]["text"] += text
+        else:
+            events.append(("token", {"section": self.section, "text": text}))
+    
+    def _unescape(self, sequence: str) -> str:
+        if sequence[0] != "u":
+            return ESCAPES.get(sequence, sequence)
+        try:
+            code = int(sequence[1:], 16)
+        except ValueError:
+            return ""
+        if 0xD800 <= code <= 0xDBFF:
+            self._surrogate = code
+            return ""
+        if self._surrogate is not None and 0xDC00 <= code <= 0xDFFF:
+            code = 0x10000 + ((self._surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self._surrogate = None
+        return chr(code)
+    
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk of text and return the ``(event, data)`` pairs it completes"""
+        self.text += text
+        events: List[Tuple[str, Any]] = []
+        run = ""
+        for char in text:
+            state = self._state
+            if state == "value":
+                if char == "\\":
+                    self._state = "escape"
+                elif char == '"':
+                    self._emit(run, events)
+                    run = ""
+                    self.section = None
+                    self._state = "object"
+                else:
+                    run += char
+            elif state == "escape":
+                self._escape += char
+                if self._escape[0] != "u" or len(self._escape) == 5:
+                    run += self._unescape(self._escape)
+                    self._escape = ""
+                    self._state = "value"
+            elif state == "object":
+                if char == '"':
+                    self._key = ""
+                    self._state = "key"
+            elif state == "key":
+                # Field names here never contain escapes
+                if char == '"':
+                    self._state = "colon"
+                else:
+                    self._key += char
+            elif state == "colon":
+                if char == '"':
+                    if self._key in self.sections:
+                        self.section = self._key
+                        events.append(("section", {"section": self.section}))
+                    self._state = "value"
+                elif char not in ": \t\r\n":
+                    # Not a string value: skip to the next field
+                    self._state = "skip"
+            elif state == "skip" and char in ",}":
+                self._state = "object"
+        self._emit(run, events)
+        return events
+    
+    def close(self) -> List[Tuple[str, Any]]:
+        """End of the stream; values are emitted as they arrive, so nothing is held back"""
+        return []
+    
+    def result(self) -> Tuple[str, str]:
+        """The assembled (description, upsell)"""
+        return self.sections["description"].strip(), self.sections["upsell"].strip()
+
+def format_sse(event: str, data: Any) -> str:
+    """Encode one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
@@ -0,0 +1,349 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from models.name_index import cache_key, split_key
+from models.persistence import WriteBehindFlusher, atomic_write_json
+from models.sqlite_backend import connect
+from utils.metrics import ROUTING_DECISIONS, UPSTREAM_COST, UPSTREAM_TOKENS
+
+# Aggregate layout: calls, prompt tokens, completion tokens, cost in USD, upstream seconds
+FIELDS = ("calls", "prompt_tokens", "completion_tokens", "cost_usd", "latency_seconds")
+
+# Items beyond USAGE_MAX_ITEMS are aggregated under this key
+OTHER_ITEM = "(other)"
+
+def _add(totals: Dict[Tuple[str, str], List[float]], scope_key: Tuple[str, str], values: Iterable[float]):
+    aggregate = totals.get(scope_key)
+    if aggregate is None:
+        aggregate = totals[scope_key] = [0.0] * len(FIELDS)
+    for i, value in enumerate(values):
+        aggregate[i] += value
+
+def _as_dict(aggregate: List[float]) -> dict:
+    stats = dict(zip(FIELDS, aggregate))
+    stats["calls"] = int(stats["calls"])
+    stats["prompt_tokens"] = int(stats["prompt_tokens"])
+    stats["completion_tokens"] = int(stats["completion_tokens"])
+    stats["cost_usd"] = round(stats["cost_usd"], 6)
+    stats["avg_latency_seconds"] = round(stats["latency_seconds"] / stats["calls"], 4) if stats["calls"] else 0.0
+    stats["latency_seconds"] = round(stats["latency_seconds"], 4)
+    return stats
+
+class UsageTracker:
+    """
+    Upstream token, cost and latency totals per model and per item.
+
+    ``record`` only adds to in-memory aggregates; a write-behind flusher
+    persists them every ``flush_interval`` seconds. Totals go to a JSON file,
+    or, when ``db_path`` is given, are added to a table in the shared SQLite
+    database so every worker's usage lands in one place. The budget window is
+    kept in that database too and synced every ``window_sync_interval``
+    seconds on the flusher's thread, so all workers route on the same spend
+    without a database write on the event loop.
+    """
+
+    def __init__(
+        self,
+        prices: Dict[str, Tuple[float, float]],
+        path: str = "usage_stats.json",
+        db_path: Optional[str] = None,
+        flush_interval: float = 60.0,
+        max_items: int = 10000,
+        window_seconds: float = 86400.0,
+        window_sync_interval: float = 1.0
+    ):
+        # model -> (USD per 1k prompt tokens, USD per 1k completion tokens)
+        self.prices = prices
+        self.path = path
+        self.max_items = max_items
+        self.window_seconds = window_seconds
+        self.window_sync_interval = window_sync_interval
+        self._lock = threading.Lock()
+        # ("model", model) or ("item", cache key) -> aggregate
+        self._totals: Dict[Tuple[str, str], List[float]] = {}
+        # Not yet added to the database; only used with db_path
+        self._pending: Dict[Tuple[str, str], List[float]] = {}
+        # Item keys with an aggregate, so the item count stays under max_items
+        self._items: Set[str] = set()
+        # Spend in the current budget window; with db_path, as of the last sync
+        self._window_start = time.time()
+        self._window_spent = 0.0
+        # Spent here since the last sync; only used with db_path
+        self._window_unsynced = 0.0
+        self._window_synced_at = 0.0
+        self._window_sync_queued = False
+
+        self.conn = None
+        self._db_lock = threading.Lock()
+        if db_path is not None:
+            self.conn = connect(db_path)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                "scope TEXT NOT NULL, key TEXT NOT NULL, calls INTEGER NOT NULL, "
+                "prompt_tokens REAL NOT NULL, completion_tokens REAL NOT NULL, "
+                "cost_usd REAL NOT NULL, latency_seconds REAL NOT NULL, PRIMARY KEY (scope, key))"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage_window ("
+                "id INTEGER PRIMARY KEY CHECK (id = 1), started_at REAL NOT NULL, spent REAL NOT NULL)"
+            )
+            self._items = {row[0] for row in self.conn.execute("SELECT key FROM usage WHERE scope = 'item'")}
+            self._sync_window()
+        else:
+            self._load()
+        self._flusher = WriteBehindFlusher(self._save, interval=flush_interval, max_dirty=1_000_000)
+
+    def _load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                for scope in ("model", "item"):
+                    for key, stats in data.get(scope, {}).items():
+                        _add(self._totals, (scope, key), (stats[field] for field in FIELDS))
+                self._items = set(data.get("item", {}))
+        except Exception as e:
+            print(f"Warning: Could not load usage stats: {e}")
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        prompt_price, completion_price = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+    def record(self, model: str, items: List[str], prompt_tokens: int, completion_tokens: int, latency: float):
+        """Add one upstream call; tokens, cost and latency of a call that served several items are split evenly"""
+        cost = self.cost(model, prompt_tokens, completion_tokens)
+        UPSTREAM_TOKENS.inc(model, "prompt", amount=prompt_tokens)
+        UPSTREAM_TOKENS.inc(model, "completion", amount=completion_tokens)
+        UPSTREAM_COST.inc(model, amount=cost)
+        share = 1 / len(items) if items else 0
+        with self._lock:
+            if self.conn is not None:
+                self._window_unsynced += cost
+            else:
+                now = time.time()
+                if now - self._window_start >= self.window_seconds:
+                    self._window_start = now
+                    self._window_spent = 0.0
+                self._window_spent += cost
+
+            target = self._totals if self.conn is None else self._pending
+            _add(target, ("model", model), (1, prompt_tokens, completion_tokens, cost, latency))
+            for item in items:
+                key = cache_key(item, model)
+                if key not in self._items:
+                    if len(self._items) >= self.max_items:
+                        key = cache_key(OTHER_ITEM, model)
+                    self._items.add(key)
+                _add(target, ("item", key), (1, prompt_tokens * share, completion_tokens * share, cost * share, latency * share))
+        self._flusher.mark_dirty("usage")
+
+    def window_spent(self) -> float:
+        """USD spent in the current budget window, by every worker when the window is in the database"""
+        now = time.time()
+        with self._lock:
+            due = (
+                self.conn is not None and not self._window_sync_queued
+                and now - self._window_synced_at >= self.window_sync_interval
+            )
+            if due:
+                self._window_sync_queued = True
+            if now - self._window_start >= self.window_seconds:
+                spent = self._window_unsynced
+            else:
+                spent = self._window_spent + self._window_unsynced
+        if due and not self._flusher.try_submit(self._queued_window_sync):
+            # Closed or backed up; a later call tries again
+            with self._lock:
+                self._window_sync_queued = False
+        return spent
+
+    def _queued_window_sync(self):
+        try:
+            self._sync_window()
+        except Exception as e:
+            print(f"Warning: Could not sync the budget window: {e}")
+        finally:
+            with self._lock:
+                self._window_sync_queued = False
+
+    def _sync_window(self):
+        """Add this process's unsynced spend to the shared window and read back the total"""
+        with self._lock:
+            unsynced, self._window_unsynced = self._window_unsynced, 0.0
+        now = time.time()
+        with self._db_lock:
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+                row = self.conn.execute("SELECT started_at, spent FROM usage_window WHERE id = 1").fetchone()
+                started_at, spent = row if row is not None else (now, 0.0)
+                if now - started_at >= self.window_seconds:
+                    started_at, spent = now, 0.0
+                spent += unsynced
+                self.conn.execute(
+                    "INSERT INTO usage_window (id, started_at, spent) VALUES (1, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET started_at = excluded.started_at, spent = excluded.spent",
+                    (started_at, spent)
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                with self._lock:
+                    self._window_unsynced += unsynced
+                raise
+        with self._lock:
+            self._window_start, self._window_spent = started_at, spent
+            self._window_synced_at = now
+
+    def _save(self, dirty: Optional[set] = None):
+        if self.conn is None:
+            with self._lock:
+                data = {"model": {}, "item": {}}
+                for (scope, key), aggregate in self._totals.items():
+                    data[scope][key] = dict(zip(FIELDS, aggregate))
+            atomic_write_json(self.path, data)
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        with self._db_lock:
+            self._write_pending(pending)
+        self._sync_window()
+
+    def _write_pending(self, pending: Dict[Tuple[str, str], List[float]]):
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany(
+                "INSERT INTO usage (scope, key, calls, prompt_tokens, completion_tokens, cost_usd, latency_seconds) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (scope, key) DO UPDATE SET "
+                "calls = calls + excluded.calls, prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                "completion_tokens = completion_tokens + excluded.completion_tokens, "
+                "cost_usd = cost_usd + excluded.cost_usd, latency_seconds = latency_seconds + excluded.latency_seconds",
+                [(scope, key, *aggregate) for (scope, key), aggregate in pending.items()]
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            # Put the deltas back so the next flush retries them
+            with self._lock:
+                for scope_key, aggregate in pending.items():
+                    _add(self._pending, scope_key, aggregate)
+            raise
+
+    def _aggregates(self, scope: str) -> Dict[str, List[float]]:
+        """Flushed plus pending totals for one scope"""
+        if self.conn is None:
+            with self._lock:
+                return {key: list(aggregate) for (s, key), aggregate in self._totals.items() if s == scope}
+        self._flusher.flush()
+        with self._db_lock:
+            rows = self.conn.execute(
+                f"SELECT key, {', '.join(FIELDS)} FROM usage WHERE scope = ?", (scope,)
+            ).fetchall()
+        return {row[0]: list(row[1:]) for row in rows}
+
+    def by_model(self) -> Dict[str, dict]:
+        """Totals per model"""
+        return {model: _as_dict(aggregate) for model, aggregate in sorted(self._aggregates("model").items())}
+
+    def by_item(self, model: Optional[str] = None, limit: int = 50) -> List[dict]:
+        """Items with the highest spend, optionally for one model"""
+        items = []
+        for key, aggregate in self._aggregates("item").items():
+            name, item_model = split_key(key)
+            if model is not None and item_model != model:
+                continue
+            items.append({"item": name, "model": item_model, **_as_dict(aggregate)})
+        items.sort(key=lambda stats: stats["cost_usd"], reverse=True)
+        return items[:limit]
+
+    def flush(self):
+        """Write pending totals and, with a database, sync the budget window; blocks, so call it off the event loop"""
+        self._flusher.flush()
+        if self.conn is not None:
+            self._sync_window()
+
+    def close(self):
+        self._flusher.close()
+        if self.conn is not None:
+            with self._db_lock:
+                self.conn.close()
+
+class RoutingPolicy:
+    """
+    Picks the model config that serves a generation when spend or latency run hot.
+
+    Past ``downgrade_at`` of the budget, or while a model's p95 latency is over
+    the SLO, requests go to ``cheap_model``; one in ``probe_every`` still goes
+    to the requested model so its latency window keeps moving. Once the budget
+    is spent, nothing goes upstream and callers serve cached or fallback output.
+    A budget or SLO of 0 disables that check.
+    """
+
+    def __init__(
+        self,
+        budget_usd: float = 0.0,
+        downgrade_at: float = 0.8,
+        latency_slo: float = 0.0,
+        cheap_model: str = "gpt-3.5-turbo",
+        probe_every: int = 20
+    ):
+        self.budget_usd = budget_usd
+        self.downgrade_at = downgrade_at
+        self.latency_slo = latency_slo
+        self.cheap_model = cheap_model
+        self.probe_every = probe_every
+        self._requests = 0
+
+    def over_budget(self, spent: float) -> bool:
+        return self.budget_usd > 0 and spent >= self.budget_usd
+
+    def over_slo(self, p95: Optional[float]) -> bool:
+        return self.latency_slo > 0 and p95 is not None and p95 > self.latency_slo
+
+    def prefers_cache(self, spent: float, p95: Callable[[str], Optional[float]]) -> bool:
+        """Whether an older cached entry beats going upstream right now"""
+        return self.over_budget(spent) or self.over_slo(p95(self.cheap_model))
+
+    def route(self, model: str, spent: float, p95: Callable[[str], Optional[float]]) -> Optional[str]:
+        """Model config to call for a ``model`` request, or None to stay off upstream"""
+        if self.over_budget(spent):
+            ROUTING_DECISIONS.inc(model, "over_budget")
+            return None
+        if model == self.cheap_model:
+            return model
+        if self.budget_usd > 0 and spent >= self.downgrade_at * self.budget_usd:
+            ROUTING_DECISIONS.inc(model, "budget_downgrade")
+            return self.cheap_model
+        if self.over_slo(p95(model)):
+            self._requests += 1
+            if self._requests % self.probe_every == 0:
+                ROUTING_DECISIONS.inc(model, "slo_probe")
+                return model
+            ROUTING_DECISIONS.inc(model, "slo_downgrade")
+            return self.cheap_model
+        return model
+
+def create_usage_tracker(models: Dict[str, dict]) -> UsageTracker:
+    """Usage tracker from the USAGE_* variables, priced from the model configs"""
+    db_path = None
+    if os.getenv("FOOD_ITEMS_BACKEND", "json") == "sqlite":
+        db_path = os.getenv("FOOD_ITEMS_DB", "food_items.db")
+    return UsageTracker(
+        prices={model: (config["prompt_cost_per_1k"], config["completion_cost_per_1k"]) for model, config in models.items()},
+        path=os.getenv("USAGE_FILE", "usage_stats.json"),
+        db_path=db_path,
+        flush_interval=float(os.getenv("USAGE_FLUSH_INTERVAL", "60")),
+        max_items=int(os.getenv("USAGE_MAX_ITEMS", "10000")),
+        window_seconds=float(os.getenv("USAGE_BUDGET_WINDOW_SECONDS", "86400")),
+        window_sync_interval=float(os.getenv("USAGE_WINDOW_SYNC_SECONDS", "1"))
+    )
+
+def create_routing_policy() -> RoutingPolicy:
+    """Routing policy from USAGE_BUDGET_USD and OPENAI_LATENCY_SLO_SECONDS; both off by default"""
+    return RoutingPolicy(
+        budget_usd=float(os.getenv("USAGE_BUDGET_USD", "0")),
+        downgrade_at=float(os.getenv("USAGE_BUDGET_DOWNGRADE_AT", "0.8")),
+        latency_slo=float(os.getenv("OPENAI_LATENCY_SLO_SECONDS", "0")),
+        cheap_model=os.getenv("ROUTING_CHEAP_MODEL", "gpt-3.5-turbo")
+    )